@@ -30,9 +30,17 @@ bl_info = {
 import bpy
 from bpy.props import BoolProperty
 from bpy.props import FloatProperty
+from bpy.props import IntProperty
 from bpy.props import StringProperty
 from bpy.props import EnumProperty
 
+#Adds freshly exported files to an archive, only storing what changed
+def pack_archive(path, files):
+	from .archive import Builder
+	with Builder (bpy.path.abspath (path)) as b:
+		for f in files:
+			b.add_file (f)
+
 #
 #Level Exporter
 #
@@ -47,11 +55,95 @@ class ExportTraum(bpy.types.Operator):
 		name="Verbose",
 		description="Spews debugging info to console",
 		default=True)
+
+	weld: BoolProperty(
+		name="Weld Vertices",
+		description="Writes indexed vertex buffers with shared corners welded together",
+		default=False)
+
+	quantize: BoolProperty(
+		name="Quantize Vertices",
+		description="Stores positions and UVs as 16 bit values relative to the mesh bounds",
+		default=False)
+
+	lods: BoolProperty(
+		name="Generate LODs",
+		description="Simplifies each mesh into a chain of levels of detail",
+		default=False)
+
+	lod_ratios: StringProperty(
+		name="LOD Ratios",
+		description="Triangle ratio of each level of detail, up to four",
+		default="0.5 0.25 0.125")
+
+	vertex_budget: IntProperty(
+		name="Vertex Budget",
+		description="Meshes too big for 16 bit indices are split into parts of at most this many vertices",
+		default=16384,
+		min=1024,
+		max=65536)
+
+	hulls: BoolProperty(
+		name="Convex Collision",
+		description="Objects with a 'collision' property of 'hull' or 'decompose' collide as convex hulls instead of triangles",
+		default=False)
+
+	navmesh: BoolProperty(
+		name="Navigation Mesh",
+		description="Bakes the walkable collision polygons into convex regions linked by portals",
+		default=False)
+
+	nav_slope: FloatProperty(
+		name="Max Slope",
+		description="Steepest slope in degrees the navigation mesh counts as walkable",
+		default=45.0,
+		min=0.0,
+		max=89.0)
+
+	binary_entities: BoolProperty(
+		name="Binary Entities",
+		description="Writes entities as a binary table with interned strings instead of text",
+		default=False)
+
+	profile: BoolProperty(
+		name="Write Profile",
+		description="Writes per-stage timings and peak memory to a .trace.json next to the output",
+		default=False)
+
+	memory_limit: IntProperty(
+		name="Memory Ceiling",
+		description="Stops the export once it uses more than this many MiB, 0 for no ceiling",
+		default=0,
+		min=0)
+
+	layout: EnumProperty(
+		name="Layout",
+		description="How the sections are laid out in the file",
+		items=(('PACKED', "Packed", "Smallest, the engine copies everything into place"),
+			('ALIGNED', "Aligned", "Arrays on 16 byte boundaries, loaded in place with pointer fixups"),
+			('PAGE', "Page Aligned", "Arrays on 4 KiB boundaries, for mapping straight into memory")),
+		default='PACKED')
+
+	compression: EnumProperty(
+		name="Compression",
+		description="Wraps the file up in independently compressed chunks",
+		items=(('NONE', "None", "Write the file as is"),
+			('ZLIB', "Zlib", "Fast to inflate"),
+			('LZMA', "LZMA", "Smallest, slower to inflate")),
+		default='NONE')
+
+	archive: StringProperty(
+		name="Archive",
+		description="Also adds the exported files to this archive",
+		subtype='FILE_PATH',
+		default="")
 		
 	def execute(self, context):
 		from . import texport
 		imp = texport.Export (self, context)
 		imp.main ()
+		if self.archive:
+			pack_archive (self.archive, imp.written)
 		return {'FINISHED'}
 
 	def invoke(self, context, event):
@@ -92,10 +184,96 @@ class ExportTraumModel(bpy.types.Operator):
 		min=2.0, max=60.0,
 		default=30.0,
 	)
+
+	block_frames: IntProperty(
+		name="Frames per Block",
+		description="Groups the clip into blocks of this many frames that each decode on their own, so playback can seek and stream, 0 for one run",
+		default=0,
+		min=0,
+		max=65535)
+
+	direct_sampling: BoolProperty(
+		name="Sample F-curves Directly",
+		description="Evaluates the action on its own instead of stepping the scene, unless constraints, drivers or NLA tracks move the bones",
+		default=True)
+
+	quantize: BoolProperty(
+		name="Quantize Vertices",
+		description="Stores points, normals and UVs as compact 8/16 bit values",
+		default=False)
+
+	normal_bits: EnumProperty(
+		name="Normal Precision",
+		description="Bits per component of quantized octahedral normals",
+		items=(('8', "8 bit", "2x8 bit octahedral normals"),
+			('16', "16 bit", "2x16 bit octahedral normals")),
+		default='16')
+
+	max_weights: EnumProperty(
+		name="Weights per Vertex",
+		description="Keeps the heaviest weights of each vertex and renormalises them",
+		items=(('2', "2", "Two bones per vertex"),
+			('4', "4", "Four bones per vertex")),
+		default='2')
+
+	palette_size: IntProperty(
+		name="Bone Palette",
+		description="Splits meshes so no part uses more bones than this, 0 for no limit",
+		default=0,
+		min=0,
+		max=1024)
+
+	vertex_budget: IntProperty(
+		name="Vertex Budget",
+		description="Meshes too big for 16 bit indices are split into parts of at most this many vertices",
+		default=16384,
+		min=1024,
+		max=65536)
+
+	skeleton_arrays: BoolProperty(
+		name="Skeleton Arrays",
+		description="Orders bones breadth first and writes the skeleton as separate position, rotation and parent arrays",
+		default=False)
+
+	shared_buffers: BoolProperty(
+		name="Shared Buffers",
+		description="Packs all child meshes into one pool of vertices and indices with a range per mesh",
+		default=False)
+
+	lods: BoolProperty(
+		name="Generate LODs",
+		description="Simplifies each mesh into a chain of levels of detail",
+		default=False)
+
+	lod_ratios: StringProperty(
+		name="LOD Ratios",
+		description="Triangle ratio of each level of detail, up to four",
+		default="0.5 0.25 0.125")
+
+	profile: BoolProperty(
+		name="Write Profile",
+		description="Writes per-stage timings and peak memory to a .trace.json next to the output",
+		default=False)
+
+	compression: EnumProperty(
+		name="Compression",
+		description="Wraps the file up in independently compressed chunks",
+		items=(('NONE', "None", "Write the file as is"),
+			('ZLIB', "Zlib", "Fast to inflate"),
+			('LZMA', "LZMA", "Smallest, slower to inflate")),
+		default='NONE')
+
+	archive: StringProperty(
+		name="Archive",
+		description="Also adds the exported files to this archive",
+		subtype='FILE_PATH',
+		default="")
 	def execute(self, context):
 		from . import aexport
 		imp = aexport.Export (self, context)
 		imp.main ()
+		if self.archive:
+			pack_archive (self.archive, imp.written)
 		return {'FINISHED'}
 
 	def invoke(self, context, event):
@@ -105,17 +283,75 @@ class ExportTraumModel(bpy.types.Operator):
 def menu_func_model(self, context):
 	self.layout.operator(ExportTraumModel.bl_idname, text="Traum Model (.tm/.ta)")
 	
+#
+#Live link
+#
+class LiveLinkTraum(bpy.types.Operator):
+	bl_idname = "scene.traum_live_link"
+	bl_label = "Traum Live Link"
+	bl_description = "Starts or stops sending changes to a running engine"
+
+	address: StringProperty(
+		name="Address",
+		description="host:port the engine listens on, or the path of a Unix socket",
+		default="localhost:7878")
+
+	verbose: BoolProperty(
+		name="Verbose",
+		description="Spews debugging info to console",
+		default=False)
+
+	weld: BoolProperty(
+		name="Weld Vertices",
+		description="Sends indexed vertex buffers with shared corners welded together",
+		default=False)
+
+	quantize: BoolProperty(
+		name="Quantize Vertices",
+		description="Sends positions and UVs as 16 bit values relative to the mesh bounds",
+		default=False)
+
+	def execute(self, context):
+		from .link import session
+		if session.active is not None:
+			session.stop ()
+			self.report ({'INFO'}, "Live link stopped")
+			return {'FINISHED'}
+		try:
+			session.start (session.Settings (self), self.address, context)
+		except OSError as e:
+			self.report ({'ERROR'}, "Could not reach {0}: {1}".format (self.address, e))
+			return {'CANCELLED'}
+		self.report ({'INFO'}, "Live link to {0}".format (self.address))
+		return {'FINISHED'}
+
+	def invoke(self, context, event):
+		from .link import session
+		#A running session is simply stopped
+		if session.active is not None:
+			return self.execute (context)
+		return context.window_manager.invoke_props_dialog(self)
+
+def menu_func_live(self, context):
+	self.layout.operator(LiveLinkTraum.bl_idname, text="Traum Live Link")
+	
 def register():
 	bpy.utils.register_class(ExportTraum)
 	bpy.utils.register_class(ExportTraumModel)
+	bpy.utils.register_class(LiveLinkTraum)
 	bpy.types.TOPBAR_MT_file_export.append(menu_func_level)
 	bpy.types.TOPBAR_MT_file_export.append(menu_func_model)
+	bpy.types.TOPBAR_MT_file_export.append(menu_func_live)
 
 def unregister():
+	from .link import session
+	session.stop ()
 	bpy.utils.unregister_class(ExportTraum)
 	bpy.utils.unregister_class(ExportTraumModel)
+	bpy.utils.unregister_class(LiveLinkTraum)
 	bpy.types.TOPBAR_MT_file_export.remove(menu_func_level)
 	bpy.types.TOPBAR_MT_file_export.remove(menu_func_model)
+	bpy.types.TOPBAR_MT_file_export.remove(menu_func_live)
 
 if __name__ == "__main__":
 	register()
@@ -21,17 +21,181 @@ import os
 import bpy
 from mathutils import *
 from struct import pack
+from . import quant
+from . import lod
+from . import instrument
+from . import container
+from . import skin
+from . import snapshot
+from . import sampler
+from . import partition
+from . import skeleton
 import math
+import numpy as np
+
+#File versions. The flagged version carries a bitfield after the version
+#describing which optional layouts the file uses
+MODEL_VERSION = 0x20200429
+ANIM_VERSION = 0x20200430
+VERSION_FLAGS = 0x20261019
+
+#Points and vertices are quantised to 16 bits
+MODEL_QUANTIZED = 1<<0
+#Quantised normals use 2x16 bits rather than 2x8
+MODEL_OCT16 = 1<<1
+#A LOD chunk follows the meshes
+MODEL_LODS = 1<<2
+#Vertices carry four bone indices rather than two
+MODEL_SKIN4 = 1<<3
+#Each mesh is followed by its local to global bone table
+MODEL_PALETTES = 1<<4
+#Meshes share one pool of points, vertices and indices, see pack_shared
+MODEL_SHARED = 1<<5
+#Bones are breadth first and the skeleton is a set of arrays, see skeleton.py
+MODEL_SKELETON = 1<<6
+
+#Frames are grouped into blocks that each start with a full keyframe
+ANIM_BLOCKS = 1<<0
 
 class Export:
 	def __init__ (self, config, context):
 		self.cfg = config
 		self.ctx = context
+		self.prof = instrument.Profiler (config.profile)
+		#Everything written, for packing into an archive afterwards
+		self.written = []
 		
-	def trace (self, text):
+	def trace (self, text, *args):
+		#Only pay for formatting when someone is listening
 		if self.cfg.verbose is True:
-			print (text)
+			print (text.format (*args) if args else text)
+
+	#Joins the sections of a file, wrapping them up in compressed chunks
+	#if asked to
+	def compress (self, sections):
+		codec = container.CODECS[self.cfg.compression]
+		if container.STORE == codec:
+			return bytes ().join (s[1] for s in sections)
+		self.prof.begin ('compress')
+		bin, stats = container.pack_container (sections[0][1][0:4], sections, codec,
+			measure = self.cfg.profile)
+		self.trace (container.report (stats))
+		self.prof.end ()
+		return bin
+
+	def pack_indices (self, strips, tris):
+		tstrips = bytes ()
+		for s in strips:
+			strip = pack ('<I', len (s))
+			for ndx in s:
+				strip += pack ('<H', ndx[0])
+			tstrips += strip
+		
+		islands = bytes ()
+		for ndx in tris:
+			islands += pack ('<H', ndx[0])
+		return tstrips + islands
+
+	#Shared layout: totals, then a record per mesh saying where its share
+	#of each pool starts, then the pools. Vertex starts and indices stay
+	#local to the mesh, the engine adds the base vertex and first point.
+	#Strip lengths live apart from the indices so the index pool can be
+	#uploaded as it is
+	def pack_shared (self, name, blocks, distal, bits, report):
+		first = [0, 0, 0, 0, 0]
+		records = []
+		for _, material, palette, points, verts, strips, islands, _ in blocks:
+			counts = (len (points), len (verts), sum (len (s) for s in strips) + len (islands), len (strips),
+				len (palette) if palette is not None else 0)
+			records.append ((material, first[0], counts[0], first[1], counts[1], first[2], counts[2],
+				first[3], counts[3], len (islands), first[4], counts[4]))
+			first = [f + c for f, c in zip (first, counts)]
+
+		#Concatenate everything in one pass
+		points = [p for b in blocks for p in b[3]]
+		verts = [v for b in blocks for v in b[4]]
+		indices = np.array ([ndx[0] for b in blocks for s in (*b[5], b[6]) for ndx in s], dtype='<u2')
+		lengths = np.array ([len (s) for b in blocks for s in b[5]], dtype='<u4')
+		palette = np.array ([i for b in blocks if b[2] is not None for i in b[2]], dtype='<u2')
+
+		if self.cfg.quantize:
+			pdata, perr = quant.pack_model_points (points, distal)
+			vdata, nerr, uverr = quant.pack_model_verts (
+				[v[0] for v in verts],
+				[v[1] for v in verts],
+				[v[2] for v in verts],
+				bits)
+			report.add (name, pos = perr, normal = nerr, uv = uverr)
+		else:
+			width = len (verts[0][2]) if verts else 4
+			pdata = np.asarray (points, dtype='<f4').tobytes ()
+			vd = np.zeros (len (verts), dtype=[('normal', '<f4', 4), ('uv', '<f4', 2), ('info', '<u2', width)])
+			vd['normal'][:, 0:3] = [v[0] for v in verts]
+			vd['uv'] = [v[1] for v in verts]
+			vd['info'] = [v[2] for v in verts]
+			vdata = vd.tobytes ()
+
+		def padded (a):
+			return a.tobytes () + bytes (-a.nbytes%4)
 
+		head = pack ('<5I', *first)
+		table = np.array (records, dtype='<u4').reshape (-1, 12)
+		return head + table.tobytes () + pdata + vdata + padded (indices) + lengths.tobytes () + padded (palette)
+
+	def write_lods (self, name, vpos, vweights, faces, ratios):
+		from . import graph
+		
+		#Bone weights are spread out over the bones this mesh uses so that
+		#collapses between differently skinned vertices are penalised
+		used = sorted ({b for w in vweights for b in w})
+		col = {b: i for i, b in enumerate (used)}
+		attrs = [len (used)*[0.0] for w in vweights]
+		for a, w in zip (attrs, vweights):
+			for b, weight in w.items ():
+				a[col[b]] = weight
+		
+		#Size the bounding sphere for switching
+		centre = [sum (p[k] for p in vpos)/max (len (vpos), 1) for k in range (3)]
+		radius = 0.0
+		for p in vpos:
+			radius = max (radius, math.sqrt (sum ((p[k] - centre[k])**2 for k in range (3))))
+		
+		chain = lod.build_chain (vpos, faces, ratios, attrs, radius)
+		self.trace (lod.report (name, len (faces)//3, chain))
+		
+		#Each level of detail is stripified just like the full mesh
+		data = pack ('<I', len (chain))
+		for l in chain:
+			meshifier = graph.Meshifier ()
+			meshifier.log = self.trace
+			for t in l.tris:
+				meshifier.add_polygon ([int (i) for i in t])
+			strips, tris = meshifier.build ()
+			data += pack ('<3f2I', l.ratio, l.error, l.screen, len (strips), len (tris))
+			data += self.pack_indices (strips, tris)
+		return data
+	
+	#Cuts up parts whose vertices or points would overflow 16 bit indices.
+	#verts are (normal, uv, point) and every point has its weight count
+	#of bone space copies
+	def fit_indices (self, name, parts, verts, co, wcounts):
+		out = []
+		for palette, ptris in parts:
+			used = {i for t in ptris for i in t}
+			npoints = sum (int (wcounts[verts[i][2]]) for i in used)
+			if not partition.oversized (len (used), 0, npoints):
+				out.append ((palette, ptris))
+				continue
+			pos = np.array ([co[v[2]] for v in verts])
+			cost = np.array ([int (wcounts[v[2]]) for v in verts])
+			clusters = partition.clusters (pos, ptris, self.cfg.vertex_budget,
+				None, cost, partition.INDEX_LIMIT)
+			self.trace ('{0}: {1} vertices and {2} points, split into {3} parts', name,
+				len (used), npoints, len (clusters))
+			for c in clusters:
+				out.append ((palette, [ptris[i] for i in c.tolist ()]))
+		return out
+	
 	def write_mesh (self, armature, bonestate):
 		scene = self.ctx.scene
 		pref = os.path.splitext (self.cfg.filepath)[0]
@@ -51,25 +215,37 @@ class Export:
 		#Ensure that there is work to do
 		if 0 == len (children):
 			return
+		
+		if self.cfg.lods:
+			ratios = lod.parse_ratios (self.cfg.lod_ratios)
+		
+		#A triangle can touch three times as many bones as a vertex
+		nweights = int (self.cfg.max_weights)
+		palette_size = self.cfg.palette_size
+		if 0 < palette_size < 3*nweights:
+			self.trace ('Bone palettes must hold at least {0} bones!', 3*nweights)
+			return
 			
 		#Process materials
 		materials = bytes ()
 		nmaterials = 0
 		mat2index = {}
 		for o in children:
-			#Create a temporary mesh
-			mesh = o.to_mesh ()
-			if not mesh:
-				self.trace ("{0} did not produce a mesh".format (o.name).encode ('utf-8'))
+			#Evaluate the mesh once; the snapshot is used again below
+			self.prof.begin ('evaluate', object = o.name)
+			mesh = self.meshes.get (o, groups = True, original = True)
+			self.prof.end ()
+			if mesh is None:
+				self.trace ("{0} did not produce a mesh", o.name)
 				continue
 
 			#Ensure mesh has a material
 			if len (mesh.materials) != 1:
-				self.trace ('{0} has no materials!'.format (o.name).encode ('utf-8'))
+				self.trace ('{0} has no materials!', o.name)
 				return
 			
 			#Blender adds a user count to material name, so we have to strip it
-			parts = mesh.materials[0].name.split ('.')
+			parts = mesh.materials[0].split ('.')
 			key = parts[0]
 			
 			#Material names are unique
@@ -79,38 +255,41 @@ class Export:
 				
 				mat2index[key] = nmaterials;
 				nmaterials += 1
-
-			#Done with the mesh data
-			o.to_mesh_clear ()
 			
-		#Digest each child into a nice binary form
-		meshes = bytes ()
+		#Digest each child into a nice binary form. Points and vertices are
+		#packed only once every child has been seen, since quantisation
+		#needs the final distal radius
+		blocks = []
 		nmeshes = 0
 		distal = 0.0
 		for o in children:
-			#Create a temporary mesh
-			mesh = o.to_mesh ()
-			if not mesh:
-				self.trace ("{0} did not produce a mesh".format (o.name).encode ('utf-8'))
+			mesh = self.meshes.get (o, groups = True, original = True)
+			if mesh is None:
 				continue
 			
+			#Ensure the geometry has been triangulated
+			bad = np.nonzero (mesh.loop_total != 3)[0]
+			if len (bad):
+				#Degenerate
+				if mesh.loop_total[bad[0]] < 3:
+					self.trace ('{0} has degenerate face!', o.name)
+					return
+				#More than 3
+				self.trace ('{0} must have 3 vertices!', o.name)
+				return
+			
+			#Plain lists index far quicker than arrays one item at a time
+			co = mesh.co.tolist ()
+			normals = mesh.normals.tolist ()
+			corners = mesh.loops[mesh.triangles ()].tolist ()
+			uvs = [tuple (uv) for uv in mesh.uvs[mesh.triangles ()].reshape (-1, 2).tolist ()]
+			uvs = [uvs[3*p:3*p + 3] for p in range (len (mesh))]
+			
 			self.trace ("Gathering UVs...")
 			uv_tbl = {}
-			for p in mesh.polygons:
-				#Ensure the geometry has been triangulated
-				if p.loop_total != 3:
-					#Degenerate
-					if p.loop_total < 3:
-						self.trace ('{0} has degenerate face!'.format (o.name))
-						return
-					#More than 3
-					self.trace ('{0} must have 3 vertices!'.format (o.name))
-					return
-				
+			for pts, puvs in zip (corners, uvs):
 				#Save off each UV into a list per each vertex
-				for i in range (p.loop_start, p.loop_start + p.loop_total):
-					ndx = mesh.loops[i].vertex_index
-					uv = mesh.uv_layers.active.data[i].uv
+				for ndx, uv in zip (pts, puvs):
 					if ndx in uv_tbl:
 						if uv not in uv_tbl[ndx]:
 							uv_tbl[ndx].append (uv)
@@ -118,125 +297,203 @@ class Export:
 						uv_tbl[ndx] = [uv]
 			
 			self.trace ("Generating vertices...")
-			material = mat2index[mesh.materials[0].name.split ('.')[0]]
-			npoints = 0
-			points = bytes ()
-			nverts = 0
-			verts = bytes ()
-			uv2index = {}
-			for v in mesh.vertices:
-				#Ensure that weight limit is not exceeded
-				if len(v.groups) > 2:
-					self.trace ("Limit of two weights per vertex exceeded")
-					return
-				
-				#Ensure the weight is normalised
-				sum = 0.0
-				for g in v.groups:
-					sum += g.weight
-				
-				if math.fabs (1.0 - sum) >= 1e-4:
-					self.trace("Normalise your weights!");
-					return
-				
-				#Bring the point into the bone spaces
-				start = npoints
-				for g in v.groups:
-					import mathutils
-					
-					bone = armature.data.bones[o.vertex_groups[g.group].name]
+			material = mat2index[mesh.materials[0].split ('.')[0]]
+			
+			#Prune every vertex down to the weight budget in one go, rather
+			#than asking for the weights to be cleaned up by hand
+			vgroups = []
+			for groups in mesh.groups:
+				vgroups.append ([(bone2index[o.vertex_groups[g].name], w) for g, w in groups])
+			wbones, wvalues, wcounts, dropped = skin.limit (vgroups, nweights)
+			if dropped:
+				self.trace ('{0}: dropped {1} weight(s) over the limit of {2}', o.name, dropped, nweights)
+			if not wcounts.all ():
+				self.trace ('{0} has vertices without weights!', o.name)
+				return
+			
+			#Bring each point into the spaces of its bones
+			import mathutils
+			vpoints = []
+			for v in range (len (co)):
+				pts = []
+				for k in range (wcounts[v]):
+					bone = armature.data.bones[bonestate.list[wbones[v, k]].name]
 					pos = bone.matrix_local.translation
 					rot = bone.matrix
-					delta = mathutils.Vector(v.co) - mathutils.Vector (pos)
+					delta = mathutils.Vector(co[v]) - mathutils.Vector (pos)
 					xyz = rot.inverted () @ delta
-					
-					points += pack ('<4f', xyz[0], xyz[1], xyz[2], g.weight)
-					npoints += 1
+					pts.append ((xyz[0], xyz[1], xyz[2], float (wvalues[v, k])))
 					
 					#Determine the most distal point
 					dist = xyz.length
 					if dist >= distal:
 						distal = dist
-					
-				#Gather common vertex data
-				n = v.normal
-				count = npoints - start
-				if 2 == len (v.groups):
-					b0 = bone2index[o.vertex_groups[v.groups[0].group].name]
-					b1 = bone2index[o.vertex_groups[v.groups[1].group].name]
-				else:
-					b0 = bone2index[o.vertex_groups[v.groups[0].group].name]
-					b1 = b0
-				
-				#Generate the vertices derived from this point
-				for uv in uv_tbl[v.index]:
-					verts += pack ('<4f2f4H',\
-								n[0], n[1], n[2], 0,\
-								uv[0], uv[1],\
-								start, count,\
-								b0, b1)
-					key = (uv.copy ().freeze (), v.index)
-					uv2index[key] = nverts
-					nverts += 1
+				vpoints.append (pts)
 			
-			self.trace ("Generating indices...")
-			from . import graph
-			meshifier = graph.Meshifier ()
-			for p in mesh.polygons:
-				pts = []
-				ids = []	
-				for i in range (p.loop_start, p.loop_start + p.loop_total):
-					uv = mesh.uv_layers.active.data[i].uv.copy ().freeze ()
-					index = mesh.loops[i].vertex_index
-					pts.append (index)
-					ids.append (uv2index[(uv, index)])
-				
-				#Add the polygon into the adjacency graph
-				meshifier.add_polygon (ids)
-			
-			#Decompose the model into strips and triangles
-			strips, tris = meshifier.build ()
+			#Generate the vertices derived from each point
+			verts = []
+			uv2index = {}
+			for v, n in enumerate (normals):
+				for uv in uv_tbl[v]:
+					uv2index[(uv, v)] = len (verts)
+					verts.append (((n[0], n[1], n[2]), uv, v))
 			
-			#Package up the indices
-			tstrips = bytes ()
-			ntstrips = len (strips)
-			for s in strips:
-				strip = pack ('<I', len (s))
-				print ('strip')
-				for ndx in s:
-					print (ndx)
-					strip += pack ('<H', ndx[0])
-				tstrips += strip
+			self.trace ("Generating indices...")
+			tris = []
+			for pts, puvs in zip (corners, uvs):
+				tris.append ([uv2index[(uv, ndx)] for ndx, uv in zip (pts, puvs)])
 			
-			islands = bytes ()
-			nislands = len (tris)
-			for ndx in tris:
-				islands += pack ('<H', ndx[0])
+			#Split the mesh up so no part uses more bones than fit in a
+			#palette. Without a limit the single part indexes bones globally
+			if palette_size:
+				used = [wbones[v[2], 0:wcounts[v[2]]] for v in verts]
+				try:
+					parts = skin.split (tris, used, palette_size)
+				except ValueError as e:
+					self.trace ('{0}: {1}', o.name, e)
+					return
+				self.trace ('{0}: {1} palette(s) of up to {2} bones', o.name, len (parts), palette_size)
+			else:
+				parts = [(None, tris)]
+			parts = self.fit_indices (o.name, parts, verts, co, wcounts)
 			
-			#Package everything together
-			meshes += pack ('<5I', material, npoints, nverts, ntstrips, nislands)
-			meshes += points + verts + tstrips + islands
-			nmeshes += 1
+			for palette, ptris in parts:
+				#Number the vertices of this part, keeping their order
+				local = sorted ({i for t in ptris for i in t})
+				local = {v: i for i, v in enumerate (local)}
+				remap = None
+				if palette is not None:
+					remap = {b: i for i, b in enumerate (palette)}
+				
+				#Points are shared by every vertex split off the same point
+				points = []
+				starts = {}
+				pverts = []
+				vpos = []
+				vweights = []
+				for i in local:
+					n, uv, src = verts[i]
+					if src not in starts:
+						starts[src] = len (points)
+						points += vpoints[src]
+					count = int (wcounts[src])
+					ids = [int (b) for b in wbones[src]]
+					if remap is not None:
+						ids = [remap[b] for b in ids]
+					pverts.append ((n, uv, (starts[src], count) + tuple (ids)))
+					
+					#Remember enough to simplify the mesh later on
+					vpos.append (tuple (co[src]))
+					vweights.append ({int (wbones[src, k]): float (wvalues[src, k]) for k in range (count)})
+				
+				from . import graph
+				meshifier = graph.Meshifier ()
+				meshifier.log = self.trace
+				faces = []
+				for t in ptris:
+					ids = [local[i] for i in t]
+					
+					#Add the polygon into the adjacency graph
+					meshifier.add_polygon (ids)
+					faces += ids
+				
+				#Decompose the model into strips and triangles
+				self.prof.begin ('meshifier', object = o.name, polygons = len (ptris))
+				strips, islands = meshifier.build ()
+				self.prof.end ()
+				
+				#Simplify the mesh into a LOD chain
+				lods = bytes ()
+				if self.cfg.lods:
+					self.prof.begin ('lods', object = o.name)
+					lods = self.write_lods (o.name, vpos, vweights, faces, ratios)
+					self.prof.end ()
+				
+				blocks.append ((o.name, material, palette, points, pverts, strips, islands, lods))
+				nmeshes += 1
+				
+				self.trace ('material: {0}', material)
+				self.trace ('points: {0}', len (points))
+				self.trace ('verts: {0}', len (pverts))
+		self.trace (self.meshes.report ())
+		
+		#Pack up points and vertices
+		self.prof.begin ('pack')
+		meshes = bytes ()
+		lods = bytes ().join (b[7] for b in blocks)
+		report = quant.Report ()
+		bits = int (self.cfg.normal_bits)
+		if self.cfg.shared_buffers:
+			meshes = self.pack_shared (armature.name, blocks, distal, bits, report)
+			blocks = []
+		for name, material, palette, points, verts, strips, islands, chain in blocks:
+			#Write the local to global bone table
+			table = bytes ()
+			if palette is not None:
+				table = pack ('<I', len (palette))
+				for b in palette:
+					table += pack ('<H', b)
+				if len (palette)%2:
+					table += pack ('<H', 0)
+			head = pack ('<5I', material, len (points), len (verts), len (strips), len (islands))
 			
-			self.trace ('material: {0}'.format (material))
-			self.trace ('points: {0}'.format (npoints))
-			self.trace ('verts: {0}'.format (nverts))
-
-			#Done with the mesh data
-			o.to_mesh_clear ()
+			if self.cfg.quantize:
+				pdata, perr = quant.pack_model_points (points, distal)
+				vdata, nerr, uverr = quant.pack_model_verts (
+					[v[0] for v in verts],
+					[v[1] for v in verts],
+					[v[2] for v in verts],
+					bits)
+				report.add (name, pos = perr, normal = nerr, uv = uverr)
+			else:
+				pdata = bytes ()
+				for p in points:
+					pdata += pack ('<4f', *p)
+				vdata = bytes ()
+				for n, uv, info in verts:
+					vdata += pack ('<4f2f{0}H'.format (len (info)), n[0], n[1], n[2], 0, uv[0], uv[1], *info)
+			meshes += head + table + pdata + vdata + self.pack_indices (strips, islands)
+		self.prof.end ()
 		
 		#Assemble the file
-		VERSION = 0x20200429
+		flags = 0
+		if self.cfg.quantize:
+			flags |= MODEL_QUANTIZED
+			if 16 == bits:
+				flags |= MODEL_OCT16
+			self.trace (report.report ())
+		if 4 == nweights:
+			flags |= MODEL_SKIN4
+		if palette_size:
+			flags |= MODEL_PALETTES
+		if self.cfg.shared_buffers:
+			flags |= MODEL_SHARED
+		if self.cfg.skeleton_arrays:
+			flags |= MODEL_SKELETON
+		if self.cfg.lods:
+			flags |= MODEL_LODS
+			lods = pack ('<2I', lod.LOD_VERSION, nmeshes) + lods
+		else:
+			lods = bytes ()
+		
 		header = 'RDKT'.encode ('utf-8')
-		header += pack ('<3If2I', VERSION, animset, nbones, distal, nmaterials, nmeshes)
-		bin = header + bones + materials + meshes
+		if 0 == flags:
+			header += pack ('<I', MODEL_VERSION)
+		else:
+			header += pack ('<2I', VERSION_FLAGS, flags)
+		header += pack ('<2If2I', animset, nbones, distal, nmaterials, nmeshes)
+		sections = [('HEAD', header), ('BONE', bones), ('MATL', materials), ('MESH', meshes), ('LODS', lods)]
+		bin = self.compress (sections)
 		
 		#Dump everything to disk
+		self.prof.begin ('write', bytes = len (bin))
 		bin_path = bpy.path.ensure_ext (pref, '.tm')
 		with open (bin_path, 'wb') as f:
 			f.write (bin)
+		self.written.append (bin_path)
+		self.prof.end ()
 		
-		self.trace ('distal: {0}'.format (distal))
+		self.trace ('distal: {0}', distal)
 		self.trace ("Mesh Done!!!")
 		return 0
 		
@@ -258,47 +515,64 @@ class Export:
 		
 		#Iterate through the frames, saving off the pose for each one
 		self.trace ('Gathering frame data...')
+		self.prof.begin ('sample')
 		trans = []
 		frames = []
 		
+		#Work out the sample times up front, in scene frames
+		times = []
 		i = scene.frame_start
 		time = scene.frame_start
-		num = 0
-		
 		#for i in range (scene.frame_start, scene.frame_end):
 		while i < scene.frame_end: 
-			#Set the frame
 			i = math.floor (time)
-			scene.frame_set (i, subframe=time - i)
+			times.append (time)
+			time += rate
+		
+		#Read the action straight off its curves when nothing else moves
+		#the bones, otherwise step the scene. Channels follow the model's
+		#bone order, which need not be the order Blender keeps them in
+		bones = bonestate.list
+		reason = sampler.blocker (armature) if self.cfg.direct_sampling else 'disabled'
+		if reason is None:
+			self.trace ('Sampling F-curves directly')
+			angles, locations = sampler.sample (armature, times, bones)
+			frames = angles.tolist ()
+			trans = locations[:, 0].tolist ()
+		else:
+			self.trace ('Sampling by stepping the scene ({0})', reason)
+			for num, time in enumerate (times):
+				#Set the frame
+				i = math.floor (time)
+				scene.frame_set (i, subframe=time - i)
 
-			#Sample the elements
-			frame = []
-			bones= armature.pose.bones
-			self.trace ('Frame {0} {1}'.format (num, time))
-			for b in bones:
-				angles = b.matrix_basis.to_euler ()
-				frame.append (angles)
-				self.trace ('\t{0} - {1}'.format (b.name, angles))
-			frames.append (frame)
+				#Sample the elements
+				frame = []
+				self.trace ('Frame {0} {1}', num, time)
+				for b in bones:
+					angles = b.matrix_basis.to_euler ()
+					frame.append (angles)
+					self.trace ('\t{0} - {1}', b.name, angles)
+				frames.append (frame)
 			
-			#Sample the translation
-			root = bones[0]
-			origin = root.matrix_basis.translation
-			trans.append (origin)
-			self.trace ('\torigin: {0}'.format (origin))
+				#Sample the translation
+				root = bones[0]
+				origin = root.matrix_basis.translation
+				trans.append (origin)
+				self.trace ('\torigin: {0}', origin)
 			
-			#Bump the time
-			time += rate
-			num += 1
+			#Restore old frame
+			scene.frame_set (oldframe)
 		
 		#Cache this for later
 		nframes = len (frames)
 		
-		#Restore old frame
-		scene.frame_set (oldframe)
+		self.prof.end ()
+		self.prof.count ('frames', frames = nframes)
 			
 		#Analyse the frames for compression opportunities
 		self.trace ('Analysing frame data...')
+		self.prof.begin ('analyse')
 		codes = nbones*[0]
 		for i in range (nbones):
 			codes[i] = 0
@@ -323,23 +597,32 @@ class Export:
 					flags += symbs[j]
 			if '' == flags:
 				flags = '(elided)'
-			self.trace ('\t{0} - {1}'.format (bones[i].name, flags))
+			self.trace ('\t{0} - {1}', bones[i].name, flags)
 		
-		#Compose the binary data
+		#Compose the binary data. Keyframes hold every bone, the rest only the
+		#animated ones. A blocked clip starts every block with a keyframe so
+		#each block decodes on its own; elided bones always repeat their
+		#value from the first frame, so any keyframe agrees with the first
+		block = self.cfg.block_frames
 		framedata = bytes ()
+		offsets = []
 		for i in range (nframes):
+			key = 0 == i%block if block else 0 == i
+			if block and key:
+				offsets.append (len (framedata))
 			frame = frames[i]
 			f = pack ('<f', trans[i][2])
 			for j in range (nbones):
 				#For now we just do all or nothing elision
-				if 0 != i and 0 == codes[j]:
+				if not key and 0 == codes[j]:
 					continue
 				
 				#Write out the angles
 				angles = 0
+				src = frame[j] if codes[j] else frames[0][j]
 				for k in range (3):
 					#Canonise the angles to 0 ~ 1023 (10 bits per axis)
-					x = 512.0*frame[j][k]/math.pi
+					x = 512.0*src[k]/math.pi
 					while x >= 1024: x -= 1024	
 					while x < 0: x += 1024
 					
@@ -351,6 +634,7 @@ class Export:
 			
 			#Append the frame to the binary data
 			framedata += f
+		self.prof.end ()
 			
 		#Package up the codes too
 		codedata = bytes ()
@@ -368,7 +652,7 @@ class Export:
 			
 			#Clamp to 4 bytes so they can be used as 32 bit values
 			if len (m.name) > 4:
-				print ('WARNING: Truncating {0}...'.format (m.name))
+				self.trace ('WARNING: Truncating {0}...', m.name)
 			event = m.name.upper ()[:4].encode ('ascii')
 			
 			eventlist.append ((frame, event))
@@ -380,24 +664,36 @@ class Export:
 		#Create the binary data
 		events = bytes ()
 		for e in eventlist:
-			self.trace ('\t{0} - {1}'.format (e[0], e[1]))
+			self.trace ('\t{0} - {1}', e[0], e[1])
 			events += pack ('<I', e[0]) + e[1] 
 		
 		#Assemble the file
-		VERSION = 0x20200430
 		header = 'RDTA'.encode ('utf-8')
-		header += pack ('<5If', VERSION, animset, nevents, nbones, nframes, fps)
-		bin = header + events + codedata + framedata
+		if block:
+			header += pack ('<2I4If', VERSION_FLAGS, ANIM_BLOCKS, animset, nevents, nbones, nframes, fps)
+		else:
+			header += pack ('<5If', ANIM_VERSION, animset, nevents, nbones, nframes, fps)
+		sections = [('HEAD', header), ('EVNT', events), ('CODE', codedata)]
+		if block:
+			#Offsets are from the start of the first block
+			table = pack ('<2I', block, len (offsets))
+			table += pack ('<{0}I'.format (len (offsets)), *offsets)
+			sections.append (('BLKS', table))
+		sections.append (('FRAM', framedata))
+		bin = self.compress (sections)
 		
 		#Dump everything to disk
+		self.prof.begin ('write', bytes = len (bin))
 		bin_path = bpy.path.ensure_ext (pref, '.ta')
 		with open (bin_path, 'wb') as f:
 			f.write (bin)
+		self.written.append (bin_path)
+		self.prof.end ()
 	
-		self.trace ('{0}:'.format (bin_path))
-		self.trace ('\tframes: {0}'.format (nframes))
-		self.trace ('\tfps: {0}'.format (fps))
-		self.trace ('\tsize: {0} bytes, {1} kib'.format (len (bin), len (bin)/1024))
+		self.trace ('{0}:', bin_path)
+		self.trace ('\tframes: {0}', nframes)
+		self.trace ('\tfps: {0}', fps)
+		self.trace ('\tsize: {0} bytes, {1} kib', len (bin), len (bin)/1024)
 		self.trace ("Anim Done!!!")
 		
 	def main (self):
@@ -420,10 +716,9 @@ class Export:
 		
 		#Only permit one root
 		if len (roots) != 1:
-			self.trace ('{0} must have a single root!'.format (armature.name))
+			self.trace ('{0} must have a single root!', armature.name)
 		
-		#Python does not let nested functions modify parent state
-		#So stuff everything inside a container and pass it to the function
+		#Everything the mesh and animation writers need to know of the bones
 		class State:
 			def __init__(self):
 				self.bones = bytes ()
@@ -432,27 +727,34 @@ class Export:
 				self.list = []
 				self.animset = 0
 		
-		def write_bones_r (head, parent, depth, state):
+		#Generate bones list
+		bs = State ()
+		arrays = self.cfg.skeleton_arrays
+		positions = []
+		rotations = []
+		parents = []
+		depths = []
+		for head, parent, depth in skeleton.order (roots[0], arrays):
 			#Append the bone to the list
-			xyz = head.matrix.translation
-			state.bones += pack ('<3fI', xyz[0], xyz[1], xyz[2], parent)
-			state.list.append (head)
+			positions.append (head.matrix.translation)
+			parents.append (parent)
+			depths.append (depth)
+			if arrays:
+				rotations.append (skeleton.quaternion (armature.data.bones[head.name].matrix))
+			bs.list.append (head)
 			
 			#Add bone to the remap table
-			id = state.nbones
-			state.bone2index[head.name] = id
-			state.nbones += 1
+			id = bs.nbones
+			bs.bone2index[head.name] = id
+			bs.nbones += 1
 			
 			#Print a nice debug
-			self.trace ('{0} < {1} {2} {3}'.format (id, parent, depth*'  ', head.name))
-			
-			#Recurse into children
-			for ch in head.children:
-				write_bones_r (ch, id, depth + 1, state)
+			self.trace ('{0} < {1} {2} {3}', id, parent, depth*'  ', head.name)
 		
-		#Generate bones list
-		bs = State ()
-		write_bones_r (roots[0], 0, 0, bs)		
+		if arrays:
+			bs.bones = skeleton.pack_arrays (positions, rotations, parents, depths)
+		else:
+			bs.bones = skeleton.pack_interleaved (positions, parents)
 		
 		#Generate animset
 		import binascii		
@@ -461,12 +763,20 @@ class Export:
 			animset_data += b.name
 		
 		bs.animset = binascii.crc32 (bytes (animset_data.encode ('ascii')))
-		self.trace ('animset: {0}'.format (bs.animset))
+		self.trace ('animset: {0}', bs.animset)
 		
 		#Write out mesh if requested
 		if self.cfg.domesh:
+			self.meshes = snapshot.Cache (self.ctx)
+			self.prof.begin ('mesh')
 			self.write_mesh (armature, bs)
+			self.prof.end ()
 
 		#Write out animation if requested
 		if self.cfg.doanim:
+			self.prof.begin ('anim')
 			self.write_anim (armature, bs)
+			self.prof.end ()
+		
+		#Keep the profile next to the asset
+		self.prof.write (os.path.splitext (self.cfg.filepath)[0] + '.trace.json')
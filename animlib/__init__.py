@@ -0,0 +1,25 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Library wide passes over exported animation clips. Works on clips opened
+#with the reader, so it runs anywhere NumPy does.
+#
+#From the add-on folder, `python -m animlib OUT CLIP...` moves bones that
+#every clip of an animset holds still at the same angles into one shared
+#pose table per animset.
+from .shared import factor, rewrite, pose_table, MIN_CLIPS
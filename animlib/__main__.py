@@ -0,0 +1,86 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import os
+import numpy as np
+from reader import load, Anim, PoseTable
+from reader.anim import compare
+from . import factor, rewrite, pose_table, MIN_CLIPS
+
+def main ():
+	parser = argparse.ArgumentParser (prog='python -m animlib',
+		description='Moves bones held still at the same angles across the clips of an animset into a shared pose table')
+	parser.add_argument ('out', help='folder for the rewritten clips and pose tables')
+	parser.add_argument ('clips', nargs='+')
+	parser.add_argument ('--min-clips', type=int, default=MIN_CLIPS,
+		help='clips that must agree on a bone before it is shared')
+	args = parser.parse_args ()
+	os.makedirs (args.out, exist_ok=True)
+
+	#Group the clips by animset
+	sets = {}
+	for path in args.clips:
+		clip = load (path)
+		if not isinstance (clip, Anim):
+			parser.error ('{0} is not a clip'.format (path))
+		sets.setdefault (clip.animset, []).append ((path, clip))
+
+	before = 0
+	after = 0
+	for animset, clips in sorted (sets.items ()):
+		values, mask = factor ([c for p, c in clips], args.min_clips)
+		table = os.path.join (args.out, '{0:08x}.tap'.format (animset))
+		with open (table, 'wb') as f:
+			f.write (pose_table (animset, values, mask))
+
+		set_before = 0
+		set_after = os.path.getsize (table)
+		for path, clip in clips:
+			data, nshared = rewrite (clip, values, mask)
+			#The clip may be rewritten in place, and is still mapped until
+			#checked, so it only replaces the original once it passes
+			dst = os.path.join (args.out, os.path.basename (path))
+			tmp = dst + '.tmp'
+			with open (tmp, 'wb') as f:
+				f.write (data)
+
+			#Check the clip still decodes to exactly the same poses
+			with load (tmp) as check, PoseTable (table) as t:
+				check.share (t)
+				n = compare (clip, check)
+			if n is not None:
+				os.remove (tmp)
+				raise SystemExit ('{0}: frame {1} no longer matches'.format (dst, n))
+			print ('\t{0}: {1} -> {2} bytes, {3} bones shared'.format (
+				os.path.basename (path), clip.size (), len (data), nshared))
+			set_before += clip.size ()
+			set_after += len (data)
+			clip.close ()
+			os.replace (tmp, dst)
+
+		print ('animset {0:#x}: {1} clips, {2} of {3} bones in the table, {4} -> {5} bytes ({6} saved)'.format (
+			animset, len (clips), int (np.count_nonzero (mask)), len (mask),
+			set_before, set_after, set_before - set_after))
+		before += set_before
+		after += set_after
+
+	print ('total: {0} animsets, {1} -> {2} bytes ({3} saved, {4:.1f}%)'.format (
+		len (sets), before, after, before - after, 100.0*(before - after)/max (before, 1)))
+
+main ()
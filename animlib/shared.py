@@ -0,0 +1,110 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Shared pose tables. Every clip stores each elided bone once per keyframe,
+#and clips of one animset tend to hold the same bones (fingers, face,
+#props) still at the same angles. Those values are moved into a table per
+#animset, written once:
+#
+#	<4s  'RDTP'
+#	<3I  version, animset, nbones
+#	<I   per bone: packed angles
+#	<B   per bone: 1 if any clip takes it from the table
+#
+#Clips that use the table carry ANIM_SHARED and set CODE_SHARED in the code
+#of every bone they leave out of their keyframes.
+from struct import pack
+import numpy as np
+
+MAGICK = 'RDTP'.encode ('utf-8')
+POSE_VERSION = 0x20261019
+VERSION_FLAGS = 0x20261019
+ANIM_BLOCKS = 1<<0
+ANIM_SHARED = 1<<1
+CODE_SHARED = 1<<3
+
+#A value has to turn up in this many clips to earn its place in the table
+MIN_CLIPS = 2
+
+#Picks the table for clips of one animset. Returns the packed value and
+#whether it is shared for every bone. A bone is shared if it is still in
+#enough clips at the same angles; the most common value wins
+def factor (clips, min_clips = MIN_CLIPS):
+	nbones = clips[0].nbones
+	votes = [{} for i in range (nbones)]
+	for c in clips:
+		if c.animset != clips[0].animset or c.nbones != nbones:
+			raise ValueError ('clips of different animsets')
+		if c.flags & ANIM_SHARED:
+			raise ValueError ('{0} already uses a pose table'.format (c.blob.path))
+		first = c.keyframe (0)[1]
+		for j in np.nonzero (0 == np.asarray (c.codes))[0]:
+			v = int (first[j])
+			votes[j][v] = votes[j].get (v, 0) + 1
+
+	values = np.zeros (nbones, dtype=np.uint32)
+	mask = np.zeros (nbones, dtype=bool)
+	for j, v in enumerate (votes):
+		if not v:
+			continue
+		#Ties go to the smaller value so the table does not depend on order
+		best, n = min (v.items (), key=lambda e: (-e[1], e[0]))
+		if n >= min_clips:
+			values[j] = best
+			mask[j] = True
+	return values, mask
+
+def pose_table (animset, values, mask):
+	out = MAGICK + pack ('<3I', POSE_VERSION, animset, len (values))
+	out += values.astype ('<u4').tobytes ()
+	out += mask.astype ('u1').tobytes ()
+	return out
+
+#Writes a clip again, leaving out of its keyframes the bones it can take
+#from the table. Returns the new file and the number of bones left out
+def rewrite (clip, values, mask):
+	codes = np.array (clip.codes)
+	shared = (0 == codes) & mask & (clip.keyframe (0)[1] == values)
+	codes[shared] |= CODE_SHARED
+	keep = np.nonzero (~shared)[0]
+
+	blocked = clip.flags & ANIM_BLOCKS
+	flags = ANIM_SHARED | blocked
+	header = 'RDTA'.encode ('utf-8')
+	header += pack ('<2I4If', VERSION_FLAGS, flags, clip.animset, len (clip.events),
+		clip.nbones, clip.nframes, clip.fps)
+
+	frames = []
+	offsets = []
+	size = 0
+	for n in range (clip.nframes):
+		if clip.is_key (n):
+			offsets.append (size)
+			z, packed = clip.keyframe (n)
+			packed = packed[keep]
+		else:
+			z, packed = clip.frame (n)
+		f = pack ('<f', z) + np.asarray (packed, dtype='<u4').tobytes ()
+		frames.append (f)
+		size += len (f)
+
+	out = header + clip.events.tobytes () + codes.tobytes ()
+	if blocked:
+		out += pack ('<2I', clip.block_frames, len (offsets))
+		out += pack ('<{0}I'.format (len (offsets)), *offsets)
+	return out + bytes ().join (frames), int (np.count_nonzero (shared))
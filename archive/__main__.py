@@ -0,0 +1,110 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import os
+import random
+import time
+from . import Archive, Builder, compact
+
+def add (args):
+	with Builder (args.archive) as b:
+		for path in args.files:
+			b.add_file (path)
+	print ('{0}: {1} names, {2} bytes written, {3} files already stored'.format (
+		args.archive, len (b.names), b.written, b.reused))
+
+def list_contents (args):
+	with Archive (args.archive) as a:
+		shared = {}
+		for name, d, ofs, size in a.entries ():
+			shared[d] = shared.get (d, 0) + 1
+		for name, d, ofs, size in sorted (a.entries ()):
+			dup = ' (shared x{0})'.format (shared[d]) if shared[d] > 1 else ''
+			print ('\t{0:10} {1:10} {2} {3}{4}'.format (ofs, size, d.hex (), name, dup))
+		live = a.live ()
+		print ('{0} names, {1} blobs, {2} bytes ({3} dead)'.format (
+			len (a), a.nblobs, a.size, a.size - live))
+
+#Times lookups of names in the archive against opening the same number of
+#loose files, if they are given
+def bench (args):
+	start = time.perf_counter ()
+	a = Archive (args.archive)
+	opened = time.perf_counter () - start
+	names = [e[0] for e in a.entries ()]
+	rnd = random.Random (1)
+	picks = [rnd.choice (names) for i in range (args.lookups)]
+	missing = ['missing{0}'.format (i) for i in range (args.lookups)]
+
+	start = time.perf_counter ()
+	total = 0
+	for n in picks:
+		total += len (a.lookup (n))
+	hit = time.perf_counter () - start
+
+	start = time.perf_counter ()
+	for n in missing:
+		n in a
+	miss = time.perf_counter () - start
+
+	print ('\topen: {0:.3f} ms'.format (1000*opened))
+	print ('\tlookup: {0:.2f} us per name ({1} names, {2} bytes)'.format (
+		1e6*hit/len (picks), len (names), total))
+	print ('\tmiss: {0:.2f} us per name'.format (1e6*miss/len (missing)))
+	a.close ()
+
+	if args.loose:
+		paths = {os.path.basename (p): p for p in args.loose}
+		start = time.perf_counter ()
+		for n in picks:
+			if n in paths:
+				with open (paths[n], 'rb') as f:
+					f.read ()
+		loose = time.perf_counter () - start
+		print ('\tloose files: {0:.2f} us per open and read'.format (1e6*loose/len (picks)))
+
+def main ():
+	parser = argparse.ArgumentParser (prog='python -m archive',
+		description='Builds and inspects Traum asset archives')
+	sub = parser.add_subparsers (dest='command', required=True)
+
+	p = sub.add_parser ('add', help='add or update files in an archive')
+	p.add_argument ('archive')
+	p.add_argument ('files', nargs='+')
+	p.set_defaults (fn=add)
+
+	p = sub.add_parser ('list', help='list the contents of an archive')
+	p.add_argument ('archive')
+	p.set_defaults (fn=list_contents)
+
+	p = sub.add_parser ('compact', help='rewrite an archive without dead space')
+	p.add_argument ('archive')
+	p.add_argument ('out')
+	p.set_defaults (fn=lambda args: compact (args.archive, args.out))
+
+	p = sub.add_parser ('bench', help='time name lookups')
+	p.add_argument ('archive')
+	p.add_argument ('loose', nargs='*', help='the same files loose, to compare against')
+	p.add_argument ('--lookups', type=int, default=100000)
+	p.set_defaults (fn=bench)
+
+	args = parser.parse_args ()
+	args.fn (args)
+
+main ()
@@ -0,0 +1,252 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Content addressed archive. Blobs are stored once per distinct content and
+#start on a page boundary so they can be mapped straight into memory:
+#
+#	page 0:
+#	<4s3I2Q 'TRPK', version, page size, reserved, index offset, index size
+#	blobs, each page aligned
+#	index, page aligned:
+#	<2I  nnames, nblobs
+#	<Q   per name: hash of the name, sorted
+#	<2I  per name: blob, offset of the name in the string blob
+#	<16s2Q per blob: content digest, offset, size, sorted by digest
+#	<I   size of the string blob, then NUL terminated UTF-8 names
+#
+#Updates append the blobs that are new, then a fresh index, and only then
+#point the header at it; a crash part way leaves the old index intact.
+#Replaced blobs and indices stay behind as dead space until compacted.
+import bisect
+import hashlib
+import mmap
+import os
+import sys
+from struct import pack, unpack_from, calcsize
+
+MAGICK = 'TRPK'.encode ('utf-8')
+ARCHIVE_VERSION = 0x20261019
+PAGE_SIZE = 4096
+
+HEADER = '<4s3I2Q'
+COUNTS = '<2I'
+NAME = '<2I'
+BLOB = '<16s2Q'
+
+def name_hash (name):
+	return int.from_bytes (hashlib.blake2b (name.encode ('utf-8'), digest_size=8).digest (), 'little')
+
+def digest (data):
+	return hashlib.blake2b (data, digest_size=16).digest ()
+
+def align (ofs, size = PAGE_SIZE):
+	return (ofs + size - 1)//size*size
+
+#Read side of an archive. The whole file is mapped and lookups bisect the
+#name hashes in place, so opening costs the same however many entries
+#there are
+class Archive:
+	def __init__ (self, path):
+		self.path = path
+		self.file = open (path, 'rb')
+		self.map = mmap.mmap (self.file.fileno (), 0, access=mmap.ACCESS_READ)
+		magick, self.version, self.page_size, reserved, ofs, self.index_size = unpack_from (HEADER, self.map, 0)
+		if MAGICK != magick:
+			raise RuntimeError ('{0} is not an archive'.format (path))
+		if ARCHIVE_VERSION != self.version:
+			raise RuntimeError ('{0} has unknown version {1:#x}'.format (path, self.version))
+		self.size = len (self.map)
+		self.nnames, self.nblobs = unpack_from (COUNTS, self.map, ofs)
+		ofs += calcsize (COUNTS)
+
+		#The hashes are bisected in place as native integers
+		if 'little' != sys.byteorder:
+			raise RuntimeError ('archives can only be mapped on little endian machines')
+		self.view = memoryview (self.map)
+		self.hashes = self.view[ofs:ofs + 8*self.nnames].cast ('Q')
+		ofs += 8*self.nnames
+		self.ofs_names = ofs
+		ofs += calcsize (NAME)*self.nnames
+		self.ofs_blobs = ofs
+		ofs += calcsize (BLOB)*self.nblobs
+		#Skip the size of the string blob
+		self.ofs_strings = ofs + 4
+
+	def close (self):
+		self.hashes.release ()
+		self.view.release ()
+		self.hashes = self.view = None
+		try:
+			self.map.close ()
+		except BufferError:
+			pass
+		self.file.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def __len__ (self):
+		return self.nnames
+
+	def __contains__ (self, name):
+		return self.find (name) is not None
+
+	def string (self, ofs):
+		ofs += self.ofs_strings
+		end = self.map.find (b'\0', ofs)
+		return self.map[ofs:end].decode ('utf-8')
+
+	def blob (self, n):
+		return unpack_from (BLOB, self.map, self.ofs_blobs + calcsize (BLOB)*n)
+
+	#Returns the index of the name, or None. Hashes can collide in theory,
+	#so the name itself is checked over the run of equal hashes
+	def find (self, name):
+		h = name_hash (name)
+		i = bisect.bisect_left (self.hashes, h)
+		while i < self.nnames and self.hashes[i] == h:
+			blob, ofs = unpack_from (NAME, self.map, self.ofs_names + calcsize (NAME)*i)
+			if self.string (ofs) == name:
+				return i
+			i += 1
+		return None
+
+	#Returns a read only view of the named blob, without copying it
+	def lookup (self, name):
+		i = self.find (name)
+		if i is None:
+			raise KeyError (name)
+		blob = unpack_from (NAME, self.map, self.ofs_names + calcsize (NAME)*i)[0]
+		d, ofs, size = self.blob (blob)
+		return self.view[ofs:ofs + size]
+
+	#Yields (name, digest, offset, size) for every name, in hash order
+	def entries (self):
+		for i in range (self.nnames):
+			blob, ofs = unpack_from (NAME, self.map, self.ofs_names + calcsize (NAME)*i)
+			d, bofs, size = self.blob (blob)
+			yield self.string (ofs), d, bofs, size
+
+	#Bytes taken up by blobs and the index that are still referenced
+	def live (self):
+		used = self.page_size + self.index_size
+		for i in range (self.nblobs):
+			used += align (self.blob (i)[2], self.page_size)
+		return used
+
+#Write side. Loads the index of an existing archive so that unchanged
+#content is never written twice
+class Builder:
+	def __init__ (self, path, page_size = PAGE_SIZE):
+		self.path = path
+		self.page_size = page_size
+		#name -> digest, digest -> (offset, size)
+		self.names = {}
+		self.blobs = {}
+		self.pending = {}
+		self.written = 0
+		self.reused = 0
+		if os.path.exists (path):
+			with Archive (path) as a:
+				self.page_size = a.page_size
+				for name, d, ofs, size in a.entries ():
+					self.names[name] = d
+					self.blobs[d] = (ofs, size)
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, kind, value, tb):
+		if kind is None:
+			self.commit ()
+
+	def add (self, name, data):
+		d = digest (data)
+		self.names[name] = d
+		if d in self.blobs or d in self.pending:
+			self.reused += 1
+		else:
+			self.pending[d] = bytes (data)
+
+	def add_file (self, path, name = None):
+		with open (path, 'rb') as f:
+			self.add (name or os.path.basename (path), f.read ())
+
+	def remove (self, name):
+		del self.names[name]
+
+	def index (self):
+		#Only blobs something still points at make it into the index
+		live = sorted (set (self.names.values ()))
+		blob_ids = {d: i for i, d in enumerate (live)}
+
+		entries = sorted ((name_hash (n), n) for n in self.names)
+		strings = bytes ()
+		hashes = bytes ()
+		records = bytes ()
+		for h, n in entries:
+			hashes += pack ('<Q', h)
+			records += pack (NAME, blob_ids[self.names[n]], len (strings))
+			strings += n.encode ('utf-8') + b'\0'
+
+		blobs = bytes ()
+		for d in live:
+			blobs += pack (BLOB, d, *self.blobs[d])
+
+		return pack (COUNTS, len (entries), len (live)) + hashes + records + blobs + pack ('<I', len (strings)) + strings
+
+	#Appends new blobs and a new index, then switches the header over
+	def commit (self):
+		mode = 'r+b' if os.path.exists (self.path) else 'w+b'
+		with open (self.path, mode) as f:
+			f.seek (0, os.SEEK_END)
+			end = max (f.tell (), self.page_size)
+			for d, data in sorted (self.pending.items ()):
+				ofs = align (end, self.page_size)
+				f.seek (ofs)
+				f.write (data)
+				self.blobs[d] = (ofs, len (data))
+				self.written += len (data)
+				end = ofs + len (data)
+			self.pending = {}
+
+			index = self.index ()
+			ofs = align (end, self.page_size)
+			f.seek (ofs)
+			f.write (index)
+			f.flush ()
+			os.fsync (f.fileno ())
+
+			f.seek (0)
+			f.write (pack (HEADER, MAGICK, ARCHIVE_VERSION, self.page_size, 0, ofs, len (index)))
+			f.flush ()
+			os.fsync (f.fileno ())
+
+#Rewrites an archive with only what is still referenced
+def compact (path, out):
+	if os.path.exists (out):
+		raise RuntimeError ('{0} already exists'.format (out))
+	b = Builder (out)
+	with Archive (path) as a:
+		for name, d, ofs, size in a.entries ():
+			b.add (name, a.map[ofs:ofs + size])
+	b.commit ()
+	return b
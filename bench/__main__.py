@@ -0,0 +1,66 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import os
+import sys
+from . import run
+
+def main ():
+	parser = argparse.ArgumentParser (prog='python -m bench',
+		description='Times the exporters on synthetic scenes without Blender')
+	parser.add_argument ('--objects', type=int, default=64, help='objects in the grid level')
+	parser.add_argument ('--grid', type=int, default=16, help='quads along each side of a grid')
+	parser.add_argument ('--tris', type=int, default=2000, help='triangles in the skinned mesh')
+	parser.add_argument ('--bones', type=int, default=32, help='bones in the armature')
+	parser.add_argument ('--frames', type=int, default=120, help='frames in the clip')
+	parser.add_argument ('--boulder', type=int, default=32, help='segments around the boulder given hulls')
+	parser.add_argument ('--terrain', type=int, default=32, help='quads along each of the four terrain tiles')
+	parser.add_argument ('--repeat', type=int, default=3, help='runs per stage, the best is kept')
+	parser.add_argument ('--baseline', default=os.path.join (os.path.dirname (__file__), 'baseline.json'),
+		help='baseline to compare against')
+	parser.add_argument ('--save', action='store_true', help='store the results as the new baseline')
+	parser.add_argument ('--threshold', type=float, default=10.0,
+		help='percentage slowdown reported as a regression')
+	args = parser.parse_args ()
+
+	params = {
+		'objects': args.objects,
+		'grid': args.grid,
+		'tris': args.tris,
+		'bones': args.bones,
+		'frames': args.frames,
+		'boulder': args.boulder,
+		'terrain': args.terrain}
+	results = run.run (params, args.repeat)
+
+	slow = []
+	if os.path.exists (args.baseline) and not args.save:
+		print ('Against {0}:'.format (args.baseline))
+		slow = run.compare (results, run.load (args.baseline), args.threshold)
+	else:
+		run.report (results)
+
+	if args.save:
+		run.save (results, args.baseline)
+		print ('Saved baseline to {0}'.format (args.baseline))
+
+	if slow:
+		sys.exit (1)
+
+main ()
@@ -0,0 +1,251 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Just enough of bpy and mathutils for the exporters to run outside of
+#Blender. Only what the exporters actually touch is here, and the maths
+#follows Blender's conventions so the output is meaningful
+import math
+import sys
+import types
+
+class Vector:
+	__slots__ = ('v', 'frozen')
+
+	def __init__ (self, seq = (0.0, 0.0, 0.0)):
+		self.v = [float (x) for x in seq]
+		self.frozen = False
+
+	def __len__ (self):
+		return len (self.v)
+
+	def __getitem__ (self, i):
+		return self.v[i]
+
+	def __setitem__ (self, i, x):
+		self.v[i] = float (x)
+
+	def __iter__ (self):
+		return iter (self.v)
+
+	def __eq__ (self, other):
+		return list (self) == list (other)
+
+	def __hash__ (self):
+		return hash (tuple (self.v))
+
+	def __repr__ (self):
+		return 'Vector(({0}))'.format (', '.join ('{0:.4f}'.format (x) for x in self.v))
+
+	def __add__ (self, other):
+		return Vector (a + b for a, b in zip (self.v, other))
+
+	def __sub__ (self, other):
+		return Vector (a - b for a, b in zip (self.v, other))
+
+	def __mul__ (self, s):
+		return Vector (a*s for a in self.v)
+
+	__rmul__ = __mul__
+
+	def __neg__ (self):
+		return Vector (-a for a in self.v)
+
+	x = property (lambda self: self.v[0])
+	y = property (lambda self: self.v[1])
+	z = property (lambda self: self.v[2])
+
+	@property
+	def length (self):
+		return math.sqrt (sum (a*a for a in self.v))
+
+	def dot (self, other):
+		return sum (a*b for a, b in zip (self.v, other))
+
+	def cross (self, o):
+		a = self.v
+		return Vector ((a[1]*o[2] - a[2]*o[1], a[2]*o[0] - a[0]*o[2], a[0]*o[1] - a[1]*o[0]))
+
+	def normalized (self):
+		l = self.length
+		return Vector (a/l for a in self.v) if l > 0 else Vector (self.v)
+
+	def copy (self):
+		return Vector (self.v)
+
+	def freeze (self):
+		self.frozen = True
+		return self
+
+class Euler (Vector):
+	__slots__ = ('order',)
+
+	def __init__ (self, angles = (0.0, 0.0, 0.0), order = 'XYZ'):
+		super ().__init__ (angles)
+		self.order = order
+
+	def to_matrix (self):
+		x, y, z = self.v
+		rx = Matrix.Rotation (x, 3, 'X')
+		ry = Matrix.Rotation (y, 3, 'Y')
+		rz = Matrix.Rotation (z, 3, 'Z')
+		#Blender composes extrinsic rotations in the named order
+		m = {'X': rx, 'Y': ry, 'Z': rz}
+		return m[self.order[2]] @ m[self.order[1]] @ m[self.order[0]]
+
+class Matrix:
+	def __init__ (self, rows):
+		self.rows = [[float (x) for x in r] for r in rows]
+
+	def __getitem__ (self, i):
+		return self.rows[i]
+
+	def __len__ (self):
+		return len (self.rows)
+
+	@classmethod
+	def Identity (cls, n):
+		return cls ([[1.0 if i == j else 0.0 for j in range (n)] for i in range (n)])
+
+	@classmethod
+	def Translation (cls, v):
+		m = cls.Identity (4)
+		for i in range (3):
+			m.rows[i][3] = v[i]
+		return m
+
+	@classmethod
+	def Rotation (cls, angle, size, axis):
+		c = math.cos (angle)
+		s = math.sin (angle)
+		if 'X' == axis:
+			r = [[1, 0, 0], [0, c, -s], [0, s, c]]
+		elif 'Y' == axis:
+			r = [[c, 0, s], [0, 1, 0], [-s, 0, c]]
+		else:
+			r = [[c, -s, 0], [s, c, 0], [0, 0, 1]]
+		m = cls (r)
+		return m.to_4x4 () if 4 == size else m
+
+	def to_3x3 (self):
+		return Matrix ([r[0:3] for r in self.rows[0:3]])
+
+	def to_4x4 (self):
+		m = Matrix.Identity (4)
+		n = min (3, len (self.rows))
+		for i in range (n):
+			for j in range (n):
+				m.rows[i][j] = self.rows[i][j]
+		return m
+
+	@property
+	def translation (self):
+		return Vector ((self.rows[0][3], self.rows[1][3], self.rows[2][3]))
+
+	def copy (self):
+		return Matrix (self.rows)
+
+	def inverted (self):
+		n = len (self.rows)
+		a = [r[:] + [1.0 if i == j else 0.0 for j in range (n)] for i, r in enumerate (self.rows)]
+		for c in range (n):
+			p = max (range (c, n), key=lambda r: abs (a[r][c]))
+			if abs (a[p][c]) < 1e-12:
+				raise ValueError ('matrix does not have an inverse')
+			a[c], a[p] = a[p], a[c]
+			d = a[c][c]
+			a[c] = [x/d for x in a[c]]
+			for r in range (n):
+				if r != c and a[r][c] != 0.0:
+					f = a[r][c]
+					a[r] = [x - f*y for x, y in zip (a[r], a[c])]
+		return Matrix ([r[n:] for r in a])
+
+	def __matmul__ (self, other):
+		if isinstance (other, Matrix):
+			cols = list (zip (*other.rows))
+			return Matrix ([[sum (a*b for a, b in zip (r, c)) for c in cols] for r in self.rows])
+		v = list (other)
+		#Vectors are treated as points when multiplied by a 4x4 matrix
+		if 4 == len (self.rows) and 3 == len (v):
+			v = v + [1.0]
+			out = [sum (a*b for a, b in zip (r, v)) for r in self.rows]
+			return Vector (out[0:3])
+		return Vector (sum (a*b for a, b in zip (r, v)) for r in self.rows)
+
+	def to_euler (self, order = 'XYZ'):
+		m = self.rows
+		if 'ZYX' == order:
+			#R = Rx Ry Rz
+			cy = math.hypot (m[0][0], m[0][1])
+			x = math.atan2 (-m[1][2], m[2][2])
+			y = math.atan2 (m[0][2], cy)
+			z = math.atan2 (-m[0][1], m[0][0])
+		else:
+			#R = Rz Ry Rx
+			cy = math.hypot (m[0][0], m[1][0])
+			x = math.atan2 (m[2][1], m[2][2])
+			y = math.atan2 (-m[2][0], cy)
+			z = math.atan2 (m[1][0], m[0][0])
+		return Euler ((x, y, z), order)
+
+#Properties only need to remember their arguments, so the runner can read
+#the defaults straight off the operators
+class Property:
+	def __init__ (self, kind, **kwargs):
+		self.kind = kind
+		self.kwargs = kwargs
+
+	@property
+	def default (self):
+		return self.kwargs.get ('default')
+
+def property_type (kind):
+	return lambda **kwargs: Property (kind, **kwargs)
+
+def ensure_ext (path, ext):
+	if path.lower ().endswith (ext):
+		return path
+	return path + ext
+
+#Installs the stand-ins as the bpy and mathutils modules
+def install ():
+	if 'bpy' in sys.modules and not getattr (sys.modules['bpy'], 'fake', False):
+		raise RuntimeError ('The real bpy is loaded; the stand-in is for running outside Blender')
+
+	mathutils = types.ModuleType ('mathutils')
+	mathutils.Vector = Vector
+	mathutils.Matrix = Matrix
+	mathutils.Euler = Euler
+	mathutils.__all__ = ['Vector', 'Matrix', 'Euler']
+
+	bpy = types.ModuleType ('bpy')
+	bpy.fake = True
+	bpy.path = types.ModuleType ('bpy.path')
+	bpy.path.ensure_ext = ensure_ext
+	bpy.props = types.ModuleType ('bpy.props')
+	for kind in ('Bool', 'Float', 'Int', 'String', 'Enum'):
+		setattr (bpy.props, kind + 'Property', property_type (kind))
+	bpy.types = types.ModuleType ('bpy.types')
+	bpy.types.Operator = object
+
+	sys.modules['mathutils'] = mathutils
+	sys.modules['bpy'] = bpy
+	sys.modules['bpy.path'] = bpy.path
+	sys.modules['bpy.props'] = bpy.props
+	sys.modules['bpy.types'] = bpy.types
+	return bpy, mathutils
@@ -0,0 +1,350 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Times each stage of the exporters on synthetic scenes
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import types
+from . import fake
+from . import scenes
+
+#Loads the add-on as the package `traum` against the stand-in modules
+def load_addon ():
+	fake.install ()
+	if 'traum' in sys.modules:
+		return sys.modules['traum']
+	root = os.path.dirname (os.path.dirname (os.path.abspath (__file__)))
+	spec = importlib.util.spec_from_file_location ('traum',
+		os.path.join (root, '__init__.py'), submodule_search_locations=[root])
+	mod = importlib.util.module_from_spec (spec)
+	sys.modules['traum'] = mod
+	spec.loader.exec_module (mod)
+	return mod
+
+#Builds an operator config out of the operator's own property defaults
+def config (operator, path, **overrides):
+	cfg = types.SimpleNamespace ()
+	for k, v in operator.__annotations__.items ():
+		setattr (cfg, k, getattr (v, 'default', None))
+	cfg.filepath = path
+	cfg.verbose = False
+	for k, v in overrides.items ():
+		setattr (cfg, k, v)
+	return cfg
+
+#Keeps the best time seen for each stage over several repeats
+class Timer:
+	def __init__ (self):
+		self.stages = {}
+		#Sizes of what the stages produce, to catch trading size for speed
+		self.metrics = {}
+
+	@contextlib.contextmanager
+	def stage (self, name):
+		start = time.perf_counter ()
+		yield
+		t = time.perf_counter () - start
+		if name not in self.stages or t < self.stages[name]:
+			self.stages[name] = t
+
+#The exporters are chatty, so silence them while timing
+@contextlib.contextmanager
+def quiet ():
+	with contextlib.redirect_stdout (io.StringIO ()):
+		yield
+
+def unique_meshes (ctx):
+	seen = set ()
+	for o in ctx.scene.objects:
+		if o.type == 'MESH' and id (o.data) not in seen:
+			seen.add (id (o.data))
+			yield o
+
+def bench_level (addon, timer, tmp, objects, grid):
+	from traum import graph, texport, snapshot
+	ctx = scenes.grid_level (objects, grid)
+
+	#Pull the data the exporter needs out of every mesh
+	with timer.stage ('extract'):
+		cache = snapshot.Cache (ctx)
+		extracted = []
+		for o in unique_meshes (ctx):
+			mesh = cache.get (o)
+			loops = mesh.triangles ().ravel ()
+			ndx = mesh.loops[loops]
+			uv = mesh.uvs[loops]
+			corners = [(v[0], v[1], v[2], t[0], 1.0 - t[1]) for v, t in zip (mesh.co[ndx].tolist (), uv.tolist ())]
+			polys = ndx.reshape (-1, 3).tolist ()
+			extracted.append ((mesh, corners, polys))
+
+	with timer.stage ('graph'):
+		for mesh, corners, polys in extracted:
+			g = graph.Graph ()
+			for p in polys:
+				g.add_polygon (p)
+			g.build ()
+
+	with timer.stage ('cmesh'):
+		cpolys = []
+		for mesh, corners, polys in extracted:
+			c = graph.Cmesh ()
+			for p in polys:
+				c.add_polygon (p)
+			cpolys.append (c.build ())
+
+	#The records the exporter writes for each mesh, from the same snapshots
+	exporter = texport.Export (config (addon.ExportTraum, os.path.join (tmp, 'stage.level')), ctx)
+	exporter.strings = None
+	with timer.stage ('records'):
+		records = []
+		for o, (mesh, corners, polys) in zip (unique_meshes (ctx), extracted):
+			verts, lods, tris = exporter.render_record (o, mesh)
+			c = graph.Cmesh ()
+			for p in polys:
+				c.add_polygon (p)
+			records += [verts, lods, exporter.collision_record (mesh.co, c)]
+
+	with timer.stage ('write'):
+		with open (os.path.join (tmp, 'stage.bin'), 'wb') as f:
+			f.write (b''.join (records))
+
+	with timer.stage ('export'):
+		cfg = config (addon.ExportTraum, os.path.join (tmp, 'bench.level'))
+		texport.Export (cfg, ctx).main ()
+
+def bench_model (addon, timer, tmp, tris, bones):
+	from traum import graph, aexport, snapshot
+	ctx = scenes.skinned (tris, bones)
+	body = [o for o in ctx.scene.objects if o.type == 'MESH'][0]
+
+	#Split vertices by UV the same way the exporter does
+	with timer.stage ('extract'):
+		mesh = snapshot.Cache (ctx).get (body, groups = True, original = True)
+		loops = mesh.triangles ()
+		uvs = [tuple (uv) for uv in mesh.uvs[loops].reshape (-1, 2).tolist ()]
+		ids = {}
+		faces = []
+		for k, ndx in enumerate (mesh.loops[loops].ravel ().tolist ()):
+			key = (uvs[k], ndx)
+			if key not in ids:
+				ids[key] = len (ids)
+			if 0 == k%3:
+				faces.append ([])
+			faces[-1].append (ids[key])
+
+	with timer.stage ('graph'):
+		g = graph.Graph ()
+		for f in faces:
+			g.add_polygon (f)
+		g.build ()
+
+	with timer.stage ('meshifier'):
+		m = graph.Meshifier ()
+		for f in faces:
+			m.add_polygon (f)
+		strips, islands = m.build ()
+	timer.metrics['indices_per_tri'] = (sum (len (s) for s in strips) + len (islands))/max (len (faces), 1)
+
+	with timer.stage ('export'):
+		cfg = config (addon.ExportTraumModel, os.path.join (tmp, 'bench.tm'), doanim=False)
+		aexport.Export (cfg, ctx).main ()
+
+	#The body is posed, so its evaluated mesh differs from the bind pose.
+	#Rebuild each vertex from its weighted points, the rest rotations being
+	#identity, and see how far it lands from the nearest bind pose vertex
+	import numpy as np
+	from traum.reader.model import Model
+	with Model (os.path.join (tmp, 'bench.tm')) as model:
+		rebuilt = []
+		for m in model.meshes ():
+			bones = m.global_bones ()
+			for v, vert in enumerate (m.verts):
+				pts = m.points[vert['start']:vert['start'] + vert['count']]
+				at = model.bones['pos'][bones[v][:len (pts)]] + pts['pos']
+				rebuilt.append ((pts['weight'][:, None]*at).sum (axis=0))
+	rebuilt = np.array (rebuilt)
+	dist = np.linalg.norm (rebuilt[:, None, :] - mesh.co[None, :, :], axis=2)
+	timer.metrics['bind_error'] = float (dist.min (axis=1).max ())
+
+def bench_clip (addon, timer, tmp, frames, bones):
+	from traum import aexport
+	ctx = scenes.clip (frames, bones)
+	with timer.stage ('export'):
+		cfg = config (addon.ExportTraumModel, os.path.join (tmp, 'bench.ta'), domesh=False)
+		aexport.Export (cfg, ctx).main ()
+
+	#The stand-in frame_set costs nothing, where Blender re-evaluates the
+	#whole scene, so this only shows what sampling itself costs each way
+	with timer.stage ('export-stepped'):
+		cfg = config (addon.ExportTraumModel, os.path.join (tmp, 'bench.ta'), domesh=False, direct_sampling=False)
+		aexport.Export (cfg, ctx).main ()
+
+#Poses a branching skeleton written both ways, with a clip exported
+#alongside each: bone by bone through the interleaved layout, and a level
+#at a time through the breadth first arrays. Bones are matched up by
+#where they rest, so a clip animating the wrong bones shows as error
+def bench_pose (addon, timer, tmp, bones, frames, branching = 3):
+	import numpy as np
+	from traum import aexport
+	from traum.reader.model import Model
+	from traum.reader.anim import Anim
+	ctx = scenes.skinned (200, bones, branching = branching)
+	ctx.scene.frame_end = frames + 1
+	skeletons = {}
+	clips = {}
+	for kind, arrays in (('interleaved', False), ('arrays', True)):
+		path = os.path.join (tmp, 'bench-{0}'.format (kind))
+		with timer.stage ('export-' + kind):
+			cfg = config (addon.ExportTraumModel, path + '.tm', skeleton_arrays=arrays)
+			aexport.Export (cfg, ctx).main ()
+		with Model (path + '.tm') as m, Anim (path + '.ta') as a:
+			if m.animset != a.animset:
+				raise RuntimeError ('{0} clip does not match its model'.format (kind))
+			skeletons[kind] = m.skeleton
+			clips[kind] = [a.pose (n)[1] for n in range (len (a))]
+
+	posed = {}
+	for kind in skeletons:
+		with timer.stage ('pose-' + kind):
+			posed[kind] = [skeletons[kind].evaluate (f)[1] for f in clips[kind]]
+	a, b = (np.lexsort (skeletons[k].positions.T) for k in ('interleaved', 'arrays'))
+	timer.metrics['levels'] = len (skeletons['arrays'].levels) - 1
+	timer.metrics['error'] = float (max (np.abs (p[a] - q[b]).max () for p, q in zip (posed['interleaved'], posed['arrays'])))
+
+#Sphere queries against a boulder's triangles, then against its hull and
+#its convex decomposition. Hulls should miss nothing the triangles hit,
+#though they do hit spheres buried inside the rock
+def bench_collision (addon, timer, tmp, segments, queries = 256, radius = 0.1):
+	import numpy as np
+	from traum import texport
+	from traum.reader.level import Level
+	paths = {}
+	for kind in ('mesh', 'hull', 'decompose'):
+		paths[kind] = os.path.join (tmp, 'bench-{0}.level'.format (kind))
+		with timer.stage ('export-' + kind):
+			cfg = config (addon.ExportTraum, paths[kind], hulls=True)
+			texport.Export (cfg, scenes.boulder (segments, kind)).main ()
+
+	centres = np.random.default_rng (1).uniform (-1.5, 1.5, (queries, 3))
+	with Level (paths['mesh']) as l:
+		collision = l.mesh (0).collision
+		tris = collision.triangles ()
+		with timer.stage ('query-triangles'):
+			hits = collision.spheres (centres, radius, tris)
+	for kind in ('hull', 'decompose'):
+		with Level (paths[kind]) as l:
+			hulls = l.hulls (0)
+			with timer.stage ('query-' + kind):
+				got = np.zeros (queries, dtype=bool)
+				for h in hulls:
+					got |= h.spheres (centres, radius)
+			timer.metrics[kind + '_planes'] = sum (len (h.planes) for h in hulls)
+			timer.metrics[kind + '_missed'] = np.count_nonzero (hits & ~got)/max (np.count_nonzero (hits), 1)
+			timer.metrics[kind + '_extra'] = np.count_nonzero (got & ~hits)/queries
+
+#A* between random regions of the navmesh baked from a tiled terrain
+def bench_nav (addon, timer, tmp, size, queries = 200):
+	import random
+	from traum import texport
+	from traum.reader.level import Level
+	path = os.path.join (tmp, 'bench-nav.level')
+	ctx = scenes.terrain (size)
+	with timer.stage ('export'):
+		cfg = config (addon.ExportTraum, path, navmesh=True)
+		texport.Export (cfg, ctx).main ()
+
+	with Level (path) as l:
+		nav = l.navmesh
+		with timer.stage ('graph'):
+			nav._graph = None
+			nav.graph ()
+		rnd = random.Random (1)
+		pairs = [(rnd.randrange (len (nav)), rnd.randrange (len (nav))) for i in range (queries)]
+		found = 0
+		with timer.stage ('astar'):
+			for a, b in pairs:
+				found += nav.find (a, b) is not None
+		timer.metrics['regions_per_tri'] = len (nav)/(2*size*size*4)
+		timer.metrics['found'] = found/queries
+
+def run (params, repeat = 3):
+	addon = load_addon ()
+	results = {'params': params, 'python': platform.python_version (), 'stages': {}, 'metrics': {}}
+	with tempfile.TemporaryDirectory () as tmp:
+		for name, fn, args in (
+			('level', bench_level, (params['objects'], params['grid'])),
+			('model', bench_model, (params['tris'], params['bones'])),
+			('clip', bench_clip, (params['frames'], params['bones'])),
+			('pose', bench_pose, (params['bones'], params['frames'])),
+			('collision', bench_collision, (params['boulder'],)),
+			('nav', bench_nav, (params['terrain'],))):
+			timer = Timer ()
+			for i in range (repeat):
+				with quiet ():
+					fn (addon, timer, tmp, *args)
+			for stage, t in timer.stages.items ():
+				results['stages']['{0}.{1}'.format (name, stage)] = t
+			for metric, x in timer.metrics.items ():
+				results['metrics']['{0}.{1}'.format (name, metric)] = x
+	return results
+
+#Prints each stage against the baseline. Returns the stages that slowed
+#down by more than the threshold
+def compare (results, baseline, threshold):
+	if baseline.get ('params') != results['params']:
+		print ('WARNING: baseline was taken with different scene sizes')
+	slow = []
+	old = baseline.get ('stages', {})
+	for stage, t in results['stages'].items ():
+		if stage not in old:
+			print ('\t{0:20} {1:10.4f}s (new)'.format (stage, t))
+			continue
+		diff = 100*(t - old[stage])/max (old[stage], 1e-9)
+		mark = ''
+		if diff > threshold:
+			mark = ' REGRESSION'
+			slow.append (stage)
+		print ('\t{0:20} {1:10.4f}s {2:+7.1f}%{3}'.format (stage, t, diff, mark))
+	old = baseline.get ('metrics', {})
+	for metric, x in results['metrics'].items ():
+		if metric in old:
+			print ('\t{0:20} {1:10.4f} (was {2:.4f})'.format (metric, x, old[metric]))
+		else:
+			print ('\t{0:20} {1:10.4f}'.format (metric, x))
+	return slow
+
+def report (results):
+	for stage, t in results['stages'].items ():
+		print ('\t{0:20} {1:10.4f}s'.format (stage, t))
+	for metric, x in results['metrics'].items ():
+		print ('\t{0:20} {1:10.4f}'.format (metric, x))
+
+def load (path):
+	with open (path, 'r') as f:
+		return json.load (f)
+
+def save (results, path):
+	with open (path, 'w') as f:
+		json.dump (results, f, indent=1, sort_keys=True)
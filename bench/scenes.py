@@ -0,0 +1,471 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Synthetic scenes built out of the stand-in types. Everything is seeded so
+#runs are repeatable
+import math
+import random
+import types
+from .fake import Vector, Matrix, Euler
+
+#Blender's property collections, with the bulk accessor the exporters use
+class Collection (list):
+	def foreach_get (self, attr, out):
+		flat = []
+		for item in self:
+			x = getattr (item, attr)
+			if isinstance (x, Vector):
+				flat.extend (x)
+			else:
+				flat.append (x)
+		if len (flat) != len (out):
+			raise RuntimeError ('foreach_get: expected {0} items, got {1}'.format (len (flat), len (out)))
+		out[:] = flat
+
+class Material:
+	def __init__ (self, name):
+		self.name = name
+
+class Loop:
+	__slots__ = ('vertex_index',)
+	def __init__ (self, vertex_index):
+		self.vertex_index = vertex_index
+
+class UVLoop:
+	__slots__ = ('uv',)
+	def __init__ (self, uv):
+		self.uv = uv
+
+class Group:
+	__slots__ = ('group', 'weight')
+	def __init__ (self, group, weight):
+		self.group = group
+		self.weight = weight
+
+class Vertex:
+	__slots__ = ('index', 'co', 'normal', 'groups')
+	def __init__ (self, index, co, normal, groups = ()):
+		self.index = index
+		self.co = co
+		self.normal = normal
+		self.groups = list (groups)
+
+class Polygon:
+	__slots__ = ('index', 'loop_start', 'loop_total', 'material_index', 'vertices')
+	def __init__ (self, index, loop_start, loop_total, material_index, vertices):
+		self.index = index
+		self.loop_start = loop_start
+		self.loop_total = loop_total
+		self.material_index = material_index
+		self.vertices = vertices
+
+class Mesh:
+	def __init__ (self, name):
+		self.name = name
+		self.vertices = Collection ()
+		self.polygons = Collection ()
+		self.loops = Collection ()
+		self.materials = []
+		self.uv_layers = types.SimpleNamespace (active = types.SimpleNamespace (data = Collection ()))
+
+	def add_triangle (self, ids, uvs, material = 0):
+		start = len (self.loops)
+		for i, uv in zip (ids, uvs):
+			self.loops.append (Loop (i))
+			self.uv_layers.active.data.append (UVLoop (Vector (uv)))
+		self.polygons.append (Polygon (len (self.polygons), start, 3, material, list (ids)))
+
+class Object:
+	def __init__ (self, name, type, data = None):
+		self.name = name
+		self.type = type
+		self.data = data
+		self.parent = None
+		self.hide_viewport = False
+		self.location = Vector ((0.0, 0.0, 0.0))
+		self.rotation = Euler ((0.0, 0.0, 0.0))
+		self.scale = Vector ((1.0, 1.0, 1.0))
+		self.props = {}
+		self.vertex_groups = []
+		self.pose = None
+		self.modifiers = []
+		self.clears = 0
+		self.evaluations = 0
+
+	@property
+	def matrix_world (self):
+		m = self.rotation.to_matrix ().to_4x4 ()
+		for i in range (3):
+			for j in range (3):
+				m.rows[i][j] *= self.scale[j]
+			m.rows[i][3] = self.location[i]
+		return m
+
+	@property
+	def bound_box (self):
+		vs = self.data.vertices
+		lo = [min (v.co[k] for v in vs) for k in range (3)]
+		hi = [max (v.co[k] for v in vs) for k in range (3)]
+		return [(x, y, z) for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])]
+
+	def get (self, key, default = None):
+		return self.props.get (key, default)
+
+	def keys (self):
+		return list (self.props.keys ())
+
+	def __getitem__ (self, key):
+		return self.props[key]
+
+	#Without modifiers the evaluated object is the object itself. Modifiers
+	#are stand-ins taking the mesh so far and returning a new one
+	def evaluated_get (self, depsgraph):
+		self.evaluations += 1
+		if not self.modifiers:
+			return self
+		mesh = self.data
+		for modifier in self.modifiers:
+			mesh = modifier (mesh)
+		evaluated = Object (self.name, self.type, mesh)
+		evaluated.parent = self.parent
+		evaluated.vertex_groups = self.vertex_groups
+		return evaluated
+
+	def to_mesh (self):
+		return self.data
+
+	def to_mesh_clear (self):
+		self.clears += 1
+
+	def find_armature (self):
+		p = self.parent
+		while p is not None and p.type != 'ARMATURE':
+			p = p.parent
+		return p
+
+class Scene:
+	def __init__ (self):
+		self.objects = []
+		self.frame_start = 1
+		self.frame_end = 1
+		self.frame_current = 1
+		self.time = 1.0
+		self.render = types.SimpleNamespace (fps = 30)
+		self.timeline_markers = []
+		self.frame_sets = 0
+
+	def frame_set (self, frame, subframe = 0.0):
+		self.frame_current = frame
+		self.time = frame + subframe
+		self.frame_sets += 1
+
+class WindowManager:
+	def progress_begin (self, lo, hi):
+		pass
+
+	def progress_update (self, value):
+		pass
+
+	def progress_end (self):
+		pass
+
+	def popup_menu (self, draw, title = '', icon = ''):
+		pass
+
+class Context:
+	def __init__ (self, scene):
+		self.scene = scene
+		self.window_manager = WindowManager ()
+		self.active_object = None
+		self.depsgraphs = 0
+
+	def evaluated_depsgraph_get (self):
+		self.depsgraphs += 1
+		return types.SimpleNamespace (scene = self.scene)
+
+#A triangulated, UV mapped grid of size x size quads in the XY plane
+def grid_mesh (name, size, nmaterials = 1, z = 0.0):
+	mesh = Mesh (name)
+	mesh.materials = [Material ('mat{0}.{1:03d}'.format (i, i)) for i in range (nmaterials)]
+	up = Vector ((0.0, 0.0, 1.0))
+	for j in range (size + 1):
+		for i in range (size + 1):
+			co = Vector ((i/size - 0.5, j/size - 0.5, z + 0.05*math.sin (i + j)))
+			mesh.vertices.append (Vertex (len (mesh.vertices), co, up))
+
+	def uv (i, j):
+		return (i/size, j/size)
+
+	for j in range (size):
+		for i in range (size):
+			a = j*(size + 1) + i
+			b = a + 1
+			c = a + size + 1
+			d = c + 1
+			m = (i*nmaterials)//size
+			mesh.add_triangle ((a, b, d), (uv (i, j), uv (i + 1, j), uv (i + 1, j + 1)), m)
+			mesh.add_triangle ((a, d, c), (uv (i, j), uv (i + 1, j + 1), uv (i, j + 1)), m)
+	return mesh
+
+#A level of n grid objects. Every fourth object is an instance of an
+#earlier mesh and every eighth one carries entity properties
+def grid_level (n, size = 16, seed = 1):
+	rnd = random.Random (seed)
+	scene = Scene ()
+	meshes = []
+	for k in range (n):
+		if k%4 == 3 and meshes:
+			mesh = rnd.choice (meshes)
+		else:
+			mesh = grid_mesh ('mesh{0}'.format (k), size, 1 + k%3)
+			meshes.append (mesh)
+		o = Object ('obj{0}'.format (k), 'MESH', mesh)
+		o.location = Vector ((rnd.uniform (-100, 100), rnd.uniform (-100, 100), 0.0))
+		o.rotation = Euler ((0.0, 0.0, rnd.uniform (0, 2*math.pi)))
+		if k%8 == 0:
+			o.props = {
+				'_RNA_UI': {'health': {'min': 0}},
+				'type': 'prop',
+				'health': 100,
+				'mass': rnd.uniform (1, 10),
+				'colour': [1.0, 0.5, 0.25],
+				'label': 'crate{0}'.format (k)}
+		scene.objects.append (o)
+	return Context (scene)
+
+#Rolling ground cut into tiles x tiles pieces of n x n quads, with a
+#cliff across it too steep to walk. The pieces meet edge to edge, placed
+#where they lie
+def terrain (n, tiles = 2):
+	def height (x, y):
+		return 2.0*math.sin (0.3*x)*math.cos (0.2*y) + (6.0 if x > 0.6*n*tiles else 0.0)
+
+	scene = Scene ()
+	for ty in range (tiles):
+		for tx in range (tiles):
+			mesh = Mesh ('ground{0}.{1}'.format (tx, ty))
+			mesh.materials = [Material ('ground')]
+			up = Vector ((0.0, 0.0, 1.0))
+			for j in range (n + 1):
+				for i in range (n + 1):
+					x, y = tx*n + i, ty*n + j
+					mesh.vertices.append (Vertex (len (mesh.vertices), Vector ((x, y, height (x, y))), up))
+			for j in range (n):
+				for i in range (n):
+					a = j*(n + 1) + i
+					b = a + 1
+					c = a + n + 1
+					d = c + 1
+					uv = (i/n, j/n)
+					mesh.add_triangle ((a, b, d), (uv, uv, uv))
+					mesh.add_triangle ((a, d, c), (uv, uv, uv))
+			scene.objects.append (Object ('ground{0}.{1}'.format (tx, ty), 'MESH', mesh))
+	return Context (scene)
+
+#A lumpy UV sphere of 4 n^2 triangles, dented enough in places that one
+#hull hides a lot of it. Tagged to collide as the given kind of hull
+def boulder (n, collision = 'hull'):
+	mesh = Mesh ('boulder')
+	mesh.materials = [Material ('rock')]
+	w = 2*n
+	for j in range (n + 1):
+		phi = math.pi*j/n
+		for i in range (w):
+			theta = 2*math.pi*i/w
+			r = 1.0 + 0.3*math.sin (3*theta)*math.sin (2*phi)
+			co = Vector ((r*math.sin (phi)*math.cos (theta), r*math.sin (phi)*math.sin (theta), r*math.cos (phi)))
+			mesh.vertices.append (Vertex (len (mesh.vertices), co, co.normalized ()))
+
+	def uv (i, j):
+		return (i/w, j/n)
+
+	for j in range (n):
+		for i in range (w):
+			a = j*w + i
+			b = j*w + (i + 1)%w
+			c = a + w
+			d = b + w
+			mesh.add_triangle ((a, b, d), (uv (i, j), uv (i + 1, j), uv (i + 1, j + 1)))
+			mesh.add_triangle ((a, d, c), (uv (i, j), uv (i + 1, j + 1), uv (i, j + 1)))
+
+	scene = Scene ()
+	o = Object ('boulder', 'MESH', mesh)
+	o.props = {'collision': collision}
+	scene.objects.append (o)
+	return Context (scene)
+
+class Bone:
+	def __init__ (self, name, head):
+		self.name = name
+		self.matrix_local = Matrix.Translation (head)
+		self.matrix = Matrix.Identity (3)
+
+class PoseBone:
+	def __init__ (self, name, scene, head, parent, freq):
+		self.name = name
+		self.scene = scene
+		self.parent = parent
+		self.children = []
+		self.matrix = Matrix.Translation (head)
+		self.freq = freq
+		self.constraints = []
+		self.rotation_mode = 'XYZ'
+		self.rotation_euler = (0.0, 0.0, 0.0)
+		self.location = (0.0, 0.0, 0.0)
+
+	#Animated bones wobble about a little, the rest stay put
+	@property
+	def matrix_basis (self):
+		t = self.scene.time
+		if 0 == self.freq:
+			m = Matrix.Identity (4)
+		else:
+			e = Euler ((0.3*math.sin (self.freq*t), 0.2*math.cos (self.freq*t), 0.0))
+			m = e.to_matrix ().to_4x4 ()
+		if self.parent is None:
+			m.rows[2][3] = 0.1*math.sin (t)
+		return m
+
+#Evaluates to the same wobble as matrix_basis, as the action would
+class FCurve:
+	def __init__ (self, data_path, array_index, fn):
+		self.data_path = data_path
+		self.array_index = array_index
+		self.mute = False
+		self.fn = fn
+		self.evaluations = 0
+
+	def evaluate (self, t):
+		self.evaluations += 1
+		return self.fn (t)
+
+def bone_curves (pb):
+	path = 'pose.bones["{0}"].'.format (pb.name)
+	out = []
+	if pb.freq:
+		f = pb.freq
+		out.append (FCurve (path + 'rotation_euler', 0, lambda t: 0.3*math.sin (f*t)))
+		out.append (FCurve (path + 'rotation_euler', 1, lambda t: 0.2*math.cos (f*t)))
+	if pb.parent is None:
+		out.append (FCurve (path + 'location', 2, lambda t: 0.1*math.sin (t)))
+	return out
+
+#A chain of bones running up the Z axis, or a tree with each bone parent
+#to up to branching others. Bones with an odd index are animated, so half
+#of them survive elision
+def armature (scene, nbones, height = 2.0, branching = 1):
+	arm = Object ('Armature', 'ARMATURE')
+	arm.data = types.SimpleNamespace (bones = {})
+	arm.pose = types.SimpleNamespace (bones = [], bone_groups = [])
+	for b in range (nbones):
+		name = 'bone{0}'.format (b)
+		head = (0.1*((b - 1)%branching) if b else 0.0, 0.0, height*b/nbones)
+		parent = arm.pose.bones[(b - 1)//branching] if b else None
+		pb = PoseBone (name, scene, head, parent, 0.1*(b%7 + 1) if b%2 else 0)
+		if parent is not None:
+			parent.children.append (pb)
+		arm.pose.bones.append (pb)
+		arm.data.bones[name] = Bone (name, head)
+
+	#Blender keeps pose bones depth first, each parent before its children
+	def depth_first (pb):
+		yield pb
+		for ch in pb.children:
+			yield from depth_first (ch)
+	arm.pose.bones = list (depth_first (arm.pose.bones[0]))
+	action = types.SimpleNamespace (fcurves = [c for pb in arm.pose.bones for c in bone_curves (pb)])
+	arm.animation_data = types.SimpleNamespace (action = action, drivers = [], nla_tracks = [])
+	scene.objects.append (arm)
+	return arm
+
+#An armature with a cylinder of roughly ntris triangles skinned to it,
+#every vertex weighted between its two nearest bones
+#Stands in for an Armature modifier with the skeleton out of its rest pose:
+#the evaluated mesh leans over, further the higher up it is
+def posed (mesh):
+	out = Mesh (mesh.name)
+	out.materials = mesh.materials
+	out.polygons = mesh.polygons
+	out.loops = mesh.loops
+	out.uv_layers = mesh.uv_layers
+	for v in mesh.vertices:
+		co = Vector ((v.co[0] + 0.25*v.co[2], v.co[1], v.co[2]))
+		out.vertices.append (Vertex (v.index, co, v.normal, v.groups))
+	return out
+
+def skinned (ntris, nbones, seed = 1, branching = 1):
+	scene = Scene ()
+	arm = armature (scene, nbones, branching = branching)
+	height = 2.0
+
+	ring = max (3, int (math.sqrt (ntris/2)))
+	rows = max (1, ntris//(2*ring))
+	mesh = Mesh ('body')
+	mesh.materials = [Material ('skin')]
+	for j in range (rows + 1):
+		z = height*j/rows*0.999
+		t = z/height*nbones - 0.5
+		b0 = max (0, min (nbones - 1, int (math.floor (t))))
+		b1 = min (nbones - 1, b0 + 1)
+		w1 = max (0.0, min (1.0, t - b0))
+		for i in range (ring):
+			a = 2*math.pi*i/ring
+			n = Vector ((math.cos (a), math.sin (a), 0.0))
+			groups = [Group (b0, 1.0 - w1)]
+			if b1 != b0 and w1 > 0.0:
+				groups.append (Group (b1, w1))
+			else:
+				groups[0].weight = 1.0
+			mesh.vertices.append (Vertex (len (mesh.vertices), Vector ((0.2*n[0], 0.2*n[1], z)), n, groups))
+
+	for j in range (rows):
+		for i in range (ring):
+			k = (i + 1)%ring
+			a = j*ring + i
+			b = j*ring + k
+			c = a + ring
+			d = b + ring
+			#The last column wraps round, giving the cylinder a UV seam
+			u0 = i/ring
+			u1 = (i + 1)/ring
+			v0 = j/rows
+			v1 = (j + 1)/rows
+			mesh.add_triangle ((a, b, d), ((u0, v0), (u1, v0), (u1, v1)))
+			mesh.add_triangle ((a, d, c), ((u0, v0), (u1, v1), (u0, v1)))
+
+	body = Object ('Body', 'MESH', mesh)
+	body.parent = arm
+	body.vertex_groups = [types.SimpleNamespace (name = b.name, index = i) for i, b in enumerate (arm.pose.bones)]
+	body.modifiers.append (posed)
+	scene.objects.append (body)
+
+	ctx = Context (scene)
+	ctx.active_object = arm
+	return ctx
+
+#An armature with a clip of nframes frames and a few events
+def clip (nframes, nbones):
+	scene = Scene ()
+	arm = armature (scene, nbones)
+	scene.frame_start = 1
+	scene.frame_end = nframes + 1
+	for f in range (1, nframes, max (1, nframes//4)):
+		scene.timeline_markers.append (types.SimpleNamespace (frame = f, name = 'step'))
+	ctx = Context (scene)
+	ctx.active_object = arm
+	return ctx
@@ -0,0 +1,153 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Compressed container for .level, .tm and .ta files. The wrapped file is
+#kept byte for byte; it is cut into its sections, and every section into
+#fixed size chunks that are compressed on their own, so a reader can
+#inflate any chunk independently and in parallel:
+#
+#	<4s  'TRZC'
+#	<2I  version, codec
+#	<4s  magick of the wrapped file
+#	<3I  chunk size, nsections, nchunks
+#	<4s4I per section: tag, offset, size (in the wrapped file), first chunk, nchunks
+#	<2I  per chunk: offset into the container, packed size
+#	chunk data
+#
+#A chunk whose packed size equals its unpacked size is stored as is.
+import concurrent.futures
+import lzma
+import os
+import time
+import zlib
+from struct import pack, calcsize
+
+MAGICK = 'TRZC'.encode ('utf-8')
+CONTAINER_VERSION = 0x20261019
+
+#Codecs
+STORE = 0
+ZLIB = 1
+LZMA = 2
+CODECS = {'NONE': STORE, 'ZLIB': ZLIB, 'LZMA': LZMA}
+
+#Small enough that a level spreads over every core, large enough that
+#the codecs still find their matches
+CHUNK_SIZE = 256*1024
+
+HEADER = '<4s2I4s3I'
+SECTION = '<4s4I'
+CHUNK = '<2I'
+
+def compress (data, codec):
+	if ZLIB == codec:
+		packed = zlib.compress (data, 9)
+	elif LZMA == codec:
+		packed = lzma.compress (data, preset=6)
+	else:
+		return data
+	#Keep whatever is smaller, the reader tells them apart by size
+	if len (packed) >= len (data):
+		return data
+	return packed
+
+def decompress (data, size, codec):
+	if len (data) == size or STORE == codec:
+		return data
+	if ZLIB == codec:
+		return zlib.decompress (data)
+	return lzma.decompress (data)
+
+class Stats:
+	def __init__ (self, tag, raw):
+		self.tag = tag
+		self.raw = raw
+		self.packed = 0
+		self.pack_time = 0.0
+		#Left None unless the chunks were inflated again to time it
+		self.unpack_time = None
+
+	def ratio (self):
+		return self.raw/max (self.packed, 1)
+
+#Packs a list of (tag, bytes) sections that make up a file starting with
+#the given magick. Chunks are compressed on a thread pool; zlib and lzma
+#both let go of the GIL while they work. Returns the container and a list
+#of statistics per section. Measuring inflates every chunk again to time
+#the reader's side as well, so the exporters only ask for it when profiling;
+#`python -m reader --bench` times inflating on its own
+def pack_container (magick, sections, codec, chunk_size = CHUNK_SIZE, threads = None, measure = False):
+	chunks = []
+	table = []
+	stats = []
+	ofs = 0
+	for tag, data in sections:
+		tag = tag.encode ('ascii')
+		first = len (chunks)
+		view = memoryview (data)
+		for i in range (0, len (data), chunk_size):
+			chunks.append ((len (stats), view[i:i + chunk_size]))
+		table.append ((tag, ofs, len (data), first, len (chunks) - first))
+		stats.append (Stats (tag.decode ('ascii'), len (data)))
+		if measure:
+			stats[-1].unpack_time = 0.0
+		ofs += len (data)
+
+	#Time each chunk where it runs, so the totals are CPU time per section
+	def work (chunk):
+		start = time.perf_counter ()
+		packed = compress (bytes (chunk[1]), codec)
+		mid = time.perf_counter ()
+		if not measure:
+			return packed, mid - start, None
+		decompress (packed, len (chunk[1]), codec)
+		return packed, mid - start, time.perf_counter () - mid
+
+	with concurrent.futures.ThreadPoolExecutor (threads or os.cpu_count ()) as pool:
+		packed = list (pool.map (work, chunks))
+
+	ofs = calcsize (HEADER) + calcsize (SECTION)*len (table) + calcsize (CHUNK)*len (chunks)
+	out = pack (HEADER, MAGICK, CONTAINER_VERSION, codec, magick, chunk_size, len (table), len (chunks))
+	for s in table:
+		out += pack (SECTION, *s)
+	for (sec, chunk), (data, t0, t1) in zip (chunks, packed):
+		out += pack (CHUNK, ofs, len (data))
+		ofs += len (data)
+		s = stats[sec]
+		s.packed += len (data)
+		s.pack_time += t0
+		if t1 is not None:
+			s.unpack_time += t1
+	out += bytes ().join (p[0] for p in packed)
+	return out, stats
+
+def report (stats):
+	out = 'Compression:\n'
+	raw = 0
+	packed = 0
+	for s in stats:
+		mb = s.raw/(1024*1024)
+		out += '\t{0}: {1} -> {2} bytes ({3:.2f}:1), pack {4:.1f} MiB/s'.format (
+			s.tag, s.raw, s.packed, s.ratio (), mb/max (s.pack_time, 1e-9))
+		if s.unpack_time is not None:
+			out += ', unpack {0:.1f} MiB/s'.format (mb/max (s.unpack_time, 1e-9))
+		out += '\n'
+		raw += s.raw
+		packed += s.packed
+	out += '\ttotal: {0} -> {1} bytes ({2:.2f}:1)'.format (raw, packed, raw/max (packed, 1))
+	return out
@@ -0,0 +1,133 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Binary entity table. Everything is fixed size and referenced by index so
+#that the engine can use the section straight off the disk:
+#
+#	<2I version, nstrings
+#	<I  offset of each string into the blob
+#	<I  size of the blob, then the blob of NUL terminated UTF-8 strings
+#	<2I nentities, nprops
+#	<4I per entity: type, name (string ids), first prop, prop count
+#	<3I3f per prop: key hash, key (string id), value type, value
+#	<I  ntypes, then <3I per type: type (string id), first entity, count
+#
+#Entities are sorted by type, so the index gives a contiguous run of each.
+from struct import pack
+import binascii
+
+ENTITY_VERSION = 0x20261019
+
+#Value types
+INT = 0
+FLOAT = 1
+VEC3 = 2
+STRING = 3
+
+def hash_key (key):
+	return binascii.crc32 (key.encode ('utf-8'))
+
+#Deduplicated string table
+class Strings:
+	def __init__ (self):
+		self.tbl = {}
+		self.list = []
+
+	def intern (self, s):
+		id = self.tbl.get (s)
+		if id is None:
+			id = len (self.list)
+			self.tbl[s] = id
+			self.list.append (s)
+		return id
+
+	def pack (self):
+		offsets = bytes ()
+		blob = bytes ()
+		for s in self.list:
+			offsets += pack ('<I', len (blob))
+			blob += s.encode ('utf-8') + b'\0'
+		#Keep whatever follows aligned
+		blob += bytes (-len (blob)%4)
+		return pack ('<I', len (self.list)) + offsets + pack ('<I', len (blob)) + blob
+
+#Figures out the type of a custom property from its Python value.
+#Returns the type and the three value slots to store
+def infer (value, strings):
+	if isinstance (value, (bool, int)):
+		return INT, pack ('<i8x', int (value))
+	if isinstance (value, float):
+		return FLOAT, pack ('<f8x', value)
+	if isinstance (value, str):
+		return STRING, pack ('<I8x', strings.intern (value))
+
+	#ID property arrays and vectors
+	if hasattr (value, 'to_list'):
+		value = value.to_list ()
+	try:
+		items = list (value)
+	except TypeError:
+		items = None
+	if items is not None and 3 == len (items) and all (isinstance (x, (int, float)) for x in items):
+		return VEC3, pack ('<3f', *items)
+
+	#Anything else is kept around in its textual form
+	return STRING, pack ('<I8x', strings.intern (str (value)))
+
+class Table:
+	def __init__ (self, strings):
+		self.strings = strings
+		self.entities = []
+
+	def add (self, type, props):
+		self.entities.append ((type, props))
+
+	def pack (self):
+		s = self.strings
+
+		#Sort by type so each type is one contiguous run
+		ents = sorted (self.entities, key=lambda e: e[0])
+
+		records = bytes ()
+		props = bytes ()
+		nprops = 0
+		index = []
+		for i, (type, kv) in enumerate (ents):
+			tid = s.intern (type)
+			if 0 == len (index) or index[-1][0] != type:
+				index.append ([type, i, 0])
+			index[-1][2] += 1
+
+			first = nprops
+			for k, v in kv.items ():
+				vtype, value = infer (v, s)
+				props += pack ('<3I', hash_key (k), s.intern (k), vtype) + value
+				nprops += 1
+
+			name = s.intern (str (kv.get ('name', '')))
+			records += pack ('<4I', tid, name, first, nprops - first)
+
+		types = pack ('<I', len (index))
+		for type, first, count in index:
+			types += pack ('<3I', s.intern (type), first, count)
+
+		#Strings go last in the code but first in the file, since everything
+		#above may still intern new ones
+		data = pack ('<I', ENTITY_VERSION) + s.pack ()
+		data += pack ('<2I', len (ents), nprops) + records + props + types
+		return data
@@ -1,4 +1,7 @@
+import concurrent.futures
+import heapq
 import math
+import os
 
 class Edge:
 	def __init__ (self):
@@ -54,20 +57,57 @@ class Graph:
 		self.faces = []
 		self.tbl = {}
 		self.built = False
+		#Callers hand in their own tracing here, Export.trace for instance
+		self.log = None
+	
+	def trace (self, text, *args):
+		if self.log is not None:
+			self.log (text, *args)
 		
 	def add_polygon (self, loop, attributes = None):
-		self.faces.append (Polygon (loop, self.tbl, attributes))
-		
-	def remove_polygon (self, facep):
-		#Remove links to this face from the neighbours
-		edge = face.head.next
-		while edge is not face.head:
+		p = Polygon (loop, self.tbl, attributes)
+		self.faces.append (p)
+		#Graphs that are already built are kept linked as they change
+		if self.built:
+			self.link (p)
+		return p
+	
+	#Links a new polygon to the unlinked edges running the other way
+	def link (self, p):
+		n = p.head
+		while True:
+			a = n.ndx
+			b = n.next.ndx
+			for e in self.tbl.get (b, []):
+				if e.twin is None and e.poly is not p and a == e.next.ndx:
+					n.twin = e
+					e.twin = n
+					p.neighbours += 1
+					e.poly.neighbours += 1
+					break
+			
+			n = n.next
+			if n is p.head:
+				break
+	
+	def remove_polygon (self, face):
+		#Remove links to this face from the neighbours, and its edges
+		#from the edge table
+		edge = face.head
+		while True:
 			if edge.twin is not None:
 				edge.twin.poly.neighbours -= 1
 				edge.twin.twin = None
 				edge.twin = None
+			edges = self.tbl[edge.ndx]
+			edges.remove (edge)
+			if not edges:
+				del self.tbl[edge.ndx]
 			
 			edge = edge.next
+			if edge is face.head:
+				break
+		self.faces.remove (face)
 		
 		#Zero out the neighbours
 		face.neighbours = 0
@@ -115,117 +155,280 @@ class Graph:
 		self.built = True
 		
 		#Debugging information
-		print ('Graph Linked: {0}'.format (linked))
+		self.trace ('Graph Linked: {0}', linked)
 	
+#Strip search. Every strip is tried from this many of the least connected
+#faces, leaving through each of their edges, and every step looks this many
+#faces ahead before picking which edge to leave by
+STRIP_STARTS = 4
+STRIP_LOOKAHEAD = 3
+#Leaving by the other edge costs a swap, one repeated index. Weighed in
+#faces so a swap is only taken when it buys a longer run
+SWAP_COST = 0.5
+#Shorter strips go in with the islands; they would cost as many bytes
+MIN_STRIP = 3
+#Meshes with fewer faces are stripified in process, starting a pool would
+#cost more than it saves
+PARALLEL_FACES = 20000
+
 class Meshifier(Graph):
-	def build (self):
-		#Ensure that the graph is built
-		super ().build ()
-			
-		def minimal (h):
-			if len (h) == 0:
-				return None
-			return min (h, key = lambda e: e.neighbours)
+	#Corners of every triangle in winding order, and for each the face on
+	#the far side of each of its edges
+	def corners (self):
+		ids = {id (p): i for i, p in enumerate (self.faces)}
+		self.verts = []
+		self.across = []
+		for p in self.faces:
+			verts = []
+			across = {}
+			edge = p.head
+			while True:
+				verts.append ((edge.ndx, edge.attribute))
+				if edge.twin is not None:
+					across[(edge.ndx, edge.next.ndx)] = ids[id (edge.twin.poly)]
+				edge = edge.next
+				if edge is p.head:
+					break
+			self.verts.append (verts)
+			self.across.append (across)
+	
+	#Returns the untaken face across the edge x, y of face f and the corner
+	#it adds, or None
+	def step (self, f, x, y, taken, inside):
+		across = self.across[f]
+		g = across.get ((x, y))
+		if g is None:
+			g = across.get ((y, x))
+		if g is None or taken[g] or g in inside or 3 != len (self.verts[g]):
+			return None, None
+		for c in self.verts[g]:
+			if c[0] != x and c[0] != y:
+				return g, c
+		return None, None
+	
+	#How many faces can be strung on entering from f across x, y, looking
+	#depth faces ahead
+	def reach (self, f, x, y, depth, taken, inside):
+		if 0 == depth:
+			return 0.0
+		g, w = self.step (f, x, y, taken, inside)
+		if g is None:
+			return 0.0
+		inside.add (g)
+		best = self.reach (g, y, w[0], depth - 1, taken, inside)
+		#A swap can only win if going straight on falls short
+		if best < depth - 1 - SWAP_COST:
+			best = max (best, self.reach (g, x, w[0], depth - 1, taken, inside) - SWAP_COST)
+		inside.discard (g)
+		return 1.0 + best
+	
+	#Untaken neighbours of the face across x, y. Between equally long runs
+	#the one into the less connected face strands fewer faces
+	def lonely (self, f, x, y, taken, inside):
+		g, w = self.step (f, x, y, taken, inside)
+		if g is None:
+			return 4
+		return self.degree[g]
+
+	#Carries a strip on for as long as it can. The last two indices are
+	#always the edge into the next face; leaving that face by its other
+	#edge instead repeats the index before last, which keeps the winding
+	def extend (self, strip, path, inside, taken):
+		swaps = 0
+		while True:
+			p, q = strip[-2], strip[-1]
+			g, w = self.step (path[-1], p[0], q[0], taken, inside)
+			if g is None:
+				return swaps
+			inside.add (g)
+			#Only look ahead when there is a choice to make
+			if self.step (g, p[0], w[0], taken, inside)[0] is not None:
+				turn = True
+				if self.step (g, q[0], w[0], taken, inside)[0] is not None:
+					ahead = self.reach (g, q[0], w[0], STRIP_LOOKAHEAD, taken, inside)
+					turn = False
+					if ahead < STRIP_LOOKAHEAD - SWAP_COST:
+						turn = (self.reach (g, p[0], w[0], STRIP_LOOKAHEAD, taken, inside) - SWAP_COST,
+							-self.lonely (g, p[0], w[0], taken, inside)) > (ahead,
+							-self.lonely (g, q[0], w[0], taken, inside))
+				if turn:
+					strip.append (p)
+					swaps += 1
+			strip.append (w)
+			path.append (g)
+	
+	#Grows a strip through face f both ways, starting out by its k-th edge
+	def walk (self, f, k, taken):
+		v = self.verts[f]
+		strip = [v[(k + 2)%3], v[k], v[(k + 1)%3]]
+		path = [f]
+		inside = {f}
+		swaps = self.extend (strip, path, inside, taken)
+		
+		#Then turn it round and carry on out of the first edge. A strip
+		#only keeps its winding backwards if it has an even count, so odd
+		#ones get the last index repeated first
+		if self.step (f, v[k][0], v[(k + 2)%3][0], taken, inside)[0] is not None:
+			if len (strip)%2:
+				strip.append (strip[-1])
+				swaps += 1
+			strip.reverse ()
+			path.reverse ()
+			swaps += self.extend (strip, path, inside, taken)
+		return strip, path, swaps
+	
+	#Connected components by union-find over the face links, each as its
+	#faces in order, ordered by their first face
+	def components (self):
+		parent = list (range (len (self.faces)))
+		def find (f):
+			while parent[f] != f:
+				parent[f] = parent[parent[f]]
+				f = parent[f]
+			return f
+		for f, across in enumerate (self.across):
+			for g in across.values ():
+				a, b = find (f), find (g)
+				if a != b:
+					parent[max (a, b)] = min (a, b)
+		groups = {}
+		for f in range (len (self.faces)):
+			groups.setdefault (find (f), []).append (f)
+		return list (groups.values ())
+	
+	#Greedily strings the given faces into strips. Returns the strips, the
+	#faces left over as islands and the faces and swaps of every strip
+	def stripify (self, faces):
+		taken = self.taken
+		degree = self.degree
+		#Faces by untaken neighbours; entries go stale as faces are taken
+		#and are skipped when popped
+		heaps = [[] for d in range (4)]
+		for f in faces:
+			heapq.heappush (heaps[min (degree[f], 3)], f)
 		
-		#A min heap might be faster here, but for now this works fine
-		heap = self.faces.copy ()
+		def pop ():
+			for d, h in enumerate (heaps):
+				while h:
+					f = heapq.heappop (h)
+					if not taken[f] and min (degree[f], 3) == d:
+						return f
+			return None
 		
-		#Begin the algorithm proper
 		strips = []
 		islands = []
+		runs = []
 		while True:
-			#Pull out the lowest neighbour'd face
-			face = minimal (heap)
-			if None is face:
-				break
-			
-			#Sort islands into their own set
-			if 0 == face.neighbours:
-				islands.append (face)
-				continue
-			
-			#Walk through the neighbours for as long as possible to assemble
-			#a nice tristrip
-			print ('Generating edge list...')
-			strip = []
-			while True:
-				#Remove this face from the heap
-				face.neigbhours = -1
-				heap.remove (face)
-				#Pick the neighbour face with the most other neighbours
-				count = 0
-				next = None
-				next_face = None
-				next_twin = None
-				edge = face.head
-				while True:
-					#Ensure that this edge is connected to an adjacent face
-					twin = edge.twin
-					if twin is not None:			
-						#Save this edge if its the most connected
-						other = twin.poly	
-						degree = other.neighbours
-						if degree >= count:
-							count = degree
-							next_face = other
-							next_twin = twin
-							next = edge
-						
-						#Unlink this face from neighbour
-						other.neighbours -= 1
-						twin.twin = None
-						edge.twin = None
-						
-					#Search the next edge
-					edge = edge.next
-					if edge is face.head:
-						break
-				
-				#Continue into the selected neighbour until we exhaust
-				#all possible connections
-				if next is None:
+			#Try the least connected faces first, they are the hardest to
+			#pick up later
+			starts = []
+			while len (starts) < STRIP_STARTS:
+				f = pop ()
+				if f is None:
 					break
-				
-				#Relink edge and append it to the list
-				next.twin = next_twin
-				strip.append (next)
-				
-				#Advance into the chosen face
-				face = next_face	
-			
-			#Digest the strip into index values
-			print ("Digesting edge list...")
-			indices = []
-			curr = strip[0]
-			
-			#Append the initial indices into the list
-			indices.append ((curr.next.ndx, curr.next.attribute))
-			indices.append ((curr.prev.ndx, curr.prev.attribute))
-			indices.append ((curr.ndx, curr.attribute))
+				if f not in starts:
+					starts.append (f)
+			if not starts:
+				break
 			
-			#Append the rest of the supporting points
-			for i in range (len (strip)):
-				curr = strip[i]
-				indices.append ((curr.twin.prev.ndx, curr.twin.prev.attribute))
+			best = None
+			if degree[starts[0]] > 0:
+				for f in starts:
+					for k in range (3):
+						strip, path, swaps = self.walk (f, k, taken)
+						#Longest wins, then the fewest swaps
+						if best is None or (len (path), -swaps) > (len (best[1]), -best[2]):
+							best = (strip, path, swaps)
+			if best is None or len (best[1]) < MIN_STRIP:
+				best = ([], [starts[0]], 0)
 			
-			#Store the strip, then restart the algorithm to get another strip.
-			#We loop until the graph cannot be decomposed any further into strips
-			strips.append (indices)
+			strip, path, swaps = best
+			for f in path:
+				taken[f] = True
+				for g in self.across[f].values ():
+					if not taken[g]:
+						degree[g] -= 1
+						heapq.heappush (heaps[min (degree[g], 3)], g)
+			for f in starts:
+				if not taken[f]:
+					heapq.heappush (heaps[min (degree[f], 3)], f)
 			
-			#Print nice debugging information
-			print ('\tStrip: {0} ({1} edge(s))'.format (len (indices), len (strip)))
+			if strip:
+				strips.append (strip)
+				runs.append ((len (path), swaps))
+			else:
+				islands.append (path[0])
+		return strips, islands, runs
+	
+	#Components are independent, so big meshes stripify them in a process
+	#pool. Workers only get the corners and links of their faces, the edge
+	#graph does not pickle
+	def build (self, workers = None):
+		#Ensure that the graph is built
+		super ().build ()
+		self.corners ()
+		
+		n = len (self.faces)
+		self.taken = n*[False]
+		self.degree = [len (a) if 3 == len (v) else 0 for v, a in zip (self.verts, self.across)]
+		
+		#Faces with no neighbours can only be islands
+		islands = []
+		jobs = []
+		for c in self.components ():
+			if 1 == len (c):
+				islands.append (c[0])
+			else:
+				jobs.append (c)
+		
+		results = None
+		workers = workers or os.cpu_count () or 1
+		if n >= PARALLEL_FACES and len (jobs) > 1 and workers > 1:
+			results = self.pool (jobs, workers)
+		if results is None:
+			results = [self.stripify (c) for c in jobs]
+		
+		#Merge in component order, whichever way they were made
+		strips = []
+		nswaps = 0
+		for s, i, runs in results:
+			strips += s
+			islands += i
+			for strip, (nfaces, swaps) in zip (s, runs):
+				nswaps += swaps
+				self.trace ('\tStrip: {0} ({1} face(s), {2} swap(s))', len (strip), nfaces, swaps)
 		
 		#Generate indices for the islands
 		tri_indices = []
 		for t in islands:
-			edge = t.head
-			while True:
-				tri_indices.append ((edge.ndx, edge.attribute))
-				edge = edge.next
-				if edge is t.head:
-					break
+			tri_indices += self.verts[t]
 			
 		#Compute some statistics
+		if self.log is not None:
+			self.trace ('\tSwaps: {0}', nswaps)
+			self.statistics (strips, islands)
+		
+		#Return the strips and islands
+		return strips, tri_indices
+	
+	#Stripifies the components in worker processes, or returns None if
+	#processes cannot be started here
+	def pool (self, jobs, workers):
+		payload = []
+		for c in jobs:
+			local = {f: i for i, f in enumerate (c)}
+			payload.append (([self.verts[f] for f in c],
+				[{k: local[g] for k, g in self.across[f].items ()} for f in c]))
+		try:
+			with concurrent.futures.ProcessPoolExecutor (workers) as pool:
+				out = list (pool.map (stripify_component, payload,
+					chunksize=max (1, len (payload)//(4*workers))))
+		except (OSError, RuntimeError) as e:
+			self.trace ('Stripifying in process: {0}', e)
+			return None
+		return [(s, [c[i] for i in isl], runs) for c, (s, isl, runs) in zip (jobs, out)]
+	
+	def statistics (self, strips, islands):
 		sum = 0
 		mem_strip = 0
 		longest = -math.inf
@@ -239,26 +442,33 @@ class Meshifier(Graph):
 			sum += l
 			mem_strip += l
 		
-		avg = sum/len (strips)
+		avg = sum/max (len (strips), 1)
 		
 		#Using 16 bit indices
 		mem_strip *= 2
 		mem_islands = 3*2*len (islands)
 		mem_tris = 3*2*len (self.faces)
 		
-		print ('Statistics')
-		print ('\tTotal strips: {0}'.format (len (strips)))
-		print ('\tLongest run: {0} indices'.format (longest))
-		print ('\tShortest run: {0} indices'.format (shortest))
-		print ('\tAverage strip run: {0} indices'.format (avg))
-		print ('\tNumber of islands: {0} tris'.format (len (islands)))
-		print ('--Memory Usage--')
-		print ('\tTristrip usage: {0} bytes ({1} kib)'.format (mem_strip, mem_strip/1024))
-		print ('\tTriangles usage: {0} bytes ({1} kib)'.format (mem_tris, mem_tris/1024))
-		print ('\tSavings: {0}%'.format (100 - 100*(mem_strip + mem_islands)/mem_tris))
-		#Return the strips and islands
-		return strips, tri_indices
+		self.trace ('Statistics')
+		self.trace ('\tTotal strips: {0}', len (strips))
+		self.trace ('\tLongest run: {0} indices', longest)
+		self.trace ('\tShortest run: {0} indices', shortest)
+		self.trace ('\tAverage strip run: {0} indices', avg)
+		self.trace ('\tNumber of islands: {0} tris', len (islands))
+		self.trace ('--Memory Usage--')
+		self.trace ('\tTristrip usage: {0} bytes ({1} kib)', mem_strip, mem_strip/1024)
+		self.trace ('\tTriangles usage: {0} bytes ({1} kib)', mem_tris, mem_tris/1024)
+		self.trace ('\tSavings: {0}%', 100 - 100*(mem_strip + mem_islands)/max (mem_tris, 1))
 	
+#Stripifies one connected component in a worker process, from the corners
+#and links of its faces renumbered from zero
+def stripify_component (payload):
+	m = Meshifier ()
+	m.verts, m.across = payload
+	m.taken = len (m.verts)*[False]
+	m.degree = [len (a) if 3 == len (v) else 0 for v, a in zip (m.verts, m.across)]
+	return m.stripify (range (len (m.verts)))
+
 #Generates a collision mesh from a graph
 class Cpoly:
 	def __init__ (self, loop, flags):
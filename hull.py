@@ -0,0 +1,261 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Convex collision proxies. Props are rarely worth testing against triangle
+#by triangle; a convex hull, or a handful of them for shapes with dents,
+#answers the same queries with a few plane tests. Hulls are built with
+#quickhull, and simplified by stopping once the points left outside are
+#close enough or the vertex budget is spent. Decompositions cut the mesh
+#in two along whichever axis leaves the shallowest dents until every
+#piece is convex enough
+import heapq
+import itertools
+import numpy as np
+
+HULL_VERSION = 0x20261019
+
+#Vertices a hull may keep, so the engine can index them with a byte
+MAX_VERTICES = 255
+#Hulls stop growing once no point is further outside than this fraction
+#of the mesh's diagonal
+TOLERANCE = 0.01
+#Hulls a decomposition may use
+MAX_HULLS = 16
+#Pieces are convex enough once no point of their surface lies deeper
+#inside their hull than this fraction of the mesh's diagonal
+CONCAVITY = 0.05
+#Points nearer a face than this fraction of the diagonal are on it
+EPSILON = 1e-6
+
+class Hull:
+	def __init__ (self, verts, planes, error):
+		self.verts = verts
+		#Normal and distance of every face, inside where n.p <= d. These
+		#hold every point, even those the vertices leave out
+		self.planes = planes
+		#How far the furthest point left out lies outside the vertices
+		self.error = error
+
+	#How deep each point lies inside the hull, negative outside
+	def depth (self, points):
+		return (self.planes[:, 3][None, :] - points @ self.planes[:, 0:3].T).min (axis=1)
+
+class Face:
+	def __init__ (self, key, v, normal, distance):
+		#Numbered in order made, so ties always break the same way
+		self.key = key
+		self.v = v
+		self.normal = normal
+		self.distance = distance
+		self.outside = None
+		self.far = 0.0
+
+#Convex hull of some points. Stops adding vertices once none is left
+#further than tolerance outside, or max_verts have gone in. Raises
+#ValueError for points that do not span a volume
+def quickhull (points, max_verts = MAX_VERTICES, tolerance = 0.0):
+	pts = np.unique (np.asarray (points, dtype=np.float64).reshape (-1, 3), axis=0)
+	if len (pts) < 4:
+		raise ValueError ('fewer than four distinct points')
+	eps = EPSILON*max (float (np.linalg.norm (np.ptp (pts, axis=0))), 1e-12)
+	tolerance = max (tolerance, eps)
+
+	#Start from the two extremes furthest apart, then the points furthest
+	#from their line and from the plane through all three
+	ext = np.concatenate ((pts.argmin (axis=0), pts.argmax (axis=0)))
+	d = np.linalg.norm (pts[ext][:, None] - pts[ext][None, :], axis=2)
+	i, j = np.unravel_index (d.argmax (), d.shape)
+	a, b = int (ext[i]), int (ext[j])
+	ab = pts[b] - pts[a]
+	c = int (np.linalg.norm (np.cross (pts - pts[a], ab), axis=1).argmax ())
+	n = np.cross (ab, pts[c] - pts[a])
+	if np.linalg.norm (n) <= eps*np.linalg.norm (ab):
+		raise ValueError ('points are on a line')
+	h = (pts - pts[a]) @ (n/np.linalg.norm (n))
+	e = int (np.abs (h).argmax ())
+	if abs (h[e]) <= eps:
+		raise ValueError ('points are flat')
+
+	faces = {}
+	#Directed edge -> the face it belongs to
+	edges = {}
+	#Faces with points outside, furthest first
+	queue = []
+	serial = itertools.count ()
+	def add (v):
+		f = Face (next (serial), v, None, 0.0)
+		n = np.cross (pts[v[1]] - pts[v[0]], pts[v[2]] - pts[v[0]])
+		f.normal = n/max (np.linalg.norm (n), 1e-300)
+		f.distance = float (f.normal @ pts[v[0]])
+		faces[f.key] = f
+		for k in range (3):
+			edges[(v[k], v[(k + 1)%3])] = f
+		return f
+
+	#Hands points to the face they are furthest outside of, if any
+	def assign (candidates, new):
+		if not len (candidates) or not new:
+			return
+		normals = np.array ([f.normal for f in new])
+		dist = pts[candidates] @ normals.T - np.array ([f.distance for f in new])[None, :]
+		best = dist.argmax (axis=1)
+		keep = dist[np.arange (len (candidates)), best] > eps
+		for k, f in enumerate (new):
+			mine = keep & (best == k)
+			if mine.any ():
+				f.outside = candidates[mine]
+				f.far = float (dist[mine, k].max ())
+				heapq.heappush (queue, (-f.far, f.key, f))
+
+	#Wind the simplex outwards
+	if h[e] > 0:
+		a, b = b, a
+	first = [add (v) for v in ((a, b, c), (a, c, e), (c, b, e), (b, a, e))]
+	assign (np.setdiff1d (np.arange (len (pts)), [a, b, c, e]), first)
+
+	used = {a, b, c, e}
+	error = 0.0
+	while True:
+		#The point furthest out of all goes in next. Faces since replaced
+		#are still queued, skip them
+		while queue and faces.get (queue[0][1]) is not queue[0][2]:
+			heapq.heappop (queue)
+		if not queue:
+			break
+		best = queue[0][2]
+		if best.far <= tolerance or len (used) >= max_verts:
+			error = best.far
+			break
+		dist = pts[best.outside] @ best.normal - best.distance
+		eye = int (best.outside[dist.argmax ()])
+		p = pts[eye]
+
+		#Every face the point sees, found walking out from the first
+		visible = {best.key: best}
+		stack = [best]
+		while stack:
+			f = stack.pop ()
+			for k in range (3):
+				g = edges[(f.v[(k + 1)%3], f.v[k])]
+				if g.key not in visible and g.normal @ p - g.distance > eps:
+					visible[g.key] = g
+					stack.append (g)
+
+		#Their rim is stitched to the new point
+		horizon = []
+		orphans = []
+		for f in visible.values ():
+			for k in range (3):
+				edge = (f.v[k], f.v[(k + 1)%3])
+				if edges[(edge[1], edge[0])].key not in visible:
+					horizon.append (edge)
+			if f.outside is not None:
+				orphans.append (f.outside)
+		for f in visible.values ():
+			del faces[f.key]
+			for k in range (3):
+				if edges.get ((f.v[k], f.v[(k + 1)%3])) is f:
+					del edges[(f.v[k], f.v[(k + 1)%3])]
+		new = [add ((i, j, eye)) for i, j in horizon]
+		used.add (eye)
+		if orphans:
+			orphans = np.concatenate (orphans)
+			assign (orphans[orphans != eye], new)
+
+	#Neighbours on the same plane share it in the output too
+	group = {k: k for k in faces}
+	def root (k):
+		while group[k] != k:
+			group[k] = group[group[k]]
+			k = group[k]
+		return k
+	for k, f in faces.items ():
+		for m in range (3):
+			g = edges[(f.v[(m + 1)%3], f.v[m])]
+			if f.normal @ g.normal > 1.0 - 1e-9 and abs (f.distance - g.distance) <= eps:
+				group[root (g.key)] = root (k)
+	planes = {}
+	for k, f in faces.items ():
+		planes.setdefault (root (k), np.append (f.normal, f.distance))
+	planes = list (planes.values ())
+	planes = np.array (planes)
+	keep = sorted ({v for f in faces.values () for v in f.v})
+
+	#Push every plane out to the furthest point, so the planes hold all of
+	#them even where simplifying left some out, or a sliver of a face got
+	#a poorly conditioned normal
+	planes[:, 3] = (planes[:, 0:3] @ pts.T).max (axis=1)
+	return Hull (pts[keep].astype (np.float32), planes.astype (np.float32), error)
+
+def diagonal (points):
+	return float (np.linalg.norm (np.ptp (points.reshape (-1, 3), axis=0)))
+
+#Simplified convex hull of the vertices of the given triangles, tolerance
+#being a fraction of their diagonal
+def hull (co, tris, tolerance = TOLERANCE, max_verts = MAX_VERTICES):
+	pts = np.asarray (co, dtype=np.float64)[np.unique (np.asarray (tris, dtype=np.int64))]
+	return quickhull (pts, max_verts, tolerance*diagonal (pts))
+
+#Approximate convex decomposition of a triangle mesh into at most
+#max_hulls hulls whose dents are no deeper than concavity times the mesh
+#diagonal. Returns the list of hulls; raises ValueError if the mesh is flat
+def decompose (co, tris, max_hulls = MAX_HULLS, concavity = CONCAVITY,
+	tolerance = TOLERANCE, max_verts = MAX_VERTICES):
+	co = np.asarray (co, dtype=np.float64)
+	tris = np.asarray (tris, dtype=np.int64).reshape (-1, 3)
+	centres = co[tris].mean (axis=1)
+	size = diagonal (co[tris])
+	limit = concavity*size
+
+	#A piece is its hull, its deepest dent and its triangles. Dents are
+	#measured at the corners and centre of every triangle
+	def piece (sel):
+		h = quickhull (co[tris[sel]], max_verts, tolerance*size)
+		samples = np.concatenate ((co[np.unique (tris[sel])], centres[sel]))
+		return h, float (h.depth (samples).max ()), sel
+
+	pieces = [piece (np.arange (len (tris)))]
+	done = []
+	while pieces and len (pieces) + len (done) < max_hulls:
+		k = max (range (len (pieces)), key = lambda i: pieces[i][1])
+		h, depth, sel = pieces[k]
+		if depth <= limit:
+			break
+
+		#Cut at the median, along the axis that leaves the shallower dents
+		best = None
+		for axis in range (3):
+			x = centres[sel, axis]
+			cut = np.median (x)
+			halves = (sel[x <= cut], sel[x > cut])
+			if not len (halves[0]) or not len (halves[1]):
+				continue
+			try:
+				halves = [piece (s) for s in halves]
+			except ValueError:
+				#One side is flat, a hull cannot hold it
+				continue
+			worst = max (s[1] for s in halves)
+			if best is None or worst < best[0]:
+				best = (worst, halves)
+		if best is None:
+			done.append (pieces.pop (k))
+		else:
+			pieces[k:k + 1] = best[1]
+	return [p[0] for p in pieces + done]
@@ -0,0 +1,325 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#In-place loadable level layout. The packed layout mixes length prefixed
+#names in with the vertex data, so nothing in it can be handed to the GPU
+#without copying. Here every array starts on an aligned boundary and is
+#reached through fixed size descriptors, names live in a string table at
+#the end, and a relocation table lists every pointer so the engine can
+#read or map the file in one go and turn offsets into addresses:
+#
+#	<4s3I    'SW3R', version, flags, alignment
+#	<2Q      meshes, nmeshes
+#	<2Q      world, nworld
+#	<2Q      entities, size
+#	<2Q      strings, size
+#	<2Q      relocations, nrelocations
+#	<2Q      navmesh, size
+#	per mesh:
+#	<3f3ffI  extents, centre, radius, nbuckets
+#	<3Q2IQ   buckets, collision, lods, nlods, nhulls, hulls
+#	per bucket:
+#	<3Q3I4f4x name, vertices, indices, nverts, nindices, index size, uv offset and scale
+#	per collision mesh:
+#	<3I4x3Q  nverts, nindices, npolys, vertices, indices, faces
+#	per LOD:
+#	<3fIQ    ratio, error, screen, nbuckets, buckets
+#	per hull:
+#	<2I2Q    nverts, nplanes, vertices, planes
+#	world graph nodes, as in the packed layout
+#	vertex, index, collision and hull arrays
+#	entities, as in the packed layout without the size
+#	the navmesh section as packed, see navmesh.py
+#	NUL terminated UTF-8 strings
+#	<Q       per pointer, its offset
+#
+#Pointers hold offsets from the start of the file, null ones are zero and
+#left out of the relocation table. Every pointer is 8 byte aligned, and
+#descriptors, world nodes, arrays and entities start on the alignment
+from struct import pack, pack_into, unpack_from, calcsize
+
+LEVEL_MAGICK = b'SW3R'
+#Matches texport
+VERSION_FLAGS = 0x20261019
+LEVEL_WELDED = 1<<0
+LEVEL_QUANTIZED = 1<<1
+LEVEL_LODS = 1<<2
+LEVEL_BINARY_ENTITIES = 1<<3
+LEVEL_ALIGNED = 1<<4
+LEVEL_HULLS = 1<<5
+LEVEL_NAVMESH = 1<<6
+
+ALIGNMENT = 16
+PAGE_SIZE = 4096
+
+HEADER = '<4s3I12Q'
+MESH = '<3f3ffI3Q2IQ'
+BUCKET = '<3Q3I4f4x'
+COLLISION = '<3I4x3Q'
+LOD = '<3fIQ'
+HULL = '<2I2Q'
+WORLD_NODE = 40
+
+#Bytes per vertex of a bucket
+VERTEX = 20
+QVERTEX = 10
+
+class Bucket:
+	def __init__ (self, name, nverts, nindices, isize, uvs, verts, indices):
+		self.name = name
+		self.nverts = nverts
+		self.nindices = nindices
+		self.isize = isize
+		self.uvs = uvs
+		self.verts = verts
+		self.indices = indices
+
+class Mesh:
+	def __init__ (self):
+		self.bounds = None
+		self.buckets = []
+		self.collision = None
+		self.lods = []
+		self.hulls = []
+
+#Walks the records of a packed level. names turns the string ids of
+#binary entity levels back into names
+class Packed:
+	def __init__ (self, flags, names = None):
+		self.welded = bool (flags & LEVEL_WELDED)
+		self.quantized = bool (flags & LEVEL_QUANTIZED)
+		self.names = names if flags & LEVEL_BINARY_ENTITIES else None
+
+	#Reads one material bucket, returning it and the offset past it
+	def bucket (self, data, ofs, welded):
+		if self.names is not None:
+			name = self.names[unpack_from ('<I', data, ofs)[0]]
+			ofs += 4
+		else:
+			n = unpack_from ('<I', data, ofs)[0]
+			name = bytes (data[ofs + 4:ofs + 4 + n]).decode ('utf-8')
+			ofs += 4 + n
+		if welded:
+			nverts, nindices, isize = unpack_from ('<3I', data, ofs)
+			ofs += 12
+		else:
+			nverts = unpack_from ('<I', data, ofs)[0]
+			nindices = isize = 0
+			ofs += 4
+		uvs = (0.0, 0.0, 0.0, 0.0)
+		size = VERTEX
+		if self.quantized:
+			uvs = unpack_from ('<4f', data, ofs)
+			ofs += 16
+			size = QVERTEX
+		verts = data[ofs:ofs + size*nverts]
+		ofs += size*nverts
+		indices = data[ofs:ofs + isize*nindices]
+		ofs += isize*nindices
+		return Bucket (name, nverts, nindices, isize, uvs, verts, indices), ofs
+
+	def meshes (self, geo):
+		data = memoryview (geo)
+		out = []
+		ofs = 4
+		for i in range (unpack_from ('<I', data)[0]):
+			m = Mesh ()
+			end = ofs + 4 + unpack_from ('<I', data, ofs)[0]
+			nbuckets, *m.bounds = unpack_from ('<I3f3ff', data, ofs + 4)
+			ofs += 36
+			for j in range (nbuckets):
+				b, ofs = self.bucket (data, ofs, self.welded)
+				m.buckets.append (b)
+			ofs = end
+			
+			nverts, nindices, npolys = unpack_from ('<3I', data, ofs + 4)
+			ofs += 16
+			verts = data[ofs:ofs + 12*nverts]
+			ofs += 12*nverts
+			indices = data[ofs:ofs + 2*nindices]
+			ofs += 2*nindices
+			faces = data[ofs:ofs + 4*npolys]
+			ofs += 4*npolys
+			m.collision = (nverts, nindices, npolys, verts, indices, faces)
+			out.append (m)
+		return out
+
+	#Hangs the LOD chains off the meshes they belong to
+	def lods (self, section, meshes):
+		data = memoryview (section)
+		ofs = 8
+		for m in meshes:
+			nlods = unpack_from ('<I', data, ofs)[0]
+			ofs += 4
+			for i in range (nlods):
+				ratio, error, screen, nbuckets = unpack_from ('<3fI', data, ofs)
+				ofs += 16
+				buckets = []
+				for j in range (nbuckets):
+					b, ofs = self.bucket (data, ofs, True)
+					buckets.append (b)
+				m.lods.append ((ratio, error, screen, buckets))
+
+	#Hangs the convex hulls off the meshes they stand in for
+	def hulls (self, section, meshes):
+		data = memoryview (section)
+		ofs = 8
+		for m in meshes:
+			nhulls = unpack_from ('<I', data, ofs)[0]
+			ofs += 4
+			for i in range (nhulls):
+				nverts, nplanes = unpack_from ('<2I', data, ofs)
+				ofs += 8
+				verts = data[ofs:ofs + 12*nverts]
+				ofs += 12*nverts
+				planes = data[ofs:ofs + 16*nplanes]
+				ofs += 16*nplanes
+				m.hulls.append ((nverts, nplanes, verts, planes))
+
+class Layout:
+	def __init__ (self, alignment):
+		self.alignment = alignment
+		self.data = bytearray ()
+		self.relocations = []
+		#Arrays go in after every descriptor, names after the arrays
+		self.arrays = []
+		self.names = []
+
+	def place (self, blob, align = None):
+		self.data += bytes (-len (self.data)%(align or self.alignment))
+		ofs = len (self.data)
+		self.data += blob
+		return ofs
+
+	def reserve (self, fmt, count = 1):
+		return self.place (bytes (calcsize (fmt)*count))
+
+	def pointer (self, field, target):
+		if target:
+			pack_into ('<Q', self.data, field, target)
+			self.relocations.append (field)
+
+	def array (self, field, blob):
+		if len (blob):
+			self.arrays.append ((field, blob))
+
+	def buckets (self, buckets):
+		if not buckets:
+			return 0
+		first = self.reserve (BUCKET, len (buckets))
+		for i, b in enumerate (buckets):
+			d = first + calcsize (BUCKET)*i
+			pack_into ('<3I4f', self.data, d + 24, b.nverts, b.nindices, b.isize, *b.uvs)
+			self.names.append ((d, b.name))
+			self.array (d + 8, b.verts)
+			self.array (d + 16, b.indices)
+		return first
+
+	def mesh (self, d, m):
+		pack_into ('<3f3ffI', self.data, d, *m.bounds, len (m.buckets))
+		self.pointer (d + 32, self.buckets (m.buckets))
+		
+		nverts, nindices, npolys, verts, indices, faces = m.collision
+		c = self.reserve (COLLISION)
+		pack_into ('<3I', self.data, c, nverts, nindices, npolys)
+		self.array (c + 16, verts)
+		self.array (c + 24, indices)
+		self.array (c + 32, faces)
+		self.pointer (d + 40, c)
+		
+		if m.lods:
+			first = self.reserve (LOD, len (m.lods))
+			for i, (ratio, error, screen, buckets) in enumerate (m.lods):
+				l = first + calcsize (LOD)*i
+				pack_into ('<3fI', self.data, l, ratio, error, screen, len (buckets))
+				self.pointer (l + 16, self.buckets (buckets))
+			self.pointer (d + 48, first)
+			pack_into ('<I', self.data, d + 56, len (m.lods))
+		
+		if m.hulls:
+			first = self.reserve (HULL, len (m.hulls))
+			for i, (nverts, nplanes, verts, planes) in enumerate (m.hulls):
+				h = first + calcsize (HULL)*i
+				pack_into ('<2I', self.data, h, nverts, nplanes)
+				self.array (h + 8, verts)
+				self.array (h + 16, planes)
+			pack_into ('<I', self.data, d + 60, len (m.hulls))
+			self.pointer (d + 64, first)
+
+#Lays a packed level out again for loading in place. Takes the header
+#flags and the sections the exporter produced. Returns the file
+def relayout (flags, sections, alignment = ALIGNMENT, names = None):
+	packed = Packed (flags, names)
+	meshes = packed.meshes (sections[0])
+	if flags & LEVEL_LODS:
+		packed.lods (sections[3], meshes)
+	if flags & LEVEL_HULLS:
+		packed.hulls (sections[3 + bool (flags & LEVEL_LODS)], meshes)
+
+	out = Layout (alignment)
+	header = out.reserve (HEADER)
+	first = out.reserve (MESH, len (meshes))
+	for i, m in enumerate (meshes):
+		out.mesh (first + calcsize (MESH)*i, m)
+	out.pointer (header + 16, first if meshes else 0)
+
+	nworld = unpack_from ('<I', sections[1])[0]
+	world = out.place (sections[1][4:]) if nworld else 0
+	out.pointer (header + 32, world)
+
+	for field, blob in out.arrays:
+		out.pointer (field, out.place (blob))
+
+	#Text entities drop their size, the header holds it
+	ents = sections[2]
+	if not flags & LEVEL_BINARY_ENTITIES:
+		ents = ents[4:]
+	out.pointer (header + 48, out.place (ents) if ents else 0)
+
+	#The navmesh only holds 4 byte values, so it is used where it lands
+	nav = b''
+	if flags & LEVEL_NAVMESH:
+		nav = sections[3 + bool (flags & LEVEL_LODS) + bool (flags & LEVEL_HULLS)]
+		out.pointer (header + 96, out.place (nav))
+
+	#Each name is stored once
+	table = {}
+	strings = bytearray ()
+	for field, name in out.names:
+		if name not in table:
+			table[name] = len (strings)
+			strings += name.encode ('utf-8') + b'\0'
+	base = out.place (strings, 1) if strings else 0
+	for field, name in out.names:
+		out.pointer (field, base + table[name])
+	out.pointer (header + 64, base)
+
+	#The table itself is not relocated, the loader reads it first
+	relocations = sorted (out.relocations)
+	table_ofs = out.place (pack ('<{0}Q'.format (len (relocations)), *relocations), 8)
+	out.data += bytes (-len (out.data)%8)
+
+	pack_into ('<4s3I', out.data, header, LEVEL_MAGICK, VERSION_FLAGS, flags|LEVEL_ALIGNED, alignment)
+	pack_into ('<Q', out.data, header + 24, len (meshes))
+	pack_into ('<Q', out.data, header + 40, nworld)
+	pack_into ('<Q', out.data, header + 56, len (ents))
+	pack_into ('<Q', out.data, header + 72, len (strings))
+	pack_into ('<2Q', out.data, header + 80, table_ofs, len (relocations))
+	pack_into ('<Q', out.data, header + 104, len (nav))
+	return bytes (out.data)
@@ -0,0 +1,177 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Timing spans and peak memory capture for the exporters. When disabled
+#every call returns straight away, so it can stay in the hot paths.
+#
+#Profiles are written in the Chrome trace format, so they open directly in
+#chrome://tracing or https://ui.perfetto.dev
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+#Windows has neither /proc nor resource, its working set stands in for
+#the resident set
+if 'win32' == sys.platform:
+	import ctypes
+	from ctypes import wintypes
+
+	class MemoryCounters (ctypes.Structure):
+		_fields_ = [
+			('cb', wintypes.DWORD),
+			('PageFaultCount', wintypes.DWORD),
+			('PeakWorkingSetSize', ctypes.c_size_t),
+			('WorkingSetSize', ctypes.c_size_t),
+			('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+			('QuotaPagedPoolUsage', ctypes.c_size_t),
+			('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+			('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+			('PagefileUsage', ctypes.c_size_t),
+			('PeakPagefileUsage', ctypes.c_size_t)]
+
+	_kernel32 = ctypes.WinDLL ('kernel32')
+	_kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+	_psapi = ctypes.WinDLL ('psapi')
+	_psapi.GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER (MemoryCounters), wintypes.DWORD)
+	_psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+
+	def memory_counters ():
+		counters = MemoryCounters ()
+		counters.cb = ctypes.sizeof (counters)
+		if not _psapi.GetProcessMemoryInfo (_kernel32.GetCurrentProcess (), ctypes.byref (counters), counters.cb):
+			return None
+		return counters
+
+#Resident set size of the process in bytes, or None where the platform
+#does not say. tracemalloc only sees Python's own allocations, this
+#counts NumPy and Blender as well
+def rss ():
+	if 'win32' == sys.platform:
+		counters = memory_counters ()
+		return counters.WorkingSetSize if counters else None
+	try:
+		with open ('/proc/self/statm') as f:
+			return int (f.read ().split ()[1])*os.sysconf ('SC_PAGE_SIZE')
+	except (OSError, ValueError, AttributeError):
+		return None
+
+#Largest resident set size the process has had, in bytes, or None
+def peak_rss ():
+	if 'win32' == sys.platform:
+		counters = memory_counters ()
+		return counters.PeakWorkingSetSize if counters else None
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+	#macOS counts in bytes, everything else in KiB
+	return peak if 'darwin' == sys.platform else peak*1024
+
+class Span:
+	__slots__ = ('name', 'args', 'start', 'peak')
+
+	def __init__ (self, name, args, start):
+		self.name = name
+		self.args = args
+		self.start = start
+		self.peak = 0
+
+class Profiler:
+	def __init__ (self, enabled = False, memory = True):
+		self.enabled = enabled
+		#Peaks can only be told apart per span on Python 3.9 and later
+		self.memory = enabled and memory
+		self.reset = getattr (tracemalloc, 'reset_peak', None)
+		self.stack = []
+		self.events = []
+		self.origin = time.perf_counter ()
+		self.started = False
+		if self.memory and not tracemalloc.is_tracing ():
+			tracemalloc.start ()
+			self.started = True
+
+	#Folds the peak since the last check into every open span
+	def sample (self):
+		peak = tracemalloc.get_traced_memory ()[1]
+		for s in self.stack:
+			if peak > s.peak:
+				s.peak = peak
+		if self.reset is not None:
+			self.reset ()
+
+	def begin (self, name, **args):
+		if not self.enabled:
+			return
+		if self.memory:
+			self.sample ()
+		self.stack.append (Span (name, args, time.perf_counter ()))
+
+	def end (self):
+		if not self.enabled:
+			return
+		if self.memory:
+			self.sample ()
+		s = self.stack.pop ()
+		now = time.perf_counter ()
+		args = dict (s.args)
+		if self.memory:
+			args['peak_kib'] = s.peak/1024
+		self.events.append ({
+			'name': s.name,
+			'ph': 'X',
+			'ts': 1e6*(s.start - self.origin),
+			'dur': 1e6*(now - s.start),
+			'pid': os.getpid (),
+			'tid': 0,
+			'args': args})
+
+	#Adds a counter track, eg. for sizes of things
+	def count (self, name, **values):
+		if not self.enabled:
+			return
+		self.events.append ({
+			'name': name,
+			'ph': 'C',
+			'ts': 1e6*(time.perf_counter () - self.origin),
+			'pid': os.getpid (),
+			'args': values})
+
+	#Seconds spent in each span name, summed over every occurrence
+	def totals (self):
+		out = {}
+		for e in self.events:
+			if 'X' == e['ph']:
+				out[e['name']] = out.get (e['name'], 0.0) + e['dur']/1e6
+		return out
+
+	def write (self, path):
+		if not self.enabled:
+			return
+		while self.stack:
+			self.end ()
+		if self.started:
+			tracemalloc.stop ()
+			self.started = False
+		with open (path, 'w') as f:
+			json.dump ({
+				'traceEvents': self.events,
+				'displayTimeUnit': 'ms',
+				'otherData': {'totals': self.totals ()}}, f)
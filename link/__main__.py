@@ -0,0 +1,68 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+import argparse
+import os
+from . import listen, serve, DEFAULT_ADDRESS
+from . import protocol
+
+NAMES = {protocol.HELO: 'hello', protocol.FULL: 'full level', protocol.WRLD: 'world graph',
+	protocol.GEOM: 'geometry', protocol.ENTS: 'entity'}
+
+def main ():
+	parser = argparse.ArgumentParser (prog='python -m link',
+		description='Stands in for the engine at the far end of a live link')
+	parser.add_argument ('--listen', default=DEFAULT_ADDRESS,
+		help='host:port, or the path of a Unix socket')
+	parser.add_argument ('--out', help='writes the level here after every message')
+	parser.add_argument ('--once', action='store_true', help='exit when the first session ends')
+	args = parser.parse_args ()
+
+	def report (tag, payload, image, seconds):
+		detail = ''
+		if protocol.WRLD == tag or protocol.GEOM == tag:
+			detail = ' #{0}'.format (protocol.record_patch (payload)[0])
+		elif protocol.ENTS == tag:
+			detail = ' ' + protocol.parse_entity_patch (payload)[0]
+		print ('{0}{1}: {2} bytes, applied in {3:.3f} ms'.format (
+			NAMES.get (tag, tag), detail, len (payload), 1000*seconds))
+		if args.out and image is not None:
+			with open (args.out + '.tmp', 'wb') as f:
+				f.write (image.pack ())
+			os.replace (args.out + '.tmp', args.out)
+
+	server = listen (args.listen)
+	print ('listening on {0}'.format (args.listen))
+	try:
+		while True:
+			conn, peer = server.accept ()
+			print ('session from {0}'.format (peer or 'local socket'))
+			with conn:
+				image = serve (conn, report)
+			if image is not None:
+				print ('session over: {0} meshes, {1} placements, {2} entities'.format (
+					len (image.geometry), len (image.world), len (image.entities)))
+			if args.once:
+				break
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.close ()
+
+main ()
@@ -0,0 +1,132 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Live link wire format. Blender connects to the engine and sends framed
+#messages, each <4sI tag, payload size> followed by the payload:
+#
+#	HELO <I protocol version>
+#	FULL a whole uncompressed .level
+#	WRLD <I world graph record> and the 40 byte record that replaces it
+#	GEOM <I geometry record> and <I len>verts<I len>cg that replace it
+#	ENTS <I len>name<I len>text, the text entity of the named object.
+#	     Empty text removes the entity
+#	BYE  nothing, the session is over
+#
+#Records are numbered as in the last FULL image; anything that would
+#renumber them is sent as a FULL image instead
+import os
+import socket
+from struct import pack, unpack_from, calcsize
+
+PROTOCOL_VERSION = 0x20261019
+
+FRAME = '<4sI'
+
+HELO = b'HELO'
+FULL = b'FULL'
+WRLD = b'WRLD'
+GEOM = b'GEOM'
+ENTS = b'ENTS'
+BYE = b'BYE '
+
+DEFAULT_ADDRESS = 'localhost:7878'
+
+#Splits 'host:port' into a TCP address, anything else is the path of a
+#Unix socket
+def parse_address (text):
+	host, colon, port = text.rpartition (':')
+	if colon and port.isdigit () and os.sep not in text:
+		return socket.AF_INET, (host or 'localhost', int (port))
+	if not hasattr (socket, 'AF_UNIX'):
+		raise RuntimeError ('{0} is not host:port and Unix sockets are not available'.format (text))
+	return socket.AF_UNIX, text
+
+def connect (text, timeout = 5.0):
+	family, address = parse_address (text)
+	sock = socket.socket (family, socket.SOCK_STREAM)
+	sock.settimeout (timeout)
+	try:
+		sock.connect (address)
+	except OSError:
+		sock.close ()
+		raise
+	if socket.AF_INET == family:
+		sock.setsockopt (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+	return sock
+
+def listen (text):
+	family, address = parse_address (text)
+	sock = socket.socket (family, socket.SOCK_STREAM)
+	if socket.AF_UNIX == family:
+		#A socket left behind by an earlier receiver
+		if os.path.exists (address):
+			os.unlink (address)
+	else:
+		sock.setsockopt (socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.bind (address)
+	sock.listen (1)
+	return sock
+
+def send (sock, tag, payload = b''):
+	sock.sendall (pack (FRAME, tag, len (payload)) + payload)
+
+def recv_exact (sock, size):
+	buf = bytearray ()
+	while len (buf) < size:
+		chunk = sock.recv (min (size - len (buf), 1<<20))
+		if not chunk:
+			return None
+		buf += chunk
+	return bytes (buf)
+
+#Returns the next (tag, payload), or (None, None) once the other end has
+#hung up
+def recv (sock):
+	head = recv_exact (sock, calcsize (FRAME))
+	if head is None:
+		return None, None
+	tag, size = unpack_from (FRAME, head)
+	payload = recv_exact (sock, size)
+	if payload is None:
+		return None, None
+	return tag, payload
+
+def hello ():
+	return pack ('<I', PROTOCOL_VERSION)
+
+def world_patch (index, record):
+	return pack ('<I', index) + record
+
+def geometry_patch (index, record):
+	return pack ('<I', index) + record
+
+def entity_patch (name, text):
+	name = name.encode ('utf-8')
+	return pack ('<I', len (name)) + name + pack ('<I', len (text)) + text
+
+#Returns (index, record) of a WRLD or GEOM payload
+def record_patch (payload):
+	return unpack_from ('<I', payload)[0], payload[4:]
+
+#Returns (name, text) of an ENTS payload
+def parse_entity_patch (payload):
+	size = unpack_from ('<I', payload)[0]
+	name = payload[4:4 + size].decode ('utf-8')
+	ofs = 4 + size
+	size = unpack_from ('<I', payload, ofs)[0]
+	return name, payload[ofs + 4:ofs + 4 + size]
@@ -0,0 +1,146 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Stand-in for the engine end of a live link. Keeps the level as lists of
+#records so patches land in place, and can put the .level back together
+#at any point
+import time
+from struct import pack, unpack_from
+from . import protocol
+
+LEVEL_MAGICK = b'SW3R'
+LEVEL_VERSION = 0x20200526
+VERSION_FLAGS = 0x20261019
+LEVEL_LODS = 1<<2
+LEVEL_BINARY_ENTITIES = 1<<3
+LEVEL_HULLS = 1<<5
+LEVEL_NAVMESH = 1<<6
+
+#Splits text entities up on their 'entity' lines, keyed by their name
+def split_entities (text):
+	ents = {}
+	block = []
+	for line in text.splitlines (keepends=True):
+		if line.startswith (b'entity ') and block:
+			ents[entity_name (block)] = bytes ().join (block)
+			block = []
+		block.append (line)
+	if block:
+		ents[entity_name (block)] = bytes ().join (block)
+	return ents
+
+def entity_name (lines):
+	for line in lines:
+		if line.startswith (b'name: '):
+			return line[6:].rstrip (b'\n').decode ('utf-8')
+	raise RuntimeError ('entity without a name')
+
+class LevelImage:
+	def __init__ (self, data):
+		magick, version = unpack_from ('<4sI', data, 0)
+		if LEVEL_MAGICK != magick:
+			raise RuntimeError ('not a level')
+		self.version = version
+		self.flags = 0
+		ofs = 8
+		if VERSION_FLAGS == version:
+			self.flags = unpack_from ('<I', data, ofs)[0]
+			ofs += 4
+		elif LEVEL_VERSION != version:
+			raise RuntimeError ('unknown level version {0:#x}'.format (version))
+		#Live sessions leave out what would have to be rebuilt as a whole
+		if self.flags & (LEVEL_LODS|LEVEL_BINARY_ENTITIES|LEVEL_HULLS|LEVEL_NAVMESH):
+			raise RuntimeError ('live link levels carry text entities and none of the baked sections')
+		ofs_geo, ofs_wg, ofs_ents = unpack_from ('<3I', data, ofs)
+
+		#Geometry records are kept whole, <I len>verts<I len>cg
+		self.geometry = []
+		nmesh = unpack_from ('<I', data, ofs_geo)[0]
+		ofs = ofs_geo + 4
+		for i in range (nmesh):
+			start = ofs
+			ofs += 4 + unpack_from ('<I', data, ofs)[0]
+			ofs += 4 + unpack_from ('<I', data, ofs)[0]
+			self.geometry.append (data[start:ofs])
+
+		nwg = unpack_from ('<I', data, ofs_wg)[0]
+		self.world = [data[ofs_wg + 4 + 40*i:ofs_wg + 44 + 40*i] for i in range (nwg)]
+
+		size = unpack_from ('<I', data, ofs_ents)[0]
+		self.entities = split_entities (data[ofs_ents + 4:ofs_ents + 4 + size])
+
+	#Applies one message. Returns a new image for FULL, else itself
+	def apply (self, tag, payload):
+		if protocol.FULL == tag:
+			return LevelImage (payload)
+		if protocol.WRLD == tag:
+			index, record = protocol.record_patch (payload)
+			if index >= len (self.world) or 40 != len (record):
+				raise RuntimeError ('bad world graph patch {0}'.format (index))
+			self.world[index] = record
+		elif protocol.GEOM == tag:
+			index, record = protocol.record_patch (payload)
+			if index >= len (self.geometry):
+				raise RuntimeError ('bad geometry patch {0}'.format (index))
+			self.geometry[index] = record
+		elif protocol.ENTS == tag:
+			name, text = protocol.parse_entity_patch (payload)
+			if text:
+				self.entities[name] = text
+			else:
+				self.entities.pop (name, None)
+		else:
+			raise RuntimeError ('unknown message {0}'.format (tag))
+		return self
+
+	#The level as it stands
+	def pack (self):
+		geo = pack ('<I', len (self.geometry)) + bytes ().join (self.geometry)
+		wg = pack ('<I', len (self.world)) + bytes ().join (self.world)
+		ents = bytes ().join (self.entities.values ())
+		ents = pack ('<I', len (ents)) + ents
+		if 0 == self.flags:
+			header = LEVEL_MAGICK + pack ('<I', self.version)
+		else:
+			header = LEVEL_MAGICK + pack ('<2I', self.version, self.flags)
+		ofs = len (header) + 12
+		header += pack ('<3I', ofs, ofs + len (geo), ofs + len (geo) + len (wg))
+		return header + geo + wg + ents
+
+#Serves one connection until Blender hangs up. Calls report with every
+#message, the image after it and the seconds spent applying it. Returns
+#the last image
+def serve (conn, report = None):
+	image = None
+	while True:
+		tag, payload = protocol.recv (conn)
+		if tag is None or protocol.BYE == tag:
+			return image
+		start = time.perf_counter ()
+		if protocol.HELO == tag:
+			version = unpack_from ('<I', payload)[0]
+			if protocol.PROTOCOL_VERSION != version:
+				raise RuntimeError ('unknown protocol version {0:#x}'.format (version))
+		elif image is not None:
+			image = image.apply (tag, payload)
+		elif protocol.FULL == tag:
+			image = LevelImage (payload)
+		else:
+			raise RuntimeError ('patch before the first full level')
+		if report is not None:
+			report (tag, payload, image, time.perf_counter () - start)
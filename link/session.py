@@ -0,0 +1,311 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Blender end of a live link. The level is exported once in full, then
+#depsgraph updates are gathered for a moment and only the records they
+#touched are sent again: world graph records for objects that moved,
+#geometry records for meshes that were edited and the text entities of
+#objects whose properties changed. Collision graphs are patched with the
+#triangles that came and went rather than rebuilt
+import bpy
+from collections import Counter
+from struct import pack
+from .. import texport
+from .. import snapshot
+from .. import partition
+from . import protocol
+
+#Seconds to gather updates for before sending them
+FLUSH_INTERVAL = 0.1
+
+#What changed on an object
+TRANSFORM = 1<<0
+GEOMETRY = 1<<1
+PROPERTIES = 1<<2
+
+#The running session, if any
+active = None
+
+#Export settings of a live session. LODs and binary entities would have to
+#be rebuilt for the whole level on every edit, so they are left out, and
+#the level is sent uncompressed
+class Settings:
+	def __init__ (self, operator):
+		self.filepath = ''
+		self.verbose = operator.verbose
+		self.weld = operator.weld
+		self.quantize = operator.quantize
+		self.lods = False
+		self.lod_ratios = ''
+		self.hulls = False
+		self.navmesh = False
+		self.binary_entities = False
+		self.profile = False
+		self.compression = 'NONE'
+		self.layout = 'PACKED'
+		self.vertex_budget = partition.VERTEX_BUDGET
+		self.memory_limit = 0
+
+#Triangle corners in winding order, starting from the lowest
+def canonical (t):
+	i = t.index (min (t))
+	return tuple (t[i:] + t[:i])
+
+def corners (p):
+	loop = []
+	edge = p.head
+	while True:
+		loop.append (edge.ndx)
+		edge = edge.next
+		if edge is p.head:
+			break
+	return canonical (loop)
+
+class Session:
+	def __init__ (self, settings, address):
+		self.settings = settings
+		self.address = address
+		self.sock = protocol.connect (address)
+		self.pending = {}
+		self.messages = Counter ()
+		self.bytes = Counter ()
+		self.send (protocol.HELO, protocol.hello ())
+	
+	def trace (self, text, *args):
+		if self.settings.verbose is True:
+			print (text.format (*args) if args else text)
+	
+	def send (self, tag, payload):
+		protocol.send (self.sock, tag, payload)
+		self.messages[tag] += 1
+		self.bytes[tag] += len (payload)
+	
+	def close (self):
+		try:
+			self.send (protocol.BYE, b'')
+		except OSError:
+			pass
+		self.sock.close ()
+		self.trace ('Live link closed: {0} messages, {1} bytes',
+			sum (self.messages.values ()), sum (self.bytes.values ()))
+	
+	#What goes into the level and in which order. Records are numbered by
+	#it, so when it changes the whole level has to go again
+	def layout (self, scene):
+		out = []
+		for o in scene.objects:
+			if o.type != 'MESH' or o.hide_viewport:
+				continue
+			nowrite = bool (o.get ('_RNA_UI')) and 'nowrite' in o.keys ()
+			out.append ((o.name, o.data.name if o.data else '', nowrite))
+		return out
+	
+	#Mesh id the object was given in the last full export
+	def mesh_id (self, o):
+		return self.export.objects.get (o.name, (0, 0, 0))[1]
+	
+	#World graph records of the object, one per part of its mesh
+	def placements (self, o):
+		first, id, count = self.export.objects[o.name]
+		return [self.export.world_record (o, id + k) for k in range (count)]
+	
+	def entity (self, o):
+		edict = self.export.properties (o, self.mesh_id (o))
+		if edict is None or 'type' not in edict:
+			return bytes ()
+		return self.export.entity_text (edict)
+	
+	#Exports and sends the whole level, and remembers what went out
+	def resync (self, context):
+		self.export = texport.Export (self.settings, context)
+		self.export.graphs = {}
+		header, tags, sections = self.export.level ()
+		self.send (protocol.FULL, header + bytes ().join (sections))
+		self.export.meshes = None
+		
+		scene = context.scene
+		self.shape = self.layout (scene)
+		self.world = {}
+		self.entities = {}
+		for o in scene.objects:
+			if o.name in self.export.objects:
+				self.world[o.name] = self.placements (o)
+			self.entities[o.name] = self.entity (o)
+		
+		#Collision triangles of every mesh, to find the polygons to patch
+		self.faces = {}
+		for data, graph in self.export.graphs.items ():
+			faces = {}
+			for p in graph.faces:
+				faces.setdefault (corners (p), []).append (p)
+			self.faces[data] = faces
+		self.pending = {}
+		self.trace ('Live link: sent {0} meshes, {1} placements', len (self.faces), len (self.world))
+	
+	#depsgraph_update_post handler
+	def update (self, scene, depsgraph):
+		for u in depsgraph.updates:
+			id = u.id.original
+			if isinstance (id, bpy.types.Object):
+				kind = 0
+				if u.is_updated_transform:
+					kind |= TRANSFORM
+				if u.is_updated_geometry:
+					kind |= GEOMETRY
+				#Custom properties come through with neither flag
+				self.mark (id.name, kind or PROPERTIES)
+			elif isinstance (id, bpy.types.Mesh):
+				for o in scene.objects:
+					if o.data == id:
+						self.mark (o.name, GEOMETRY)
+			else:
+				#Objects coming and going show up as scene and
+				#collection updates; flush checks the layout anyway
+				self.mark (None, 0)
+	
+	def mark (self, name, kind):
+		if name is not None:
+			self.pending[name] = self.pending.get (name, 0) | kind
+		if not bpy.app.timers.is_registered (on_timer):
+			bpy.app.timers.register (on_timer, first_interval=FLUSH_INTERVAL)
+	
+	#Sends everything gathered since the last flush
+	def flush (self, context):
+		pending, self.pending = self.pending, {}
+		scene = context.scene
+		if self.layout (scene) != self.shape:
+			self.trace ('Live link: objects changed, resending the level')
+			self.resync (context)
+			return
+		
+		objects = {o.name: o for o in scene.objects}
+		self.export.meshes = snapshot.Cache (context)
+		sent = set ()
+		resync = False
+		for name, kind in pending.items ():
+			o = objects.get (name)
+			if o is None or o.type != 'MESH' or o.hide_viewport:
+				continue
+			placed = name in self.export.objects
+			if kind & TRANSFORM and placed:
+				first = self.export.objects[name][0]
+				records = self.placements (o)
+				for k, (new, old) in enumerate (zip (records, self.world[name])):
+					if new != old:
+						self.send (protocol.WRLD, protocol.world_patch (first + k, new))
+				self.world[name] = records
+			if kind & GEOMETRY and placed and o.data not in sent:
+				sent.add (o.data)
+				if not self.geometry (o):
+					resync = True
+			#Entities carry the origin as well
+			if kind & (TRANSFORM|PROPERTIES):
+				text = self.entity (o)
+				if text != self.entities.get (name, bytes ()):
+					self.entities[name] = text
+					self.send (protocol.ENTS, protocol.entity_patch (name, text))
+		self.export.meshes = None
+		if resync:
+			self.trace ('Live link: a mesh changed how many parts it needs, resending the level')
+			self.resync (context)
+	
+	#Sends the geometry record of the object's mesh again. Returns False
+	#if the mesh is, or has become, too big for a single record
+	def geometry (self, o):
+		data = o.data
+		if data not in self.export.records:
+			return True
+		mesh = self.export.meshes.get (o)
+		if mesh is None:
+			return True
+		try:
+			self.export.check_triangles (o, mesh)
+		except RuntimeError as e:
+			#Half way through an edit; the engine keeps the last good record
+			self.trace ('Live link: {0}', e)
+			return True
+		if data not in self.export.graphs or self.export.parts (o, mesh)[0] is not None:
+			return False
+		verts, chunk, tris = self.export.render_record (o, mesh)
+		
+		#Patch the collision graph with the triangles that changed
+		graph = self.export.graphs[data]
+		faces = self.faces[data]
+		want = Counter (canonical (t) for t in tris)
+		have = Counter ({t: len (ps) for t, ps in faces.items ()})
+		removed = have - want
+		added = want - have
+		for t, n in removed.items ():
+			for i in range (n):
+				graph.remove_polygon (faces[t].pop ())
+			if not faces[t]:
+				del faces[t]
+		for t, n in added.items ():
+			for i in range (n):
+				faces.setdefault (t, []).append (graph.add_polygon (list (t)))
+		self.trace ('Live link: {0} -{1} +{2} triangles', o.name,
+			sum (removed.values ()), sum (added.values ()))
+		
+		cg = self.export.collision_record (mesh.co, graph)
+		record = pack ('<I', len (verts)) + verts + pack ('<I', len (cg)) + cg
+		self.send (protocol.GEOM, protocol.geometry_patch (self.export.records[data][0], record))
+		return True
+
+def on_update (scene, depsgraph):
+	if active is not None:
+		active.update (scene, depsgraph)
+
+def on_timer ():
+	if active is not None:
+		try:
+			active.flush (bpy.context)
+		except OSError as e:
+			print ('Live link lost: {0}'.format (e))
+			stop ()
+	return None
+
+#Sessions do not outlive the file they were started on
+def on_load (*args):
+	stop ()
+
+def start (settings, address, context):
+	global active
+	stop ()
+	session = Session (settings, address)
+	try:
+		session.resync (context)
+	except:
+		session.close ()
+		raise
+	active = session
+	bpy.app.handlers.depsgraph_update_post.append (on_update)
+	bpy.app.handlers.load_pre.append (on_load)
+
+def stop ():
+	global active
+	if active is None:
+		return
+	session, active = active, None
+	for handlers, fn in ((bpy.app.handlers.depsgraph_update_post, on_update),
+		(bpy.app.handlers.load_pre, on_load)):
+		if fn in handlers:
+			handlers.remove (fn)
+	if bpy.app.timers.is_registered (on_timer):
+		bpy.app.timers.unregister (on_timer)
+	session.close ()
@@ -0,0 +1,280 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Mesh simplification by quadric edge collapse (Garland & Heckbert).
+#
+#Collapses always move one vertex onto the other, so every LOD only ever
+#references vertices of the original mesh. Attributes such as UVs and bone
+#weights therefore survive untouched, and UV seams survive too: corners on a
+#seam are split into separate vertices, which turns the seam into a border
+#that is held in place by heavily weighted border planes.
+import heapq
+import math
+import time
+import numpy as np
+
+#Version of the LOD chunk written by the exporters
+LOD_VERSION = 0x20261019
+
+#How strongly borders (and therefore seams) resist being moved
+BORDER_WEIGHT = 1000.0
+
+#Screen height in pixels used when turning errors into switch sizes
+REFERENCE_HEIGHT = 1080.0
+
+#Most LODs allowed per mesh, not counting the full detail one
+MAX_LODS = 4
+
+#Parses a string like "0.5 0.25" into a list of triangle ratios
+def parse_ratios (text):
+	ratios = []
+	for s in text.replace (',', ' ').split ():
+		r = float (s)
+		if r <= 0.0 or r >= 1.0:
+			raise ValueError ('LOD ratio {0} must be between 0 and 1'.format (s))
+		ratios.append (r)
+	if len (ratios) > MAX_LODS:
+		raise ValueError ('At most {0} LODs are supported'.format (MAX_LODS))
+	ratios.sort (reverse = True)
+	return ratios
+
+#Fraction of the screen height the bounding sphere may cover before the
+#given error becomes larger than a pixel
+def screen_size (error, radius):
+	if error <= 0.0:
+		return 1.0
+	return min (1.0, 2.0*radius/(error*REFERENCE_HEIGHT))
+
+def plane_quadric (planes, weights):
+	#Outer product of each plane with itself, packed as the upper triangle
+	a, b, c, d = planes[:, 0], planes[:, 1], planes[:, 2], planes[:, 3]
+	q = np.stack ((a*a, a*b, a*c, a*d, b*b, b*c, b*d, c*c, c*d, d*d), axis=1)
+	return q*weights[:, None]
+
+def quadrics (pos, tris):
+	q = np.zeros ((len (pos), 10))
+	if 0 == len (tris):
+		return q
+	p = pos[tris]
+	n = np.cross (p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+	l = np.linalg.norm (n, axis=1)
+	ok = l > 1e-12
+	n[ok] /= l[ok, None]
+	d = -(n*p[:, 0]).sum (axis=1)
+	fq = plane_quadric (np.column_stack ((n, d)), ok.astype (np.float64))
+	for k in range (3):
+		np.add.at (q, tris[:, k], fq)
+
+	#Borders are edges used by a single face. Pin them with planes that run
+	#along the edge, perpendicular to the face
+	e = tris[:, [0, 1, 1, 2, 2, 0]].reshape (-1, 2)
+	key = np.sort (e, axis=1)
+	_, inv, count = np.unique (key, axis=0, return_inverse=True, return_counts=True)
+	border = count[inv.reshape (-1)] == 1
+	if border.any ():
+		be = e[border]
+		face = np.nonzero (border)[0]//3
+		dir = pos[be[:, 1]] - pos[be[:, 0]]
+		bn = np.cross (dir, n[face])
+		bl = np.linalg.norm (bn, axis=1)
+		ok = bl > 1e-12
+		bn[ok] /= bl[ok, None]
+		bd = -(bn*pos[be[:, 0]]).sum (axis=1)
+		bq = plane_quadric (np.column_stack ((bn, bd)), BORDER_WEIGHT*ok)
+		np.add.at (q, be[:, 0], bq)
+		np.add.at (q, be[:, 1], bq)
+	return q
+
+def evaluate (q, p):
+	x, y, z = p
+	return (q[0]*x*x + 2*q[1]*x*y + 2*q[2]*x*z + 2*q[3]*x
+		+ q[4]*y*y + 2*q[5]*y*z + 2*q[6]*y
+		+ q[7]*z*z + 2*q[8]*z
+		+ q[9])
+
+def normal (a, b, c):
+	ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+	vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+	return (uy*vz - uz*vy, uz*vx - ux*vz, ux*vy - uy*vx)
+
+#Simplifies the triangle list down to at most target triangles. Attributes,
+#if given, are an array of per vertex values (eg. bone weights) that make
+#collapsing between differing vertices expensive. Returns the remaining
+#triangles and the worst error introduced
+def simplify (pos, tris, target, attrs = None, attr_weight = 1.0):
+	pos = np.asarray (pos, dtype=np.float64).reshape (-1, 3)
+	tris = np.asarray (tris, dtype=np.int64).reshape (-1, 3)
+	if len (tris) <= target:
+		return tris.copy (), 0.0
+
+	Q = quadrics (pos, tris).tolist ()
+	P = pos.tolist ()
+	A = None
+	if attrs is not None:
+		A = np.asarray (attrs, dtype=np.float64).reshape (len (pos), -1).tolist ()
+		#Express attribute differences in squared length so they compete
+		#with the geometric error on an even footing
+		diag = float (np.linalg.norm (pos.max (axis=0) - pos.min (axis=0)))
+		attr_scale = attr_weight*max (diag, 1e-6)**2
+
+	faces = tris.tolist ()
+	alive = len (faces)*[True]
+	vfaces = [set () for i in range (len (pos))]
+	for i, f in enumerate (faces):
+		for v in f:
+			vfaces[v].add (i)
+	stamp = len (pos)*[0]
+	removed = len (pos)*[False]
+
+	def neighbours (v):
+		out = set ()
+		for f in vfaces[v]:
+			out.update (faces[f])
+		out.discard (v)
+		return out
+
+	def cost (u, v):
+		q = [a + b for a, b in zip (Q[u], Q[v])]
+		c = max (0.0, evaluate (q, P[v]))
+		if A is not None:
+			c += attr_scale*sum ((a - b)*(a - b) for a, b in zip (A[u], A[v]))
+		return c
+
+	heap = []
+	def push (u, v):
+		heapq.heappush (heap, (cost (u, v), u, v, stamp[u], stamp[v]))
+
+	for v in range (len (pos)):
+		for w in neighbours (v):
+			push (v, w)
+
+	count = len (faces)
+	worst = 0.0
+	while count > target and heap:
+		c, u, v, su, sv = heapq.heappop (heap)
+		if removed[u] or removed[v] or su != stamp[u] or sv != stamp[v]:
+			continue
+
+		#Reject collapses that pinch the surface into a non-manifold shape
+		shared = vfaces[u] & vfaces[v]
+		if 0 == len (shared):
+			continue
+		if len (neighbours (u) & neighbours (v)) != len (shared):
+			continue
+
+		#Reject collapses that flip or squash any surviving face
+		ok = True
+		for f in vfaces[u] - shared:
+			pts = [P[x] for x in faces[f]]
+			old = normal (*pts)
+			pts = [P[v] if x == u else P[x] for x in faces[f]]
+			new = normal (*pts)
+			dot = old[0]*new[0] + old[1]*new[1] + old[2]*new[2]
+			if dot <= 0.0:
+				ok = False
+				break
+		if not ok:
+			continue
+
+		#Collapse u into v
+		for f in shared:
+			alive[f] = False
+			for x in faces[f]:
+				vfaces[x].discard (f)
+			count -= 1
+		for f in vfaces[u]:
+			faces[f] = [v if x == u else x for x in faces[f]]
+			vfaces[v].add (f)
+		vfaces[u] = set ()
+		removed[u] = True
+		Q[v] = [a + b for a, b in zip (Q[u], Q[v])]
+		if c > worst:
+			worst = c
+
+		#Every edge touching v needs a fresh cost
+		stamp[v] += 1
+		for w in neighbours (v):
+			push (v, w)
+			push (w, v)
+
+	out = [faces[i] for i in range (len (faces)) if alive[i]]
+	out = np.array (out, dtype=np.int64).reshape (-1, 3)
+	return out, math.sqrt (worst)
+
+class Lod:
+	def __init__ (self, ratio, tris, error, radius, seconds):
+		self.ratio = ratio
+		self.tris = tris
+		self.error = error
+		self.screen = screen_size (error, radius)
+		self.seconds = seconds
+
+#Builds a chain of LODs, each one simplified from the one before. Errors
+#are accumulated along the chain so they stay conservative
+def build_chain (pos, tris, ratios, attrs = None, radius = 1.0):
+	tris = np.asarray (tris, dtype=np.int64).reshape (-1, 3)
+	chain = []
+	curr = tris
+	error = 0.0
+	for r in ratios:
+		target = max (1, int (len (tris)*r))
+		start = time.perf_counter ()
+		curr, e = simplify (pos, curr, target, attrs)
+		error += e
+		chain.append (Lod (r, curr, error, radius, time.perf_counter () - start))
+	return chain
+
+def report (name, base, chain):
+	lines = ['LODs for {0} ({1} tris):'.format (name, base)]
+	for i, l in enumerate (chain):
+		lines.append ('\t{0}: {1} tris ({2:.0f}%) error {3:.6f} screen {4:.4f} in {5:.3f}s'.format (
+			i + 1, len (l.tris), 100*len (l.tris)/max (base, 1), l.error, l.screen, l.seconds))
+	return '\n'.join (lines)
+
+#Builds a subdivided sphere for benchmarking
+def sphere (rings, segments):
+	pos = [(0.0, 0.0, 1.0)]
+	for i in range (1, rings):
+		t = math.pi*i/rings
+		for j in range (segments):
+			p = 2.0*math.pi*j/segments
+			pos.append ((math.sin (t)*math.cos (p), math.sin (t)*math.sin (p), math.cos (t)))
+	pos.append ((0.0, 0.0, -1.0))
+	last = len (pos) - 1
+
+	tris = []
+	for j in range (segments):
+		tris.append ((0, 1 + j, 1 + (j + 1)%segments))
+	for i in range (rings - 2):
+		a = 1 + i*segments
+		b = a + segments
+		for j in range (segments):
+			k = (j + 1)%segments
+			tris.append ((a + j, b + j, b + k))
+			tris.append ((a + j, b + k, a + k))
+	for j in range (segments):
+		a = 1 + (rings - 2)*segments
+		tris.append ((a + j, last, a + (j + 1)%segments))
+	return np.array (pos), np.array (tris)
+
+if __name__ == "__main__":
+	import sys
+	n = int (sys.argv[1]) if len (sys.argv) > 1 else 64
+	pos, tris = sphere (n, 2*n)
+	chain = build_chain (pos, tris, [0.5, 0.25, 0.125], radius = 1.0)
+	print (report ('sphere', len (tris), chain))
@@ -0,0 +1,193 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Navigation meshes baked from the level's collision graphs, so the engine
+#need not find its way over raw geometry. Triangles too steep to stand on
+#are dropped, the rest are merged across the edges their graph twins up
+#into convex regions, longest edges first, and regions that share an
+#edge are linked through it, whether in one mesh or across pieces laid
+#edge to edge. The section written is:
+#
+#	<I       version
+#	<I       nverts, then <3f> per vertex, in world space
+#	<I       nregions, then <2I3f> first corner, corners and centre per region
+#	<I       ncorners, then <I> the vertex of every corner, then <i> the
+#	         region across the edge from that corner to the next, or -1
+#
+#Corners run anticlockwise seen from above, and every region is convex
+#seen from above
+import math
+from struct import pack
+import numpy as np
+
+NAV_VERSION = 0x20261019
+#Steepest walkable slope in degrees
+MAX_SLOPE = 45.0
+#Most corners a region may have
+MAX_CORNERS = 8
+#Corners nearer than this are one, so separate pieces join up
+WELD = 1e-3
+#Region entry of the file
+REGION = np.dtype ([('first', '<u4'), ('count', '<u4'), ('centre', '<f4', 3)])
+
+#Corners of a graph polygon, in winding order
+def corners (p):
+	loop = []
+	edge = p.head
+	while True:
+		loop.append (edge.ndx)
+		edge = edge.next
+		if edge is p.head:
+			break
+	return loop
+
+class Builder:
+	def __init__ (self, max_slope = MAX_SLOPE, max_corners = MAX_CORNERS):
+		self.up = math.cos (math.radians (max_slope))
+		self.max_corners = max_corners
+		self.ids = {}
+		self.verts = []
+		self.regions = []
+		#Triangles seen and kept, for the report
+		self.faces = 0
+		self.walkable = 0
+
+	#World vertex ids of some points, welding those that coincide
+	def weld (self, points):
+		out = []
+		for p, key in zip (points.tolist (), np.round (points/WELD).astype (np.int64).tolist ()):
+			key = tuple (key)
+			if key not in self.ids:
+				self.ids[key] = len (self.verts)
+				self.verts.append (p)
+			out.append (self.ids[key])
+		return out
+
+	#Joins two regions across the edge a, b. Returns the merged corners,
+	#or None if they would not make a convex region
+	def merge (self, p, q, a, b):
+		i = p.index (a)
+		if p[(i + 1)%len (p)] != b:
+			a, b = b, a
+			i = p.index (a)
+		j = q.index (b)
+		if q[(j + 1)%len (q)] != a:
+			return None
+		#p from b round to a, then q between a and b
+		p = p[i + 1:] + p[:i + 1]
+		q = q[j + 1:] + q[:j + 1]
+		merged = p + q[1:-1]
+		if len (merged) > self.max_corners or len (set (merged)) < len (merged):
+			return None
+		xy = np.array ([self.verts[k][0:2] for k in merged])
+		e = np.roll (xy, -1, axis=0) - xy
+		turn = e[:, 0]*np.roll (e[:, 1], -1) - e[:, 1]*np.roll (e[:, 0], -1)
+		if (turn < -1e-9*(e*e).sum (axis=1).max ()).any ():
+			return None
+		return merged
+
+	#Adds the walkable part of a built collision graph over the vertices
+	#co, placed by the 4x4 matrix
+	def add (self, graph, co, matrix):
+		m = np.asarray (matrix, dtype=np.float64)
+		world = np.asarray (co, dtype=np.float64) @ m[0:3, 0:3].T + m[0:3, 3]
+		ids = self.weld (world)
+		#Mirroring turns the winding over
+		flip = np.linalg.det (m[0:3, 0:3]) < 0
+
+		#Walkable faces as regions of their own to begin with
+		polys = []
+		region = {}
+		for f in graph.faces:
+			self.faces += 1
+			loop = corners (f)
+			if flip:
+				loop.reverse ()
+			p = world[loop]
+			n = np.cross (p, np.roll (p, -1, axis=0)).sum (axis=0)
+			l = np.linalg.norm (n)
+			w = [ids[i] for i in loop]
+			if l <= 0 or n[2] < self.up*l or len (set (w)) < len (w):
+				continue
+			region[f] = len (polys)
+			polys.append (w)
+		self.walkable += len (polys)
+
+		#Edges twinned between walkable faces, longest first
+		shared = []
+		for f, r in region.items ():
+			edge = f.head
+			while True:
+				g = edge.twin.poly if edge.twin is not None else None
+				if g in region and r < region[g]:
+					a, b = ids[edge.ndx], ids[edge.next.ndx]
+					length = float (np.linalg.norm (world[edge.ndx] - world[edge.next.ndx]))
+					shared.append ((-length, r, region[g], a, b))
+				edge = edge.next
+				if edge is f.head:
+					break
+		shared.sort ()
+
+		#Merged regions live on in the lower numbered of the two
+		parent = list (range (len (polys)))
+		def find (r):
+			while parent[r] != r:
+				parent[r] = parent[parent[r]]
+				r = parent[r]
+			return r
+		for length, r, s, a, b in shared:
+			r, s = find (r), find (s)
+			if r == s:
+				continue
+			merged = self.merge (polys[r], polys[s], a, b)
+			if merged is not None:
+				polys[r] = merged
+				polys[s] = None
+				parent[s] = r
+		self.regions += [p for p in polys if p is not None]
+
+	#Region across every edge, -1 where there is none
+	def links (self):
+		edges = {}
+		for r, p in enumerate (self.regions):
+			for k in range (len (p)):
+				edges[(p[k], p[(k + 1)%len (p)])] = r
+		return [[edges.get ((p[(k + 1)%len (p)], p[k]), -1) for k in range (len (p))] for p in self.regions]
+
+	def pack (self):
+		verts = np.array (self.verts, dtype=np.float64).reshape (-1, 3)
+		data = pack ('<2I', NAV_VERSION, len (verts)) + verts.astype ('<f4').tobytes ()
+		corners = np.array ([k for p in self.regions for k in p], dtype=np.int64)
+		links = [r for l in self.links () for r in l]
+		
+		regions = np.zeros (len (self.regions), dtype=REGION)
+		regions['count'] = [len (p) for p in self.regions]
+		if len (regions):
+			regions['first'][1:] = np.cumsum (regions['count'][:-1])
+			sums = np.add.reduceat (verts[corners], regions['first'].astype (np.int64), axis=0)
+			regions['centre'] = sums/regions['count'][:, None]
+		data += pack ('<I', len (regions)) + regions.tobytes ()
+		data += pack ('<I', len (corners))
+		data += corners.astype ('<u4').tobytes () + np.array (links, dtype='<i4').tobytes ()
+		return data
+
+	def report (self):
+		portals = sum (1 for l in self.links () for r in l if r >= 0)//2
+		return 'Navmesh: {0} of {1} faces walkable, {2} regions, {3} portals'.format (
+			self.walkable, self.faces, len (self.regions), portals)
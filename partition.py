@@ -0,0 +1,83 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Cuts meshes too big for 16 bit indices into parts that fit. Triangles are
+#ordered along a Morton curve through their centres and cut into runs, so
+#every part is a compact patch of the surface rather than a scatter of
+#triangles, and each stays under a vertex budget small enough to keep the
+#post transform cache effective
+import numpy as np
+
+INDEX_LIMIT = 1<<16
+VERTEX_BUDGET = 16384
+#Collision faces point at their first index with 16 bits as well
+TRIANGLE_LIMIT = INDEX_LIMIT//3
+
+def oversized (nverts, nindices = 0, npoints = 0):
+	return max (nverts, nindices, npoints) > INDEX_LIMIT
+
+#Spreads the low 21 bits of every value out to every third bit
+def part1by2 (x):
+	x = x.astype (np.uint64) & np.uint64 (0x1fffff)
+	x = (x | x << np.uint64 (32)) & np.uint64 (0x1f00000000ffff)
+	x = (x | x << np.uint64 (16)) & np.uint64 (0x1f0000ff0000ff)
+	x = (x | x << np.uint64 (8)) & np.uint64 (0x100f00f00f00f00f)
+	x = (x | x << np.uint64 (4)) & np.uint64 (0x10c30c30c30c30c3)
+	x = (x | x << np.uint64 (2)) & np.uint64 (0x1249249249249249)
+	return x
+
+#Morton codes of points within their bounds
+def morton (points):
+	lo = points.min (axis=0)
+	size = np.maximum (points.max (axis=0) - lo, 1e-12)
+	q = ((points - lo)/size*((1<<21) - 1)).astype (np.uint64)
+	return part1by2 (q[:, 0]) | part1by2 (q[:, 1]) << np.uint64 (1) | part1by2 (q[:, 2]) << np.uint64 (2)
+
+#Cuts triangles into runs along the curve. A run ends before it would use
+#more than max_verts vertices or max_tris triangles, or, given a cost per
+#vertex, more than max_cost of it. tris indexes co. Returns a list of
+#arrays of triangle numbers
+def clusters (co, tris, max_verts = VERTEX_BUDGET, max_tris = None, cost = None, max_cost = None):
+	co = np.asarray (co, dtype=np.float64)
+	tris = np.asarray (tris, dtype=np.int64).reshape (-1, 3)
+	order = np.argsort (morton (co[tris].mean (axis=1)), kind='stable')
+	max_tris = max_tris or len (tris)
+	costs = cost.tolist () if cost is not None else None
+	out = []
+	start = 0
+	seen = set ()
+	total = 0
+	for i, t in enumerate (tris[order].tolist ()):
+		new = set (t) - seen
+		add = sum (costs[v] for v in new) if costs is not None else 0
+		full = len (seen) + len (new) > max_verts or i - start >= max_tris
+		if costs is not None and total + add > max_cost:
+			full = True
+		if full and i > start:
+			out.append (order[start:i])
+			start = i
+			seen = set ()
+			total = 0
+			new = set (t)
+			add = sum (costs[v] for v in new) if costs is not None else 0
+		seen |= new
+		total += add
+	if start < len (order):
+		out.append (order[start:])
+	return out
@@ -0,0 +1,159 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Compact vertex attribute encoding. Everything in here works on whole arrays
+#at once so it stays cheap even on very dense meshes
+import numpy as np
+
+def unorm16 (x):
+	return np.clip (np.rint (x*65535.0), 0, 65535).astype ('<u2')
+
+def snorm16 (x):
+	return np.clip (np.rint (x*32767.0), -32767, 32767).astype ('<i2')
+
+def snorm8 (x):
+	return np.clip (np.rint (x*127.0), -127, 127).astype ('i1')
+
+#Maps positions inside the box [lo, hi] onto 16 bit unsigned values
+def quantize_box (pos, lo, hi):
+	pos = np.asarray (pos, dtype=np.float64).reshape (-1, 3)
+	lo = np.asarray (lo, dtype=np.float64)
+	size = np.asarray (hi, dtype=np.float64) - lo
+	#Flat boxes still need a usable scale
+	size[size <= 0] = 1.0
+	q = unorm16 ((pos - lo)/size)
+	err = np.abs (lo + q*(size/65535.0) - pos)
+	return q, float (err.max (initial=0.0))
+
+#Maps positions inside a sphere of the given radius onto 16 bit signed values
+def quantize_radius (pos, radius):
+	pos = np.asarray (pos, dtype=np.float64).reshape (-1, 3)
+	if radius <= 0:
+		radius = 1.0
+	q = snorm16 (pos/radius)
+	err = np.abs (q*(radius/32767.0) - pos)
+	return q, float (err.max (initial=0.0))
+
+#UVs are free to tile, so they are stored relative to their own bounds.
+#Returns the offset and scale needed to rebuild them alongside the values
+def quantize_uvs (uv):
+	uv = np.asarray (uv, dtype=np.float64).reshape (-1, 2)
+	if 0 == len (uv):
+		return np.zeros ((0, 2), dtype='<u2'), (0.0, 0.0), (1.0, 1.0), 0.0
+	lo = uv.min (axis=0)
+	scale = uv.max (axis=0) - lo
+	scale[scale <= 0] = 1.0
+	q = unorm16 ((uv - lo)/scale)
+	err = np.abs (lo + q*(scale/65535.0) - uv)
+	return q, tuple (lo), tuple (scale), float (err.max (initial=0.0))
+
+#Octahedral normal encoding into two components of the given bit depth.
+#The error is reported as the worst angular deviation in degrees
+def quantize_normals (n, bits):
+	n = np.asarray (n, dtype=np.float64).reshape (-1, 3)
+	l1 = np.abs (n).sum (axis=1, keepdims=True)
+	l1[l1 == 0] = 1.0
+	p = n/l1
+
+	#Fold the lower hemisphere over the diagonals
+	x = p[:, 0].copy ()
+	y = p[:, 1].copy ()
+	lower = p[:, 2] < 0
+	sx = np.where (x >= 0, 1.0, -1.0)
+	sy = np.where (y >= 0, 1.0, -1.0)
+	fx = (1.0 - np.abs (y))*sx
+	fy = (1.0 - np.abs (x))*sy
+	x[lower] = fx[lower]
+	y[lower] = fy[lower]
+	e = np.stack ((x, y), axis=1)
+
+	if 8 == bits:
+		q = snorm8 (e)
+		d = q/127.0
+	else:
+		q = snorm16 (e)
+		d = q/32767.0
+
+	#Decode again to measure how far off we are
+	z = 1.0 - np.abs (d[:, 0]) - np.abs (d[:, 1])
+	t = np.clip (-z, 0.0, None)
+	dx = d[:, 0] - np.where (d[:, 0] >= 0, t, -t)
+	dy = d[:, 1] - np.where (d[:, 1] >= 0, t, -t)
+	r = np.stack ((dx, dy, z), axis=1)
+	r /= np.linalg.norm (r, axis=1, keepdims=True)
+	m = n/np.maximum (np.linalg.norm (n, axis=1, keepdims=True), 1e-12)
+	cos = np.clip ((r*m).sum (axis=1), -1.0, 1.0)
+	err = np.degrees (np.arccos (cos))
+	return q, float (err.max (initial=0.0))
+
+#Level vertices: <3f2f becomes positions over the mesh AABB and UVs over
+#their own range, prefixed with the UV offset and scale as <4f
+LEVEL_VERTEX = np.dtype ([('pos', '<u2', 3), ('uv', '<u2', 2)])
+
+def pack_level_verts (verts, centre, extents):
+	a = np.asarray (verts, dtype=np.float64).reshape (-1, 5)
+	lo = np.asarray (centre) - np.asarray (extents)
+	hi = np.asarray (centre) + np.asarray (extents)
+	out = np.empty (len (a), dtype=LEVEL_VERTEX)
+	out['pos'], perr = quantize_box (a[:, 0:3], lo, hi)
+	out['uv'], uvlo, uvscale, uverr = quantize_uvs (a[:, 3:5])
+	head = np.array (uvlo + uvscale, dtype='<f4').tobytes ()
+	return head + out.tobytes (), perr, uverr
+
+#Model points: bone space <4f becomes positions over the distal radius with
+#the weight stored as a 16 bit fraction
+MODEL_POINT = np.dtype ([('pos', '<i2', 3), ('weight', '<u2')])
+
+def pack_model_points (points, distal):
+	a = np.asarray (points, dtype=np.float64).reshape (-1, 4)
+	out = np.empty (len (a), dtype=MODEL_POINT)
+	out['pos'], perr = quantize_radius (a[:, 0:3], distal)
+	out['weight'] = unorm16 (a[:, 3])
+	return out.tobytes (), perr
+
+#Model vertices: <4f2f4H (or 6H with four bones) becomes an octahedral
+#normal, 16 bit UVs and the untouched point range and bone indices
+def model_vertex (bits, width = 4):
+	n = 'i1' if 8 == bits else '<i2'
+	return np.dtype ([('normal', n, 2), ('uv', '<u2', 2), ('info', '<u2', width)])
+
+def pack_model_verts (normals, uvs, info, bits):
+	n = len (info)
+	width = len (info[0]) if n else 4
+	out = np.empty (n, dtype=model_vertex (bits, width))
+	out['normal'], nerr = quantize_normals (normals, bits)
+	out['uv'], uvlo, uvscale, uverr = quantize_uvs (uvs)
+	out['info'] = np.asarray (info, dtype='<u2').reshape (-1, width)
+	head = np.array (uvlo + uvscale, dtype='<f4').tobytes ()
+	return head + out.tobytes (), nerr, uverr
+
+#Collects the worst error seen for each mesh
+class Report:
+	def __init__ (self):
+		self.meshes = {}
+
+	def add (self, name, pos = 0.0, normal = 0.0, uv = 0.0):
+		prev = self.meshes.get (name, (0.0, 0.0, 0.0))
+		self.meshes[name] = (max (prev[0], pos), max (prev[1], normal), max (prev[2], uv))
+
+	def report (self):
+		lines = ['Quantisation error (max):']
+		for name, e in self.meshes.items ():
+			lines.append ('\t{0} - pos: {1:.6f} normal: {2:.3f} deg uv: {3:.6f}'.format (
+				name, e[0], e[1], e[2]))
+		return '\n'.join (lines)
@@ -0,0 +1,44 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Reads the files the exporters write without Blender. Files are memory
+#mapped and every array is a NumPy view straight into the mapping;
+#compressed containers are inflated into memory first.
+#
+#From the add-on folder, `python -m reader FILE...` dumps statistics.
+from .level import Level
+from .model import Model
+from .anim import Anim, PoseTable
+from . import formats
+
+def load (path):
+	with open (path, 'rb') as f:
+		magick = f.read (4)
+		#Containers name what they hold
+		if formats.CONTAINER_MAGICK == magick:
+			f.seek (12)
+			magick = f.read (4)
+	if formats.LEVEL_MAGICK == magick:
+		return Level (path)
+	if formats.MODEL_MAGICK == magick:
+		return Model (path)
+	if formats.ANIM_MAGICK == magick:
+		return Anim (path)
+	if formats.POSE_MAGICK == magick:
+		return PoseTable (path)
+	raise RuntimeError ('{0} is not a Traum file'.format (path))
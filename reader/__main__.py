@@ -0,0 +1,254 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import argparse
+import time
+import numpy as np
+from . import load, Level, Model, Anim, PoseTable
+from .anim import compare
+from .level import load_in_place
+from . import formats as F
+from .blob import Blob
+from .container import Container
+
+def flags (f):
+	return '{0:#x}'.format (f) if f else 'none'
+
+def dump_level (l):
+	print ('\tversion: {0:#x} flags: {1}'.format (l.version, flags (l.flags)))
+	print ('\tmeshes: {0}'.format (l.nmeshes))
+	print ('\tworld nodes: {0}'.format (len (l.world)))
+	tris = 0
+	ctris = 0
+	buckets = 0
+	for m in l.meshes ():
+		tris += m.triangles ()
+		buckets += m.nbuckets
+		ctris += len (m.collision.faces)
+	print ('\tbuckets: {0}'.format (buckets))
+	print ('\ttriangles: {0}'.format (tris))
+	print ('\tcollision polygons: {0}'.format (ctris))
+	if l.flags & F.LEVEL_HULLS:
+		hulls = [h for n in range (l.nmeshes) for h in l.hulls (n)]
+		print ('\tconvex hulls: {0} ({1} planes)'.format (len (hulls), sum (len (h.planes) for h in hulls)))
+	nav = l.navmesh
+	if nav is not None:
+		print ('\tnavmesh: {0} regions, {1} portals'.format (len (nav), int (np.count_nonzero (nav.neighbours >= 0))//2))
+	if l.binary_entities:
+		e = l.entities
+		print ('\tentities: {0} ({1} properties, {2} types)'.format (
+			len (e.records), len (e.props), len (e.types)))
+		for t in e.types:
+			print ('\t\t{0}: {1}'.format (e.string (t['type']), t['count']))
+	else:
+		print ('\tentities: {0} bytes of text'.format (len (l.entities)))
+	if l.aligned:
+		print ('\taligned to {0} bytes, {1} relocations'.format (l.alignment, len (l.relocations)))
+	for name, ofs in l.sections.items ():
+		print ('\tsection {0} at {1}'.format (name, ofs))
+
+def dump_model (m):
+	print ('\tversion: {0:#x} flags: {1}'.format (m.version, flags (m.flags)))
+	print ('\tanimset: {0:#x}'.format (m.animset))
+	levels = ''
+	if m.skeleton.levels is not None:
+		levels = ', breadth first in {0} levels'.format (len (m.skeleton.levels) - 1)
+	print ('\tbones: {0}{1}'.format (m.nbones, levels))
+	print ('\tdistal: {0}'.format (m.distal))
+	print ('\tmaterials: {0}'.format (', '.join (m.materials)))
+	print ('\tweights per vertex: {0}'.format (m.nweights))
+	for i, mesh in enumerate (m.meshes ()):
+		palette = ''
+		if mesh.palette is not None:
+			palette = ' palette {0}'.format (len (mesh.palette))
+		if m.flags & F.MODEL_SHARED:
+			palette += ' base vertex {0} first index {1}'.format (mesh.record['base_vertex'], mesh.record['first_index'])
+		print ('\tmesh {0}: {1} points {2} verts {3} strips {4} tris lods {5}{6}'.format (
+			i, len (mesh.points), len (mesh.verts), len (mesh.strips),
+			mesh.triangles (), len (m.lods (i)), palette))
+
+def dump_anim (a):
+	print ('\tversion: {0:#x} flags: {1}'.format (a.version, flags (a.flags)))
+	print ('\tanimset: {0:#x}'.format (a.animset))
+	print ('\tbones: {0} ({1} animated)'.format (a.nbones, len (a.active)))
+	print ('\tframes: {0} at {1} fps'.format (a.nframes, a.fps))
+	if a.flags & F.ANIM_BLOCKS:
+		print ('\tblocks: {0} of {1} frames'.format (len (a.blocks), a.block_frames))
+	if a.flags & F.ANIM_SHARED:
+		print ('\tshared bones: {0}'.format (a.nbones - len (a.keyed)))
+	print ('\tevents: {0}'.format (len (a.events)))
+	for e in a.events:
+		print ('\t\t{0} - {1}'.format (e['frame'], e['name'].decode ('ascii')))
+
+def dump_pose (p):
+	print ('\tversion: {0:#x}'.format (p.version))
+	print ('\tanimset: {0:#x}'.format (p.animset))
+	print ('\tbones: {0} ({1} shared)'.format (p.nbones, int (np.count_nonzero (p.mask))))
+
+#Reads every byte of an array so the pages really are faulted in
+def touch (a):
+	return int (np.frombuffer (a, dtype='u1').sum ())
+
+def is_container (path):
+	with open (path, 'rb') as f:
+		return F.CONTAINER_MAGICK == f.read (4)
+
+#Times inflating each section of a container on its own, then the lot
+#over every core
+def bench_container (path):
+	with Blob (path) as blob:
+		c = Container (blob)
+		codec = {F.STORE: 'store', F.ZLIB: 'zlib', F.LZMA: 'lzma'}[c.codec]
+		print ('\tcontainer: {0}, {1} KiB chunks, {2} -> {3} bytes ({4:.2f}:1)'.format (
+			codec, c.chunk_size//1024, c.size, blob.size, c.size/max (blob.size, 1)))
+		for s in c.sections:
+			tag = s['tag'].decode ('ascii')
+			first = int (s['first'])
+			packed = int (c.chunks['size'][first:first + int (s['count'])].sum ())
+			start = time.perf_counter ()
+			c.unpack ([tag], 1)
+			t = time.perf_counter () - start
+			print ('\t\t{0}: {1} -> {2} bytes ({3:.2f}:1), inflate {4:.1f} MiB/s'.format (
+				tag, int (s['size']), packed, int (s['size'])/max (packed, 1),
+				int (s['size'])/(1024*1024)/max (t, 1e-9)))
+		start = time.perf_counter ()
+		c.unpack (None, 1)
+		serial = time.perf_counter () - start
+		start = time.perf_counter ()
+		c.unpack ()
+		parallel = time.perf_counter () - start
+		mb = c.size/(1024*1024)
+		print ('\tinflate: {0:.1f} MiB/s on one thread, {1:.1f} MiB/s on all'.format (
+			mb/max (serial, 1e-9), mb/max (parallel, 1e-9)))
+
+#Loads a file, handing clips the pose table of their animset if given one
+def open_file (path, tables):
+	f = load (path)
+	if isinstance (f, Anim) and f.animset in tables:
+		f.share (tables[f.animset])
+	return f
+
+#Times opening the file and touching every array in it
+def bench (path, tables):
+	if is_container (path):
+		bench_container (path)
+	start = time.perf_counter ()
+	f = open_file (path, tables)
+	opened = time.perf_counter ()
+	if isinstance (f, Level):
+		for m in f.meshes ():
+			for b in m.buckets:
+				touch (b.verts)
+				if b.indices is not None:
+					touch (b.indices)
+			touch (m.collision.verts)
+			touch (m.collision.indices)
+	elif isinstance (f, Model):
+		for m in f.meshes ():
+			touch (m.points)
+			touch (m.verts)
+			for s in m.strips:
+				touch (s)
+	elif isinstance (f, Anim):
+		for i in range (len (f)):
+			touch (f.frame (i)[1])
+	done = time.perf_counter ()
+	if isinstance (f, Anim) and (f.shared is not None or len (f.keyed) == f.nbones):
+		#Decoding a pose only ever reads its own block
+		order = np.random.default_rng (0).integers (0, len (f), 1000)
+		t = time.perf_counter ()
+		for n in order:
+			f.packed_pose (int (n))
+		print ('\tseek: {0:.1f} us per random pose'.format (1e6*(time.perf_counter () - t)/len (order)))
+	size = f.blob.size
+	aligned = isinstance (f, Level) and f.aligned
+	f.close ()
+	if aligned and not is_container (path):
+		t = time.perf_counter ()
+		data, count = load_in_place (path, 1<<32)
+		print ('\tin place: read and {0} fixups in {1:.3f} ms'.format (count, 1000*(time.perf_counter () - t)))
+
+	mb = size/(1024*1024)
+	print ('\topen: {0:.3f} ms'.format (1000*(opened - start)))
+	print ('\ttraverse: {0:.3f} ms ({1:.1f} MiB/s over {2:.1f} MiB)'.format (
+		1000*(done - opened), mb/max (done - opened, 1e-9), mb))
+
+def main ():
+	parser = argparse.ArgumentParser (prog='python -m reader',
+		description='Dumps statistics about Traum .level, .tm and .ta files')
+	parser.add_argument ('files', nargs='+')
+	parser.add_argument ('--bench', action='store_true',
+		help='time opening and walking every array in the file')
+	parser.add_argument ('--compare', action='store_true',
+		help='check two clips decode to exactly the same poses')
+	parser.add_argument ('--validate', action='store_true',
+		help='check in-place levels can be loaded with one read and pointer fixups')
+	parser.add_argument ('--pose', action='append', default=[], metavar='TABLE',
+		help='shared pose table for clips of its animset, may be repeated')
+	args = parser.parse_args ()
+
+	tables = {}
+	for path in args.pose:
+		t = PoseTable (path)
+		tables[t.animset] = t
+
+	if args.compare:
+		if 2 != len (args.files):
+			parser.error ('--compare takes two clips')
+		with open_file (args.files[0], tables) as a, open_file (args.files[1], tables) as b:
+			n = compare (a, b)
+		if n is not None:
+			print ('clips differ from frame {0}'.format (n))
+			raise SystemExit (1)
+		print ('clips match over {0} frames'.format (a.nframes))
+		return
+
+	if args.validate:
+		bad = 0
+		for path in args.files:
+			with load (path) as f:
+				problems = f.validate () if isinstance (f, Level) else ['not a level']
+				if problems:
+					bad += 1
+					print ('{0}:'.format (path))
+					for p in problems:
+						print ('\t' + p)
+				else:
+					print ('{0}: aligned to {1} bytes, {2} pointers relocated'.format (
+						path, f.alignment, len (f.relocations)))
+		if bad:
+			raise SystemExit (1)
+		return
+
+	for path in args.files:
+		print (path)
+		if args.bench:
+			bench (path, tables)
+			continue
+		with load (path) as f:
+			print ('\tsize: {0} bytes'.format (f.blob.size))
+			if isinstance (f, Level):
+				dump_level (f)
+			elif isinstance (f, Model):
+				dump_model (f)
+			elif isinstance (f, PoseTable):
+				dump_pose (f)
+			else:
+				dump_anim (f)
+
+main ()
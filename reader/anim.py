@@ -0,0 +1,179 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import math
+import numpy as np
+from .container import open_blob
+from . import formats as F
+
+#Unpacks 10 bit angles into radians
+def unpack_angles (packed):
+	packed = np.asarray (packed, dtype=np.uint32)
+	out = np.empty ((len (packed), 3))
+	for k in range (3):
+		out[:, k] = ((packed >> (10*k)) & 1023)*(math.pi/512.0)
+	return out
+
+class Anim:
+	def __init__ (self, path):
+		self.blob = blob = open_blob (path)
+		if blob.bytes (0, 4) != F.ANIM_MAGICK:
+			raise RuntimeError ('{0} is not an animation'.format (path))
+
+		self.version, = blob.unpack ('<I', 4)
+		self.flags = 0
+		if F.VERSION_FLAGS == self.version:
+			self.flags, self.animset, nevents, self.nbones, self.nframes, self.fps = blob.unpack ('<5If', 8)
+			ofs = 32
+		elif F.ANIM_VERSION == self.version:
+			self.animset, nevents, self.nbones, self.nframes, self.fps = blob.unpack ('<4If', 8)
+			ofs = 28
+		else:
+			raise RuntimeError ('{0} has unknown version {1:#x}'.format (path, self.version))
+
+		self.events = blob.view (F.EVENT, ofs, nevents)
+		ofs += F.EVENT.itemsize*nevents
+		self.codes = blob.view ('u1', ofs, self.nbones)
+		ofs += self.nbones
+
+		#Blocked clips start a keyframe every block_frames frames, and list
+		#where each block starts. A single run is one block of the lot
+		self.block_frames = max (self.nframes, 1)
+		self.blocks = np.zeros (1, dtype='<u4')
+		if self.flags & F.ANIM_BLOCKS:
+			self.block_frames, nblocks = blob.unpack ('<2I', ofs)
+			self.blocks = blob.view ('<u4', ofs + 8, nblocks)
+			ofs += 8 + 4*nblocks
+
+		#Keyframes hold every bone but those in the shared pose table, the
+		#rest only the animated ones, so every other frame is the same size
+		self.active = np.nonzero (self.codes & F.CODE_AXES)[0]
+		self.keyed = np.nonzero (0 == self.codes & F.CODE_SHARED)[0]
+		self.ofs_frames = ofs
+		self.first_size = 4 + 4*len (self.keyed)
+		self.frame_size = 4 + 4*len (self.active)
+		self.shared = None
+
+	def close (self):
+		self.events = None
+		self.codes = None
+		self.blob.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def __len__ (self):
+		return self.nframes
+
+	#Supplies the shared pose table of the animset, which clips that
+	#reference one need before they can be decoded
+	def share (self, table):
+		if (table.animset, table.nbones) != (self.animset, self.nbones):
+			raise RuntimeError ('pose table is for animset {0:#x}, not {1:#x}'.format (table.animset, self.animset))
+		self.shared = table
+
+	def is_key (self, n):
+		return 0 == n%self.block_frames
+
+	#Seeks straight to the block holding frame n, then into it
+	def frame_offset (self, n):
+		if n < 0 or n >= self.nframes:
+			raise IndexError ('frame {0} out of range'.format (n))
+		block, k = divmod (n, self.block_frames)
+		ofs = self.ofs_frames + int (self.blocks[block])
+		if 0 == k:
+			return ofs
+		return ofs + self.first_size + (k - 1)*self.frame_size
+
+	#Returns the root height and the packed angles stored for frame n
+	def frame (self, n):
+		ofs = self.frame_offset (n)
+		z = self.blob.unpack ('<f', ofs)[0]
+		count = len (self.keyed) if self.is_key (n) else len (self.active)
+		return z, self.blob.view ('<u4', ofs + 4, count)
+
+	#Every bone's packed angles in keyframe n
+	def keyframe (self, n):
+		z, packed = self.frame (n)
+		if len (self.keyed) == self.nbones:
+			return z, np.array (packed)
+		if self.shared is None:
+			raise RuntimeError ('{0} needs the pose table of animset {1:#x}'.format (self.blob.path, self.animset))
+		out = np.array (self.shared.values)
+		out[self.keyed] = packed
+		return z, out
+
+	#Returns the root height and every bone's packed angles for frame n,
+	#reading nothing outside its block
+	def packed_pose (self, n):
+		if self.is_key (n):
+			return self.keyframe (n)
+		z, packed = self.frame (n)
+		out = self.keyframe (n - n%self.block_frames)[1]
+		out[self.active] = packed
+		return z, out
+
+	#Returns the root height and every bone's angles in radians for frame n
+	def pose (self, n):
+		z, packed = self.packed_pose (n)
+		return z, unpack_angles (packed)
+
+	def size (self):
+		return self.blob.size
+
+#Bone values shared by every clip of an animset
+class PoseTable:
+	def __init__ (self, path):
+		self.blob = blob = open_blob (path)
+		if blob.bytes (0, 4) != F.POSE_MAGICK:
+			raise RuntimeError ('{0} is not a pose table'.format (path))
+		self.version, self.animset, self.nbones = blob.unpack ('<3I', 4)
+		if F.POSE_VERSION != self.version:
+			raise RuntimeError ('{0} has unknown version {1:#x}'.format (path, self.version))
+		self.values = blob.view ('<u4', 16, self.nbones)
+		#Which bones any clip takes from the table
+		self.mask = blob.view ('u1', 16 + 4*self.nbones, self.nbones)
+
+	def close (self):
+		self.values = None
+		self.mask = None
+		self.blob.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def size (self):
+		return self.blob.size
+
+#Returns the first frame where two clips decode differently, or None if
+#every frame matches bit for bit, whatever layout either is stored in
+def compare (a, b):
+	if (a.nbones, a.nframes) != (b.nbones, b.nframes):
+		return 0
+	for n in range (a.nframes):
+		za, pa = a.packed_pose (n)
+		zb, pb = b.packed_pose (n)
+		if np.float32 (za).tobytes () != np.float32 (zb).tobytes () or not np.array_equal (pa, pb):
+			return n
+	return None
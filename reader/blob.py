@@ -0,0 +1,76 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import mmap
+from struct import unpack_from, calcsize
+import numpy as np
+
+#A memory mapped file. Views handed out by this never copy; they point
+#straight into the mapping and are read only
+class Blob:
+	def __init__ (self, path):
+		self.path = path
+		self.file = open (path, 'rb')
+		try:
+			self.map = mmap.mmap (self.file.fileno (), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			#Empty files cannot be mapped
+			self.file.close ()
+			raise RuntimeError ('{0} is empty'.format (path))
+		self.size = len (self.map)
+
+	def close (self):
+		#Views still alive keep the mapping pinned, so leave it to the
+		#garbage collector in that case
+		try:
+			self.map.close ()
+		except BufferError:
+			pass
+		self.file.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def check (self, ofs, size):
+		if ofs < 0 or ofs + size > self.size:
+			raise RuntimeError ('{0}: read of {1} bytes at {2} runs past the end ({3} bytes)'.format (
+				self.path, size, ofs, self.size))
+
+	def unpack (self, fmt, ofs):
+		self.check (ofs, calcsize (fmt))
+		return unpack_from (fmt, self.map, ofs)
+
+	def u32 (self, ofs):
+		return self.unpack ('<I', ofs)[0]
+
+	def bytes (self, ofs, size):
+		self.check (ofs, size)
+		return self.map[ofs:ofs + size]
+
+	def view (self, dtype, ofs, count):
+		dtype = np.dtype (dtype)
+		self.check (ofs, dtype.itemsize*count)
+		return np.frombuffer (self.map, dtype=dtype, count=count, offset=ofs)
+
+	def string (self, ofs):
+		#Length prefixed UTF-8, returns the string and the offset after it
+		n = self.u32 (ofs)
+		return self.bytes (ofs + 4, n).decode ('utf-8'), ofs + 4 + n
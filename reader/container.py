@@ -0,0 +1,104 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Compressed containers. Every chunk inflates on its own, so they are
+#spread over a thread pool; zlib and lzma let go of the GIL while they work
+import concurrent.futures
+import lzma
+import os
+import zlib
+from struct import calcsize
+from .blob import Blob
+from . import formats as F
+
+#A Blob over memory rather than a mapping, for inflated files
+class Buffer (Blob):
+	def __init__ (self, path, data):
+		self.path = path
+		self.file = None
+		self.map = data
+		self.size = len (data)
+
+	def close (self):
+		self.map = None
+
+class Container:
+	def __init__ (self, blob):
+		self.blob = blob
+		magick, self.version, self.codec, self.magick, self.chunk_size, nsections, nchunks = blob.unpack (F.CONTAINER_HEADER, 0)
+		if F.CONTAINER_MAGICK != magick:
+			raise RuntimeError ('{0} is not a container'.format (blob.path))
+		if F.CONTAINER_VERSION != self.version:
+			raise RuntimeError ('{0} has unknown container version {1:#x}'.format (blob.path, self.version))
+		if self.codec not in (F.STORE, F.ZLIB, F.LZMA):
+			raise RuntimeError ('{0} has unknown codec {1}'.format (blob.path, self.codec))
+		ofs = calcsize (F.CONTAINER_HEADER)
+		self.sections = blob.view (F.CONTAINER_SECTION, ofs, nsections)
+		ofs += F.CONTAINER_SECTION.itemsize*nsections
+		self.chunks = blob.view (F.CONTAINER_CHUNK, ofs, nchunks)
+		self.size = int (self.sections['size'].sum ()) if nsections else 0
+
+	#Inflates chunk n into out, which is the whole of the wrapped file
+	def inflate (self, n, out):
+		s = self.section_of (n)
+		i = n - int (s['first'])
+		start = int (s['offset']) + i*self.chunk_size
+		size = min (self.chunk_size, int (s['offset']) + int (s['size']) - start)
+		c = self.chunks[n]
+		data = self.blob.bytes (int (c['offset']), int (c['size']))
+		if len (data) != size:
+			if F.ZLIB == self.codec:
+				data = zlib.decompress (data)
+			else:
+				data = lzma.decompress (data)
+			if len (data) != size:
+				raise RuntimeError ('{0}: chunk {1} inflated to {2} bytes, expected {3}'.format (
+					self.blob.path, n, len (data), size))
+		out[start:start + size] = data
+
+	def section_of (self, n):
+		for s in self.sections:
+			if s['first'] <= n < s['first'] + s['count']:
+				return s
+		raise IndexError ('chunk {0} out of range'.format (n))
+
+	#Chunks belonging to the sections with the given tags, or all of them
+	def select (self, tags = None):
+		out = []
+		for s in self.sections:
+			if tags is None or s['tag'].decode ('ascii') in tags:
+				out += range (int (s['first']), int (s['first']) + int (s['count']))
+		return out
+
+	def unpack (self, tags = None, threads = None):
+		out = bytearray (self.size)
+		view = memoryview (out)
+		chunks = self.select (tags)
+		with concurrent.futures.ThreadPoolExecutor (threads or os.cpu_count ()) as pool:
+			for r in pool.map (lambda n: self.inflate (n, view), chunks):
+				pass
+		return out
+
+#Maps a file, inflating it first if it is a container
+def open_blob (path):
+	blob = Blob (path)
+	if blob.size < 4 or blob.bytes (0, 4) != F.CONTAINER_MAGICK:
+		return blob
+	with blob:
+		data = Container (blob).unpack ()
+	return Buffer (path, data)
@@ -0,0 +1,173 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Layout of everything the exporters write. This is kept free of Blender so
+#the reader can run anywhere; keep it in step with texport and aexport
+import numpy as np
+
+LEVEL_MAGICK = b'SW3R'
+MODEL_MAGICK = b'RDKT'
+ANIM_MAGICK = b'RDTA'
+POSE_MAGICK = b'RDTP'
+CONTAINER_MAGICK = b'TRZC'
+
+LEVEL_VERSION = 0x20200526
+MODEL_VERSION = 0x20200429
+ANIM_VERSION = 0x20200430
+#Followed by a bitfield of the flags below
+VERSION_FLAGS = 0x20261019
+CONTAINER_VERSION = 0x20261019
+POSE_VERSION = 0x20261019
+
+LEVEL_WELDED = 1<<0
+LEVEL_QUANTIZED = 1<<1
+LEVEL_LODS = 1<<2
+LEVEL_BINARY_ENTITIES = 1<<3
+LEVEL_ALIGNED = 1<<4
+LEVEL_HULLS = 1<<5
+LEVEL_NAVMESH = 1<<6
+
+MODEL_QUANTIZED = 1<<0
+MODEL_OCT16 = 1<<1
+MODEL_LODS = 1<<2
+MODEL_SKIN4 = 1<<3
+MODEL_PALETTES = 1<<4
+MODEL_SHARED = 1<<5
+MODEL_SKELETON = 1<<6
+
+ANIM_BLOCKS = 1<<0
+ANIM_SHARED = 1<<1
+#Bone codes: the low three bits mark the animated axes, this one a bone
+#whose value lives in the animset's shared pose table
+CODE_AXES = 7
+CODE_SHARED = 1<<3
+
+#Compressed containers
+STORE, ZLIB, LZMA = range (3)
+CONTAINER_HEADER = '<4s2I4s3I'
+CONTAINER_SECTION = np.dtype ([
+	('tag', 'S4'),
+	('offset', '<u4'),
+	('size', '<u4'),
+	('first', '<u4'),
+	('count', '<u4')])
+CONTAINER_CHUNK = np.dtype ([('offset', '<u4'), ('size', '<u4')])
+
+#Level geometry
+LEVEL_VERTEX = np.dtype ([('pos', '<f4', 3), ('uv', '<f4', 2)])
+LEVEL_QVERTEX = np.dtype ([('pos', '<u2', 3), ('uv', '<u2', 2)])
+COLLISION_FACE = np.dtype ([('start', '<u2'), ('count', '<u2')])
+#Inside a hull where normal.p <= distance for every plane
+HULL_PLANE = np.dtype ([('normal', '<f4', 3), ('distance', '<f4')])
+WORLD_NODE = np.dtype ([
+	('mesh', '<u4'),
+	('origin', '<f4', 3),
+	('angles', '<f4', 3),
+	('scale', '<f4', 3)])
+
+#In-place levels, see inplace.py. Pointers are offsets from the start of
+#the file until the loader relocates them
+ALIGNED_HEADER = '<4s3I12Q'
+ALIGNED_MESH = np.dtype ([
+	('extents', '<f4', 3),
+	('centre', '<f4', 3),
+	('radius', '<f4'),
+	('nbuckets', '<u4'),
+	('buckets', '<u8'),
+	('collision', '<u8'),
+	('lods', '<u8'),
+	('nlods', '<u4'),
+	('nhulls', '<u4'),
+	('hulls', '<u8')])
+ALIGNED_BUCKET = np.dtype ([
+	('name', '<u8'),
+	('verts', '<u8'),
+	('indices', '<u8'),
+	('nverts', '<u4'),
+	('nindices', '<u4'),
+	('isize', '<u4'),
+	('uv_offset', '<f4', 2),
+	('uv_scale', '<f4', 2),
+	('pad', '<u4')])
+ALIGNED_COLLISION = np.dtype ([
+	('nverts', '<u4'),
+	('nindices', '<u4'),
+	('npolys', '<u4'),
+	('pad', '<u4'),
+	('verts', '<u8'),
+	('indices', '<u8'),
+	('faces', '<u8')])
+ALIGNED_LOD = np.dtype ([
+	('ratio', '<f4'),
+	('error', '<f4'),
+	('screen', '<f4'),
+	('nbuckets', '<u4'),
+	('buckets', '<u8')])
+ALIGNED_HULL = np.dtype ([
+	('nverts', '<u4'),
+	('nplanes', '<u4'),
+	('verts', '<u8'),
+	('planes', '<u8')])
+
+#Navigation meshes
+NAV_REGION = np.dtype ([('first', '<u4'), ('count', '<u4'), ('centre', '<f4', 3)])
+
+#Binary entities
+ENTITY_RECORD = np.dtype ([
+	('type', '<u4'),
+	('name', '<u4'),
+	('first', '<u4'),
+	('count', '<u4')])
+ENTITY_PROP = np.dtype ([
+	('hash', '<u4'),
+	('key', '<u4'),
+	('vtype', '<u4'),
+	('value', 'V12')])
+ENTITY_TYPE = np.dtype ([('type', '<u4'), ('first', '<u4'), ('count', '<u4')])
+INT, FLOAT, VEC3, STRING = range (4)
+
+#Models
+BONE = np.dtype ([('pos', '<f4', 3), ('parent', '<u4')])
+MODEL_POINT = np.dtype ([('pos', '<f4', 3), ('weight', '<f4')])
+MODEL_QPOINT = np.dtype ([('pos', '<i2', 3), ('weight', '<u2')])
+def model_vertex (nbones = 2):
+	return np.dtype ([
+		('normal', '<f4', 4),
+		('uv', '<f4', 2),
+		('start', '<u2'),
+		('count', '<u2'),
+		('bones', '<u2', nbones)])
+MODEL_VERTEX = model_vertex ()
+def model_qvertex (bits, nbones = 2):
+	return np.dtype ([
+		('normal', 'i1' if 8 == bits else '<i2', 2),
+		('uv', '<u2', 2),
+		('start', '<u2'),
+		('count', '<u2'),
+		('bones', '<u2', nbones)])
+#Where a mesh's share of each pool begins in the shared layout
+MODEL_SUBMESH = np.dtype ([
+	('material', '<u4'),
+	('first_point', '<u4'), ('npoints', '<u4'),
+	('base_vertex', '<u4'), ('nverts', '<u4'),
+	('first_index', '<u4'), ('nindices', '<u4'),
+	('first_strip', '<u4'), ('nstrips', '<u4'), ('nislands', '<u4'),
+	('first_palette', '<u4'), ('npalette', '<u4')])
+
+#Animations
+EVENT = np.dtype ([('frame', '<u4'), ('name', 'S4')])
@@ -0,0 +1,580 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+from struct import unpack_from
+from .container import open_blob
+from . import formats as F
+from .nav import NavMesh
+
+#A run of triangles sharing one material
+class Bucket:
+	def __init__ (self, name, verts, indices, uv_offset = None, uv_scale = None):
+		self.name = name
+		self.verts = verts
+		self.indices = indices
+		self.uv_offset = uv_offset
+		self.uv_scale = uv_scale
+
+	def triangles (self):
+		if self.indices is not None:
+			return len (self.indices)//3
+		return len (self.verts)//3
+
+	#Returns float positions and UVs, undoing quantisation if needed
+	def decode (self, centre, extents):
+		if self.uv_offset is None:
+			return self.verts['pos'], self.verts['uv']
+		lo = np.asarray (centre) - np.asarray (extents)
+		size = 2.0*np.asarray (extents)
+		size[size <= 0] = 1.0
+		pos = lo + self.verts['pos']*(size/65535.0)
+		uv = np.asarray (self.uv_offset) + self.verts['uv']*(np.asarray (self.uv_scale)/65535.0)
+		return pos, uv
+
+#Reads one material bucket, returning it and the offset just past it
+def read_bucket (blob, ofs, welded, quantized, binary):
+	if binary:
+		name = blob.u32 (ofs)
+		ofs += 4
+	else:
+		name, ofs = blob.string (ofs)
+
+	if welded:
+		nverts, nindices, isize = blob.unpack ('<3I', ofs)
+		ofs += 12
+	else:
+		nverts = blob.u32 (ofs)
+		ofs += 4
+
+	uv_offset = uv_scale = None
+	if quantized:
+		q = blob.unpack ('<4f', ofs)
+		uv_offset, uv_scale = q[0:2], q[2:4]
+		ofs += 16
+		dtype = F.LEVEL_QVERTEX
+	else:
+		dtype = F.LEVEL_VERTEX
+	verts = blob.view (dtype, ofs, nverts)
+	ofs += dtype.itemsize*nverts
+
+	indices = None
+	if welded:
+		indices = blob.view ('<u2' if 2 == isize else '<u4', ofs, nindices)
+		ofs += isize*nindices
+	return Bucket (name, verts, indices, uv_offset, uv_scale), ofs
+
+#Closest point of every triangle of a (n, 3, 3) array to p, by the
+#Voronoi regions of its corners and edges
+def closest_points (t, p):
+	a, b, c = t[:, 0], t[:, 1], t[:, 2]
+	ab = b - a
+	ac = c - a
+	dot = lambda u, v: (u*v).sum (axis=1)
+	d1, d2 = dot (ab, p - a), dot (ac, p - a)
+	d3, d4 = dot (ab, p - b), dot (ac, p - b)
+	d5, d6 = dot (ab, p - c), dot (ac, p - c)
+	va = d3*d6 - d5*d4
+	vb = d5*d2 - d1*d6
+	vc = d1*d4 - d3*d2
+	with np.errstate (divide='ignore', invalid='ignore'):
+		denom = va + vb + vc
+		out = a + ab*(vb/denom)[:, None] + ac*(vc/denom)[:, None]
+		#Later regions take precedence, corners over edges over the face
+		regions = (
+			((va <= 0) & (d4 >= d3) & (d5 >= d6), lambda: b + (c - b)*((d4 - d3)/((d4 - d3) + (d5 - d6)))[:, None]),
+			((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda: a + ac*(d2/(d2 - d6))[:, None]),
+			((d6 >= 0) & (d5 <= d6), lambda: c),
+			((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda: a + ab*(d1/(d1 - d3))[:, None]),
+			((d3 >= 0) & (d4 <= d3), lambda: b),
+			((d1 <= 0) & (d2 <= 0), lambda: a))
+		for mask, point in regions:
+			if mask.any ():
+				out = np.where (mask[:, None], point (), out)
+	return out
+
+class Collision:
+	def __init__ (self, verts, indices, faces):
+		self.verts = verts
+		self.indices = indices
+		self.faces = faces
+
+	#Corners of every polygon fanned into triangles, as a (n, 3, 3) array
+	def triangles (self):
+		start = self.faces['start'].astype (np.int64)
+		k = np.maximum (self.faces['count'].astype (np.int64) - 2, 0)
+		a = np.repeat (start, k)
+		b = a + 1 + np.arange (k.sum ()) - np.repeat (np.cumsum (k) - k, k)
+		corners = np.stack ((a, b, b + 1), axis=1)
+		return np.asarray (self.verts, dtype=np.float64)[self.indices.astype (np.int64)[corners]]
+
+	#Whether each sphere touches the mesh, testing triangle by triangle
+	def spheres (self, centres, radius, tris = None):
+		if tris is None:
+			tris = self.triangles ()
+		out = np.zeros (len (centres), dtype=bool)
+		if not len (tris):
+			return out
+		for i, c in enumerate (np.asarray (centres, dtype=np.float64)):
+			#Zero area triangles have no closest point, their neighbours do
+			d = closest_points (tris, c) - c
+			out[i] = np.nanmin ((d*d).sum (axis=1)) <= radius*radius
+		return out
+
+class Hull:
+	def __init__ (self, verts, planes):
+		self.verts = verts
+		self.planes = planes
+
+	#Whether each sphere touches the hull. No plane may have the centre
+	#further than the radius in front of it; past edges and corners this
+	#errs on the side of a hit
+	def spheres (self, centres, radius):
+		d = np.asarray (centres) @ self.planes['normal'].T - self.planes['distance'][None, :]
+		return d.max (axis=1) <= radius
+
+def read_collision (blob, ofs):
+	nverts, nindices, npolys = blob.unpack ('<3I', ofs)
+	ofs += 12
+	verts = blob.view (('<f4', 3), ofs, nverts)
+	ofs += 12*nverts
+	indices = blob.view ('<u2', ofs, nindices)
+	ofs += 2*nindices
+	return Collision (verts, indices, blob.view (F.COLLISION_FACE, ofs, npolys))
+
+class Mesh:
+	def __init__ (self, level, ofs):
+		blob = level.blob
+		size = blob.u32 (ofs)
+		start = ofs + 4
+		nbuckets, *rest = blob.unpack ('<I3f3ff', start)
+		self.extents = tuple (rest[0:3])
+		self.centre = tuple (rest[3:6])
+		self.radius = rest[6]
+		self.nbuckets = nbuckets
+		self.level = level
+		self.ofs_buckets = start + 32
+		self.ofs_collision = start + size
+		self._buckets = None
+		self._collision = None
+
+	@property
+	def buckets (self):
+		if self._buckets is None:
+			l = self.level
+			self._buckets = []
+			ofs = self.ofs_buckets
+			for i in range (self.nbuckets):
+				b, ofs = read_bucket (l.blob, ofs, l.welded, l.quantized, l.binary_entities)
+				self._buckets.append (b)
+		return self._buckets
+
+	@property
+	def collision (self):
+		if self._collision is None:
+			self._collision = read_collision (self.level.blob, self.ofs_collision + 4)
+		return self._collision
+
+	def triangles (self):
+		return sum (b.triangles () for b in self.buckets)
+
+#Buckets reached through the descriptors of an in-place level
+def aligned_buckets (level, ofs, count, welded):
+	blob = level.blob
+	dtype = F.LEVEL_QVERTEX if level.quantized else F.LEVEL_VERTEX
+	out = []
+	for d in blob.view (F.ALIGNED_BUCKET, ofs, count):
+		verts = blob.view (dtype, int (d['verts']), int (d['nverts']))
+		indices = None
+		if welded:
+			indices = blob.view ('<u2' if 2 == d['isize'] else '<u4', int (d['indices']), int (d['nindices']))
+		uv_offset = uv_scale = None
+		if level.quantized:
+			uv_offset = tuple (d['uv_offset'].tolist ())
+			uv_scale = tuple (d['uv_scale'].tolist ())
+		out.append (Bucket (level.cstring (int (d['name'])), verts, indices, uv_offset, uv_scale))
+	return out
+
+class AlignedMesh:
+	def __init__ (self, level, d):
+		self.level = level
+		self.d = d
+		self.extents = tuple (d['extents'].tolist ())
+		self.centre = tuple (d['centre'].tolist ())
+		self.radius = float (d['radius'])
+		self.nbuckets = int (d['nbuckets'])
+		self._buckets = None
+		self._collision = None
+
+	@property
+	def buckets (self):
+		if self._buckets is None:
+			self._buckets = aligned_buckets (self.level, int (self.d['buckets']), self.nbuckets, self.level.welded)
+		return self._buckets
+
+	@property
+	def collision (self):
+		if self._collision is None:
+			blob = self.level.blob
+			c = blob.view (F.ALIGNED_COLLISION, int (self.d['collision']), 1)[0]
+			self._collision = Collision (
+				blob.view (('<f4', 3), int (c['verts']), int (c['nverts'])),
+				blob.view ('<u2', int (c['indices']), int (c['nindices'])),
+				blob.view (F.COLLISION_FACE, int (c['faces']), int (c['npolys'])))
+		return self._collision
+
+	def triangles (self):
+		return sum (b.triangles () for b in self.buckets)
+
+class Lod:
+	def __init__ (self, ratio, error, screen, buckets):
+		self.ratio = ratio
+		self.error = error
+		self.screen = screen
+		self.buckets = buckets
+
+#Binary entity table, see entity.py for the layout
+class Entities:
+	def __init__ (self, blob, ofs):
+		self.blob = blob
+		self.version, nstrings = blob.unpack ('<2I', ofs)
+		ofs += 8
+		self.offsets = blob.view ('<u4', ofs, nstrings)
+		ofs += 4*nstrings
+		size = blob.u32 (ofs)
+		self.ofs_strings = ofs + 4
+		ofs += 4 + size
+		nents, nprops = blob.unpack ('<2I', ofs)
+		ofs += 8
+		self.records = blob.view (F.ENTITY_RECORD, ofs, nents)
+		ofs += F.ENTITY_RECORD.itemsize*nents
+		self.props = blob.view (F.ENTITY_PROP, ofs, nprops)
+		ofs += F.ENTITY_PROP.itemsize*nprops
+		ntypes = blob.u32 (ofs)
+		self.types = blob.view (F.ENTITY_TYPE, ofs + 4, ntypes)
+
+	def string (self, id):
+		start = self.ofs_strings + int (self.offsets[id])
+		end = self.blob.map.find (b'\0', start)
+		return self.blob.bytes (start, end - start).decode ('utf-8')
+
+	def of_type (self, type):
+		for t in self.types:
+			if self.string (t['type']) == type:
+				return self.records[t['first']:t['first'] + t['count']]
+		return self.records[0:0]
+
+	def value (self, prop):
+		raw = prop['value'].tobytes ()
+		vtype = prop['vtype']
+		if F.INT == vtype:
+			return np.frombuffer (raw, '<i4', 1)[0]
+		if F.FLOAT == vtype:
+			return np.frombuffer (raw, '<f4', 1)[0]
+		if F.VEC3 == vtype:
+			return tuple (np.frombuffer (raw, '<f4', 3))
+		return self.string (int (np.frombuffer (raw, '<u4', 1)[0]))
+
+	def properties (self, record):
+		first = record['first']
+		out = {}
+		for p in self.props[first:first + record['count']]:
+			out[self.string (p['key'])] = self.value (p)
+		return out
+
+class Level:
+	def __init__ (self, path):
+		self.blob = blob = open_blob (path)
+		if blob.bytes (0, 4) != F.LEVEL_MAGICK:
+			raise RuntimeError ('{0} is not a level'.format (path))
+
+		self.version = blob.u32 (4)
+		ofs = 8
+		self.flags = 0
+		if F.VERSION_FLAGS == self.version:
+			self.flags = blob.u32 (8)
+			ofs += 4
+		elif F.LEVEL_VERSION != self.version:
+			raise RuntimeError ('{0} has unknown version {1:#x}'.format (path, self.version))
+
+		self.welded = bool (self.flags & F.LEVEL_WELDED)
+		self.quantized = bool (self.flags & F.LEVEL_QUANTIZED)
+		self.binary_entities = bool (self.flags & F.LEVEL_BINARY_ENTITIES)
+		self.aligned = bool (self.flags & F.LEVEL_ALIGNED)
+		self._meshes = None
+		self._lods = None
+		self._hulls = None
+		self._entities = None
+		self._navmesh = None
+		if self.aligned:
+			self.open_aligned ()
+			return
+
+		#Section offsets, optional ones in order of their flags
+		names = ['geometry', 'world', 'entities']
+		if self.flags & F.LEVEL_LODS:
+			names.append ('lods')
+		if self.flags & F.LEVEL_HULLS:
+			names.append ('hulls')
+		if self.flags & F.LEVEL_NAVMESH:
+			names.append ('navmesh')
+		self.sections = {}
+		for n in names:
+			self.sections[n] = blob.u32 (ofs)
+			ofs += 4
+
+		self.nmeshes = blob.u32 (self.sections['geometry'])
+		n = blob.u32 (self.sections['world'])
+		self.world = blob.view (F.WORLD_NODE, self.sections['world'] + 4, n)
+
+	def open_aligned (self):
+		blob = self.blob
+		head = blob.unpack (F.ALIGNED_HEADER, 0)
+		self.alignment = head[3]
+		meshes, self.nmeshes, world, nworld, ents, self.entities_size, strings, nstrings, relocs, nrelocs, nav, self.navmesh_size = head[4:]
+		self.sections = {'meshes': meshes, 'world': world, 'entities': ents,
+			'strings': strings, 'relocations': relocs}
+		if self.flags & F.LEVEL_NAVMESH:
+			self.sections['navmesh'] = nav
+		self.descriptors = blob.view (F.ALIGNED_MESH, meshes, self.nmeshes)
+		self.world = blob.view (F.WORLD_NODE, world, nworld)
+		self.relocations = blob.view ('<u8', relocs, nrelocs)
+
+	#NUL terminated string of an in-place level
+	def cstring (self, ofs):
+		end = self.blob.map.find (b'\0', ofs)
+		return self.blob.bytes (ofs, end - ofs).decode ('utf-8')
+
+	def close (self):
+		self.world = None
+		self._meshes = None
+		self._lods = None
+		self._hulls = None
+		self._entities = None
+		self._navmesh = None
+		self.blob.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def __len__ (self):
+		return self.nmeshes
+
+	#Hop over the size prefixes once so any mesh can then be reached directly
+	def mesh_offsets (self):
+		if self._meshes is None:
+			blob = self.blob
+			offsets = []
+			ofs = self.sections['geometry'] + 4
+			for i in range (self.nmeshes):
+				offsets.append (ofs)
+				ofs += 4 + blob.u32 (ofs)
+				ofs += 4 + blob.u32 (ofs)
+			self._meshes = offsets
+		return self._meshes
+
+	def mesh (self, n):
+		if self.aligned:
+			return AlignedMesh (self, self.descriptors[n])
+		return Mesh (self, self.mesh_offsets ()[n])
+
+	def meshes (self):
+		for n in range (self.nmeshes):
+			yield self.mesh (n)
+
+	def lods (self, n):
+		if self.aligned:
+			d = self.descriptors[n]
+			chain = []
+			for l in self.blob.view (F.ALIGNED_LOD, int (d['lods']), int (d['nlods'])):
+				buckets = aligned_buckets (self, int (l['buckets']), int (l['nbuckets']), True)
+				chain.append (Lod (float (l['ratio']), float (l['error']), float (l['screen']), buckets))
+			return chain
+		if 'lods' not in self.sections:
+			return []
+		if self._lods is None:
+			blob = self.blob
+			ofs = self.sections['lods']
+			version, nmesh = blob.unpack ('<2I', ofs)
+			ofs += 8
+			self._lods = []
+			for i in range (nmesh):
+				nlods = blob.u32 (ofs)
+				ofs += 4
+				chain = []
+				for j in range (nlods):
+					ratio, error, screen, nbuckets = blob.unpack ('<3fI', ofs)
+					ofs += 16
+					buckets = []
+					for k in range (nbuckets):
+						b, ofs = read_bucket (blob, ofs, True, self.quantized, self.binary_entities)
+						buckets.append (b)
+					chain.append (Lod (ratio, error, screen, buckets))
+				self._lods.append (chain)
+		return self._lods[n]
+
+	#Convex hulls standing in for the collision mesh of mesh n, if any
+	def hulls (self, n):
+		blob = self.blob
+		if self.aligned:
+			d = self.descriptors[n]
+			return [Hull (blob.view (('<f4', 3), int (h['verts']), int (h['nverts'])),
+				blob.view (F.HULL_PLANE, int (h['planes']), int (h['nplanes'])))
+				for h in blob.view (F.ALIGNED_HULL, int (d['hulls']), int (d['nhulls']))]
+		if 'hulls' not in self.sections:
+			return []
+		if self._hulls is None:
+			ofs = self.sections['hulls']
+			version, nmesh = blob.unpack ('<2I', ofs)
+			ofs += 8
+			self._hulls = []
+			for i in range (nmesh):
+				nhulls = blob.u32 (ofs)
+				ofs += 4
+				hulls = []
+				for j in range (nhulls):
+					nverts, nplanes = blob.unpack ('<2I', ofs)
+					ofs += 8
+					verts = blob.view (('<f4', 3), ofs, nverts)
+					ofs += 12*nverts
+					hulls.append (Hull (verts, blob.view (F.HULL_PLANE, ofs, nplanes)))
+					ofs += F.HULL_PLANE.itemsize*nplanes
+				self._hulls.append (hulls)
+		return self._hulls[n]
+
+	@property
+	def entities (self):
+		if self._entities is None:
+			ofs = self.sections['entities']
+			if self.binary_entities:
+				self._entities = Entities (self.blob, ofs)
+			elif self.aligned:
+				self._entities = self.blob.bytes (ofs, self.entities_size).decode ('utf-8')
+			else:
+				n = self.blob.u32 (ofs)
+				self._entities = self.blob.bytes (ofs + 4, n).decode ('utf-8')
+		return self._entities
+
+	#The navigation mesh, or None if the level has none
+	@property
+	def navmesh (self):
+		if self._navmesh is None and 'navmesh' in self.sections:
+			self._navmesh = NavMesh (self.blob, self.sections['navmesh'])
+		return self._navmesh
+
+	def name (self, bucket):
+		if self.binary_entities and not self.aligned:
+			return self.entities.string (bucket.name)
+		return bucket.name
+
+	#Checks an in-place level the way a loader would rely on it: every
+	#pointer inside the file and listed in the relocation table, and every
+	#descriptor and array on the alignment. Returns a list of problems
+	def validate (self):
+		if not self.aligned:
+			return ['not an in-place level']
+		blob = self.blob
+		a = self.alignment
+		problems = []
+		if a < 16 or a & (a - 1):
+			problems.append ('alignment {0} is not a power of two of at least 16'.format (a))
+
+		#Pointer fields by offset: what they are, where they point, how
+		#many bytes they cover and whether that has to be aligned
+		pointers = {}
+		def field (ofs, what, size, align = True):
+			target = blob.unpack ('<Q', ofs)[0]
+			if target:
+				pointers[ofs] = (what, target, size, align)
+			return target
+
+		def buckets (ofs, count, what):
+			first = field (ofs, what, F.ALIGNED_BUCKET.itemsize*count)
+			if not first:
+				return
+			for j, d in enumerate (blob.view (F.ALIGNED_BUCKET, first, count)):
+				b = first + F.ALIGNED_BUCKET.itemsize*j
+				vsize = (F.LEVEL_QVERTEX if self.quantized else F.LEVEL_VERTEX).itemsize
+				field (b, '{0} {1} name'.format (what, j), 1, False)
+				field (b + 8, '{0} {1} vertices'.format (what, j), vsize*int (d['nverts']))
+				field (b + 16, '{0} {1} indices'.format (what, j), int (d['isize'])*int (d['nindices']))
+
+		#A bad pointer can leave the rest unreadable, report what was found
+		try:
+			field (16, 'meshes', F.ALIGNED_MESH.itemsize*self.nmeshes)
+			field (32, 'world', F.WORLD_NODE.itemsize*len (self.world))
+			field (48, 'entities', self.entities_size)
+			field (64, 'strings', 1, False)
+			field (96, 'navmesh', self.navmesh_size)
+			for i, d in enumerate (self.descriptors):
+				m = self.sections['meshes'] + F.ALIGNED_MESH.itemsize*i
+				what = 'mesh {0}'.format (i)
+				buckets (m + 32, int (d['nbuckets']), what + ' bucket')
+				if field (m + 40, what + ' collision', F.ALIGNED_COLLISION.itemsize):
+					c = int (d['collision'])
+					cd = blob.view (F.ALIGNED_COLLISION, c, 1)[0]
+					field (c + 16, what + ' collision vertices', 12*int (cd['nverts']))
+					field (c + 24, what + ' collision indices', 2*int (cd['nindices']))
+					field (c + 32, what + ' collision faces', 4*int (cd['npolys']))
+				if field (m + 48, what + ' lods', F.ALIGNED_LOD.itemsize*int (d['nlods'])):
+					for j in range (int (d['nlods'])):
+						l = int (d['lods']) + F.ALIGNED_LOD.itemsize*j
+						buckets (l + 16, int (blob.unpack ('<I', l + 12)[0]), '{0} lod {1} bucket'.format (what, j))
+				if field (m + 64, what + ' hulls', F.ALIGNED_HULL.itemsize*int (d['nhulls'])):
+					for j, hd in enumerate (blob.view (F.ALIGNED_HULL, int (d['hulls']), int (d['nhulls']))):
+						h = int (d['hulls']) + F.ALIGNED_HULL.itemsize*j
+						field (h + 8, '{0} hull {1} vertices'.format (what, j), 12*int (hd['nverts']))
+						field (h + 16, '{0} hull {1} planes'.format (what, j), F.HULL_PLANE.itemsize*int (hd['nplanes']))
+		except RuntimeError as e:
+			problems.append (str (e))
+
+		for ofs, (what, target, size, align) in sorted (pointers.items ()):
+			if target + size > blob.size:
+				problems.append ('{0} at {1} runs past the end'.format (what, target))
+			elif align and target%a:
+				problems.append ('{0} at {1} is {2} bytes off the alignment'.format (what, target, target%a))
+
+		relocations = set (self.relocations.tolist ())
+		for ofs in sorted (relocations):
+			if ofs%8:
+				problems.append ('relocation {0} is not 8 byte aligned'.format (ofs))
+		for ofs in sorted (set (pointers) - relocations):
+			problems.append ('{0} at {1} is not relocated'.format (pointers[ofs][0], ofs))
+		for ofs in sorted (relocations - set (pointers)):
+			problems.append ('relocation {0} is not a pointer'.format (ofs))
+		if blob.size%8:
+			problems.append ('size {0} is not a multiple of 8'.format (blob.size))
+		return problems
+
+#What the engine does with an in-place level: a single read, then the
+#address it landed at added to every pointer. Returns the relocated file
+#and how many pointers were fixed up
+def load_in_place (path, base):
+	with open (path, 'rb') as f:
+		data = bytearray (f.read ())
+	head = unpack_from (F.ALIGNED_HEADER, data)
+	if F.LEVEL_MAGICK != head[0] or not head[2] & F.LEVEL_ALIGNED:
+		raise RuntimeError ('{0} is not an in-place level'.format (path))
+	ofs, count = head[12:14]
+	relocations = np.frombuffer (data, dtype='<u8', count=count, offset=ofs)//8
+	words = np.frombuffer (data, dtype='<u8')
+	words[relocations] += np.uint64 (base)
+	return data, count
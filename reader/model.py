@@ -0,0 +1,243 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+from .container import open_blob
+from . import formats as F
+from .skeleton import Skeleton
+
+#Reads a run of strips followed by islands, returning them and the offset
+#just past them
+def read_indices (blob, ofs, nstrips, nislands):
+	strips = []
+	for i in range (nstrips):
+		n = blob.u32 (ofs)
+		strips.append (blob.view ('<u2', ofs + 4, n))
+		ofs += 4 + 2*n
+	islands = blob.view ('<u2', ofs, nislands)
+	return strips, islands, ofs + 2*nislands
+
+#Point and vertex layouts of a model
+def pool_dtypes (model):
+	pdtype = F.MODEL_QPOINT if model.quantized else F.MODEL_POINT
+	if model.quantized:
+		return pdtype, F.model_qvertex (16 if model.flags & F.MODEL_OCT16 else 8, model.nweights)
+	return pdtype, F.model_vertex (model.nweights)
+
+class Mesh:
+	def __init__ (self, model, ofs):
+		blob = model.blob
+		self.material, npoints, nverts, nstrips, nislands = blob.unpack ('<5I', ofs)
+		ofs += 20
+
+		#Bone indices are local to the palette when there is one
+		self.palette = None
+		if model.flags & F.MODEL_PALETTES:
+			n = blob.u32 (ofs)
+			self.palette = blob.view ('<u2', ofs + 4, n)
+			ofs += 4 + 2*(n + n%2)
+
+		pdtype, vdtype = pool_dtypes (model)
+		self.points = blob.view (pdtype, ofs, npoints)
+		ofs += pdtype.itemsize*npoints
+
+		self.uv_offset = self.uv_scale = None
+		if model.quantized:
+			q = blob.unpack ('<4f', ofs)
+			self.uv_offset, self.uv_scale = q[0:2], q[2:4]
+			ofs += 16
+		self.verts = blob.view (vdtype, ofs, nverts)
+		ofs += vdtype.itemsize*nverts
+
+		self.strips, self.islands, self.end = read_indices (blob, ofs, nstrips, nislands)
+
+	def triangles (self):
+		return sum (len (s) - 2 for s in self.strips) + len (self.islands)//3
+
+	#Bone indices of every vertex into the skeleton
+	def global_bones (self):
+		if self.palette is None:
+			return self.verts['bones']
+		return self.palette[self.verts['bones']]
+
+#A mesh of the shared layout. Its arrays are views into the model's pools,
+#the record says where they start so the pools can be drawn from directly
+class SharedMesh (Mesh):
+	def __init__ (self, record, points, verts, indices, lengths, palette, uv):
+		r = record
+		self.record = r
+		self.material = int (r['material'])
+		self.points = points[r['first_point']:r['first_point'] + r['npoints']]
+		self.verts = verts[r['base_vertex']:r['base_vertex'] + r['nverts']]
+		self.uv_offset, self.uv_scale = uv
+		self.palette = None
+		if palette is not None:
+			self.palette = palette[r['first_palette']:r['first_palette'] + r['npalette']]
+
+		#Strips come first in the mesh's index range, then its islands
+		ndx = indices[r['first_index']:r['first_index'] + r['nindices']]
+		ends = np.cumsum (lengths[r['first_strip']:r['first_strip'] + r['nstrips']])
+		self.strips = np.split (ndx[:ends[-1] if len (ends) else 0], ends[:-1])
+		self.islands = ndx[len (ndx) - r['nislands']:]
+
+class Lod:
+	def __init__ (self, ratio, error, screen, strips, islands):
+		self.ratio = ratio
+		self.error = error
+		self.screen = screen
+		self.strips = strips
+		self.islands = islands
+
+class Model:
+	def __init__ (self, path):
+		self.blob = blob = open_blob (path)
+		if blob.bytes (0, 4) != F.MODEL_MAGICK:
+			raise RuntimeError ('{0} is not a model'.format (path))
+
+		self.version = blob.u32 (4)
+		ofs = 8
+		self.flags = 0
+		if F.VERSION_FLAGS == self.version:
+			self.flags = blob.u32 (8)
+			ofs += 4
+		elif F.MODEL_VERSION != self.version:
+			raise RuntimeError ('{0} has unknown version {1:#x}'.format (path, self.version))
+		self.quantized = bool (self.flags & F.MODEL_QUANTIZED)
+		self.nweights = 4 if self.flags & F.MODEL_SKIN4 else 2
+
+		self.animset, self.nbones, self.distal, nmaterials, self.nmeshes = blob.unpack ('<2If2I', ofs)
+		ofs += 20
+		if self.flags & F.MODEL_SKELETON:
+			ofs = self.read_skeleton (ofs)
+		else:
+			self.bones = blob.view (F.BONE, ofs, self.nbones)
+			ofs += F.BONE.itemsize*self.nbones
+			self.skeleton = Skeleton (self.bones['pos'], self.bones['parent'])
+
+		self.materials = []
+		for i in range (nmaterials):
+			name, ofs = blob.string (ofs)
+			self.materials.append (name)
+		self.ofs_meshes = ofs
+		self._meshes = None
+		self._lods = None
+
+	#Breadth first skeleton arrays, see skeleton.py in the add-on. Bones
+	#are also gathered into the interleaved layout so either reads the same
+	def read_skeleton (self, ofs):
+		blob = self.blob
+		n = self.nbones
+		stride, nlevels = blob.unpack ('<2I', ofs)
+		levels = blob.view ('<u4', ofs + 8, nlevels)
+		ofs += 8 + 4*nlevels + -(8 + 4*nlevels)%16
+		positions = blob.view ('<f4', ofs, 3*stride).reshape (3, stride)[:, 0:n].T
+		rotations = blob.view ('<f4', ofs + 12*stride, 4*stride).reshape (4, stride)[:, 0:n].T
+		parents = blob.view ('<u4', ofs + 28*stride, n)
+		self.bones = np.empty (n, dtype=F.BONE)
+		self.bones['pos'] = positions
+		self.bones['parent'] = parents
+		self.skeleton = Skeleton (positions, parents, rotations, levels)
+		return ofs + 32*stride
+
+	def close (self):
+		self.bones = None
+		self.skeleton = None
+		self._meshes = None
+		self._lods = None
+		self.blob.close ()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close ()
+
+	def __len__ (self):
+		return self.nmeshes
+
+	#Meshes are not size prefixed, so walk them once to find where each
+	#begins. After that any mesh can be reached directly
+	def index (self):
+		if self._meshes is None and self.flags & F.MODEL_SHARED:
+			self._meshes, self.ofs_lods = self.read_shared ()
+		elif self._meshes is None:
+			meshes = []
+			ofs = self.ofs_meshes
+			for i in range (self.nmeshes):
+				m = Mesh (self, ofs)
+				meshes.append (m)
+				ofs = m.end
+			self._meshes = meshes
+			self.ofs_lods = ofs
+		return self._meshes
+
+	#The shared layout: totals, a record per mesh and then the pools
+	def read_shared (self):
+		blob = self.blob
+		ofs = self.ofs_meshes
+		npoints, nverts, nindices, nstrips, npalette = blob.unpack ('<5I', ofs)
+		records = blob.view (F.MODEL_SUBMESH, ofs + 20, self.nmeshes)
+		ofs += 20 + F.MODEL_SUBMESH.itemsize*self.nmeshes
+
+		pdtype, vdtype = pool_dtypes (self)
+		points = blob.view (pdtype, ofs, npoints)
+		ofs += pdtype.itemsize*npoints
+		uv = (None, None)
+		if self.quantized:
+			q = blob.unpack ('<4f', ofs)
+			uv = (q[0:2], q[2:4])
+			ofs += 16
+		verts = blob.view (vdtype, ofs, nverts)
+		ofs += vdtype.itemsize*nverts
+		indices = blob.view ('<u2', ofs, nindices)
+		ofs += 2*(nindices + nindices%2)
+		lengths = blob.view ('<u4', ofs, nstrips)
+		ofs += 4*nstrips
+		palette = None
+		if self.flags & F.MODEL_PALETTES:
+			palette = blob.view ('<u2', ofs, npalette)
+		ofs += 2*(npalette + npalette%2)
+
+		meshes = [SharedMesh (r, points, verts, indices, lengths, palette, uv) for r in records]
+		return meshes, ofs
+
+	def mesh (self, n):
+		return self.index ()[n]
+
+	def meshes (self):
+		return iter (self.index ())
+
+	def lods (self, n):
+		if not self.flags & F.MODEL_LODS:
+			return []
+		if self._lods is None:
+			self.index ()
+			blob = self.blob
+			version, nmeshes = blob.unpack ('<2I', self.ofs_lods)
+			ofs = self.ofs_lods + 8
+			self._lods = []
+			for i in range (nmeshes):
+				nlods = blob.u32 (ofs)
+				ofs += 4
+				chain = []
+				for j in range (nlods):
+					ratio, error, screen, nstrips, nislands = blob.unpack ('<3f2I', ofs)
+					strips, islands, ofs = read_indices (blob, ofs + 20, nstrips, nislands)
+					chain.append (Lod (ratio, error, screen, strips, islands))
+				self._lods.append (chain)
+		return self._lods[n]
@@ -0,0 +1,99 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Navigation meshes, see navmesh.py for the layout. Paths are searched
+#region by region with A*, stepping between region centres
+import heapq
+import math
+import numpy as np
+from . import formats as F
+
+class NavMesh:
+	def __init__ (self, blob, ofs):
+		self.version, n = blob.unpack ('<2I', ofs)
+		ofs += 8
+		self.verts = blob.view (('<f4', 3), ofs, n)
+		ofs += 12*n
+		n = blob.u32 (ofs)
+		self.regions = blob.view (F.NAV_REGION, ofs + 4, n)
+		ofs += 4 + F.NAV_REGION.itemsize*n
+		n = blob.u32 (ofs)
+		self.corners = blob.view ('<u4', ofs + 4, n)
+		self.neighbours = blob.view ('<i4', ofs + 4 + 4*n, n)
+		self._graph = None
+
+	def __len__ (self):
+		return len (self.regions)
+
+	#Every region's neighbours with the cost of stepping over, as plain
+	#lists so the search does not go through NumPy at every step
+	def graph (self):
+		if self._graph is None:
+			centres = self.regions['centre'].astype (np.float64)
+			src = np.repeat (np.arange (len (self.regions)), self.regions['count'].astype (np.int64))
+			dst = self.neighbours.astype (np.int64)
+			linked = dst >= 0
+			cost = np.linalg.norm (centres[src[linked]] - centres[dst[linked]], axis=1)
+			self._graph = [[] for r in range (len (self.regions))]
+			for r, n, c in zip (src[linked].tolist (), dst[linked].tolist (), cost.tolist ()):
+				self._graph[r].append ((n, c))
+			self._centres = centres.tolist ()
+		return self._graph
+
+	#Regions from start to goal, both included, or None if there is no way
+	def find (self, start, goal):
+		graph = self.graph ()
+		centres = self._centres
+		gx, gy, gz = centres[goal]
+		def estimate (r):
+			x, y, z = centres[r]
+			return math.sqrt ((x - gx)**2 + (y - gy)**2 + (z - gz)**2)
+
+		came = {start: None}
+		cost = {start: 0.0}
+		queue = [(estimate (start), 0.0, start)]
+		done = set ()
+		while queue:
+			f, g, r = heapq.heappop (queue)
+			if r == goal:
+				path = []
+				while r is not None:
+					path.append (r)
+					r = came[r]
+				return path[::-1]
+			if r in done:
+				continue
+			done.add (r)
+			for n, c in graph[r]:
+				if g + c < cost.get (n, math.inf):
+					cost[n] = g + c
+					came[n] = r
+					heapq.heappush (queue, (g + c + estimate (n), g + c, n))
+		return None
+
+	#End points of the edges a path crosses, for string pulling
+	def portals (self, path):
+		out = []
+		for r, n in zip (path, path[1:]):
+			first, count = int (self.regions[r]['first']), int (self.regions[r]['count'])
+			k = int (np.nonzero (self.neighbours[first:first + count] == n)[0][0])
+			a = self.corners[first + k]
+			b = self.corners[first + (k + 1)%count]
+			out.append ((self.verts[a], self.verts[b]))
+		return out
@@ -0,0 +1,91 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+import numpy as np
+
+#Euler angles to rotation matrices, composed as Blender does for XYZ
+def euler_matrices (angles):
+	a = np.asarray (angles, dtype=np.float64).reshape (-1, 3)
+	cx, cy, cz = np.cos (a).T
+	sx, sy, sz = np.sin (a).T
+	m = np.empty ((len (a), 3, 3))
+	m[:, 0, 0] = cy*cz
+	m[:, 0, 1] = sx*sy*cz - cx*sz
+	m[:, 0, 2] = cx*sy*cz + sx*sz
+	m[:, 1, 0] = cy*sz
+	m[:, 1, 1] = sx*sy*sz + cx*cz
+	m[:, 1, 2] = cx*sy*sz - sx*cz
+	m[:, 2, 0] = -sy
+	m[:, 2, 1] = sx*cy
+	m[:, 2, 2] = cx*cy
+	return m
+
+#x, y, z, w quaternions to rotation matrices
+def quaternion_matrices (q):
+	x, y, z, w = np.asarray (q, dtype=np.float64).reshape (-1, 4).T
+	m = np.empty ((len (x), 3, 3))
+	m[:, 0, 0] = 1 - 2*(y*y + z*z)
+	m[:, 0, 1] = 2*(x*y - z*w)
+	m[:, 0, 2] = 2*(x*z + y*w)
+	m[:, 1, 0] = 2*(x*y + z*w)
+	m[:, 1, 1] = 1 - 2*(x*x + z*z)
+	m[:, 1, 2] = 2*(y*z - x*w)
+	m[:, 2, 0] = 2*(x*z - y*w)
+	m[:, 2, 1] = 2*(y*z + x*w)
+	m[:, 2, 2] = 1 - 2*(x*x + y*y)
+	return m
+
+#A model's bones, posed the way an engine would. Without levels the bones
+#can only be walked one at a time, parents first; with them every bone of
+#a level is posed at once from the level above
+class Skeleton:
+	def __init__ (self, positions, parents, rotations = None, levels = None):
+		self.positions = np.asarray (positions, dtype=np.float64)
+		self.parents = np.asarray (parents, dtype=np.intp)
+		self.rest = None if rotations is None else quaternion_matrices (rotations)
+		self.levels = None if levels is None else list (levels) + [len (self.parents)]
+		self.offsets = self.positions - self.positions[self.parents]
+		if len (self.offsets):
+			self.offsets[0] = self.positions[0]
+
+	def __len__ (self):
+		return len (self.parents)
+
+	#Returns every bone's rotation and position in model space for a pose
+	#of euler angles, one row per bone
+	def evaluate (self, angles):
+		local = euler_matrices (angles)
+		if self.rest is not None:
+			local = self.rest @ local
+		rot = np.empty_like (local)
+		pos = np.empty_like (self.offsets)
+		rot[0] = local[0]
+		pos[0] = self.offsets[0]
+		parents = self.parents
+		if self.levels is None:
+			for i in range (1, len (parents)):
+				p = parents[i]
+				rot[i] = rot[p] @ local[i]
+				pos[i] = pos[p] + rot[p] @ self.offsets[i]
+			return rot, pos
+		for a, b in zip (self.levels[1:], self.levels[2:]):
+			p = parents[a:b]
+			rot[a:b] = rot[p] @ local[a:b]
+			pos[a:b] = pos[p] + (rot[p] @ self.offsets[a:b, :, None])[:, :, 0]
+		return rot, pos
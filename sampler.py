@@ -0,0 +1,157 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Samples an armature's action straight from its F-curves. Stepping the
+#scene with frame_set re-evaluates the whole depsgraph for every sample,
+#when all the exporter wants is each bone's local transform. Without
+#constraints, drivers or NLA strips in the way that transform only depends
+#on the action, so the curves are evaluated on their own and the rotations
+#built up as arrays
+import numpy as np
+
+PREFIX = 'pose.bones["'
+
+#Returns why the action alone does not decide the pose, or None if it does
+def blocker (armature):
+	ad = getattr (armature, 'animation_data', None)
+	if ad is None or ad.action is None:
+		return 'no action'
+	if len (ad.drivers):
+		return 'drivers'
+	if any (not t.mute for t in ad.nla_tracks):
+		return 'NLA tracks'
+	for pb in armature.pose.bones:
+		if len (pb.constraints):
+			return 'constraints on {0}'.format (pb.name)
+	return None
+
+#Splits 'pose.bones["name"].prop' into the bone name and property
+def parse_path (path):
+	if not path.startswith (PREFIX):
+		return None, None
+	head, dot, prop = path.rpartition ('.')
+	if not head.endswith ('"]'):
+		return None, None
+	name = head[len (PREFIX):-2].replace ('\\"', '"').replace ('\\\\', '\\')
+	return name, prop
+
+#Each axis rotation as (n, 3, 3) arrays
+def axis_rotation (axis, angles):
+	c = np.cos (angles)
+	s = np.sin (angles)
+	m = np.zeros ((len (angles), 3, 3))
+	a, b = {'X': (1, 2), 'Y': (2, 0), 'Z': (0, 1)}[axis]
+	k = 'XYZ'.index (axis)
+	m[:, k, k] = 1.0
+	m[:, a, a] = c
+	m[:, a, b] = -s
+	m[:, b, a] = s
+	m[:, b, b] = c
+	return m
+
+def euler_matrix (euler, order):
+	#Rotations apply in the order given, so the first is rightmost
+	m = axis_rotation (order[0], euler[:, 'XYZ'.index (order[0])])
+	for axis in order[1:]:
+		m = axis_rotation (axis, euler[:, 'XYZ'.index (axis)]) @ m
+	return m
+
+def quaternion_matrix (q):
+	q = q/np.linalg.norm (q, axis=1, keepdims=True)
+	w, x, y, z = q.T
+	m = np.empty ((len (q), 3, 3))
+	m[:, 0, 0] = 1 - 2*(y*y + z*z)
+	m[:, 0, 1] = 2*(x*y - w*z)
+	m[:, 0, 2] = 2*(x*z + w*y)
+	m[:, 1, 0] = 2*(x*y + w*z)
+	m[:, 1, 1] = 1 - 2*(x*x + z*z)
+	m[:, 1, 2] = 2*(y*z - w*x)
+	m[:, 2, 0] = 2*(x*z - w*y)
+	m[:, 2, 1] = 2*(y*z + w*x)
+	m[:, 2, 2] = 1 - 2*(x*x + y*y)
+	return m
+
+def axis_angle_matrix (aa):
+	angle = aa[:, 0]
+	axis = aa[:, 1:4]
+	axis = axis/np.maximum (np.linalg.norm (axis, axis=1, keepdims=True), 1e-12)
+	half = 0.5*angle
+	q = np.concatenate ((np.cos (half)[:, None], axis*np.sin (half)[:, None]), axis=1)
+	return quaternion_matrix (q)
+
+#XYZ Euler angles of rotation matrices, picking between the two solutions
+#the same way Matrix.to_euler does
+def matrix_euler (m):
+	cy = np.hypot (m[:, 0, 0], m[:, 1, 0])
+	e1 = np.stack ((
+		np.arctan2 (m[:, 2, 1], m[:, 2, 2]),
+		np.arctan2 (-m[:, 2, 0], cy),
+		np.arctan2 (m[:, 1, 0], m[:, 0, 0])), axis=1)
+	e2 = np.stack ((
+		np.arctan2 (-m[:, 2, 1], -m[:, 2, 2]),
+		np.arctan2 (-m[:, 2, 0], -cy),
+		np.arctan2 (-m[:, 1, 0], -m[:, 0, 0])), axis=1)
+	#Gimbal lock, Z is folded into X
+	flat = cy <= 16*np.finfo (np.float32).eps
+	e1[flat, 0] = np.arctan2 (-m[flat, 1, 2], m[flat, 1, 1])
+	e1[flat, 2] = 0.0
+	e2[flat] = e1[flat]
+	better = np.abs (e2).sum (axis=1) < np.abs (e1).sum (axis=1)
+	return np.where (better[:, None], e2, e1)
+
+#Returns the XYZ Euler angles of every bone as an (ntimes, nbones, 3) array
+#and the location of every bone as another, matching what matrix_basis
+#would hold after stepping the scene to each time. Bones come in the order
+#given, or the armature's own
+def sample (armature, times, bones = None):
+	times = np.asarray (times, dtype=np.float64)
+	curves = {}
+	for fc in armature.animation_data.action.fcurves:
+		if fc.mute:
+			continue
+		name, prop = parse_path (fc.data_path)
+		if name is not None:
+			curves[(name, prop, fc.array_index)] = fc
+
+	#Channels without a curve keep whatever the bone holds now
+	def channel (pb, prop, width):
+		out = np.empty ((len (times), width))
+		static = getattr (pb, prop)
+		for k in range (width):
+			fc = curves.get ((pb.name, prop, k))
+			if fc is None:
+				out[:, k] = static[k]
+			else:
+				out[:, k] = [fc.evaluate (t) for t in times]
+		return out
+
+	if bones is None:
+		bones = armature.pose.bones
+	angles = np.empty ((len (times), len (bones), 3))
+	locations = np.empty ((len (times), len (bones), 3))
+	for j, pb in enumerate (bones):
+		mode = pb.rotation_mode
+		if 'QUATERNION' == mode:
+			m = quaternion_matrix (channel (pb, 'rotation_quaternion', 4))
+		elif 'AXIS_ANGLE' == mode:
+			m = axis_angle_matrix (channel (pb, 'rotation_axis_angle', 4))
+		else:
+			m = euler_matrix (channel (pb, 'rotation_euler', 3), mode)
+		angles[:, j] = matrix_euler (m)
+		locations[:, j] = channel (pb, 'location', 3)
+	return angles, locations
@@ -0,0 +1,91 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Bone ordering and the skeleton sections of a model. Bones are ordered
+#without recursing, so skeleton depth is not bounded by the interpreter,
+#and either way every parent comes before its children. Breadth first
+#also groups the bones by depth, so the engine can pose a whole level at
+#once. The interleaved section is <3fI> position and parent per bone, the
+#arrays section is:
+#
+#	<2I      stride, nlevels
+#	<I       first bone of every level, padded to 16 bytes
+#	<f>      x, y, z of every bone's position, one array each
+#	<f>      x, y, z, w of every bone's rest rotation, one array each
+#	<I>      parent of every bone
+#
+#Every array is stride long, the bone count rounded up to 4, so the
+#engine can run through them four at a time without a tail
+from collections import deque
+from struct import pack
+import numpy as np
+
+#Arrays are padded to a whole number of this many bones
+LANES = 4
+
+#Returns (bone, parent, depth) for the bones below root, breadth first or
+#in the depth first order the exporter always used. The root is its own
+#parent
+def order (root, breadth = False):
+	out = []
+	pending = deque ([(root, 0, 0)])
+	while pending:
+		head, parent, depth = pending.popleft () if breadth else pending.pop ()
+		id = len (out)
+		out.append ((head, parent, depth))
+		children = [(ch, id, depth + 1) for ch in head.children]
+		pending.extend (children if breadth else reversed (children))
+	return out
+
+#Rotation matrix rows to an x, y, z, w quaternion
+def quaternion (m):
+	m = np.asarray (m, dtype=np.float64)[0:3, 0:3]
+	t = np.trace (m)
+	if t > 0.0:
+		s = 2.0*np.sqrt (t + 1.0)
+		q = [(m[2, 1] - m[1, 2])/s, (m[0, 2] - m[2, 0])/s, (m[1, 0] - m[0, 1])/s, 0.25*s]
+	else:
+		i = int (np.argmax (np.diag (m)))
+		j, k = (i + 1)%3, (i + 2)%3
+		s = 2.0*np.sqrt (1.0 + m[i, i] - m[j, j] - m[k, k])
+		q = [0.0, 0.0, 0.0, (m[k, j] - m[j, k])/s]
+		q[i] = 0.25*s
+		q[j] = (m[j, i] + m[i, j])/s
+		q[k] = (m[k, i] + m[i, k])/s
+	return q
+
+def pack_interleaved (positions, parents):
+	data = bytes ()
+	for xyz, parent in zip (positions, parents):
+		data += pack ('<3fI', xyz[0], xyz[1], xyz[2], parent)
+	return data
+
+#Depths must not decrease, as they do not when breadth first
+def pack_arrays (positions, rotations, parents, depths):
+	n = len (parents)
+	stride = -(-n//LANES)*LANES
+	levels = [i for i in range (n) if 0 == i or depths[i] != depths[i - 1]]
+	head = pack ('<2I', stride, len (levels)) + np.array (levels, dtype='<u4').tobytes ()
+	head += bytes (-len (head)%16)
+
+	def columns (a, width, dtype):
+		out = np.zeros ((width, stride), dtype=dtype)
+		out[:, 0:n] = np.asarray (a, dtype=dtype).reshape (n, width).T
+		return out.tobytes ()
+	return head + columns (positions, 3, '<f4') + columns (rotations, 4, '<f4') + columns (parents, 1, '<u4')
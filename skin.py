@@ -0,0 +1,83 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Vertex weight clean up and bone palettes for hardware skinning
+import numpy as np
+
+MAX_WEIGHTS = 4
+#Weights below this are noise left over from painting
+MIN_WEIGHT = 1e-4
+
+#Keeps the heaviest n weights of each vertex and renormalises them to sum
+#to one. Takes a list of (bone, weight) lists and returns bones and weights
+#as n column arrays, the count kept per vertex, and how many weights were
+#dropped. Kept weights stay in their painted order, so vertices already in
+#budget come out as they went in. Vertices left without any weight have a
+#count of zero
+def limit (groups, n = MAX_WEIGHTS):
+	nverts = len (groups)
+	width = max ([len (g) for g in groups] + [n])
+	bones = np.zeros ((nverts, width), dtype=np.int64)
+	weights = np.zeros ((nverts, width))
+	for i, g in enumerate (groups):
+		if g:
+			bones[i, 0:len (g)] = [b for b, w in g]
+			weights[i, 0:len (g)] = [w for b, w in g]
+	weights[weights < MIN_WEIGHT] = 0.0
+
+	#Pick the heaviest, ties going to the first painted
+	order = np.argsort (-weights, axis=1, kind='stable')
+	dropped = int (np.count_nonzero (np.take_along_axis (weights, order[:, n:], axis=1)))
+	order = order[:, 0:n]
+
+	#Then put them back in painted order, with empty slots last
+	kept = np.take_along_axis (weights, order, axis=1)
+	order = np.take_along_axis (order, np.argsort (np.where (kept > 0, order, order + width), axis=1), axis=1)
+	bones = np.take_along_axis (bones, order, axis=1)
+	weights = np.take_along_axis (weights, order, axis=1)
+
+	counts = np.count_nonzero (weights, axis=1)
+	total = weights.sum (axis=1, keepdims=True)
+	weights = np.divide (weights, total, out=np.zeros_like (weights), where=total > 0)
+
+	#Unused slots repeat the first bone, as the two weight layout did
+	unused = np.arange (n)[None, :] >= counts[:, None]
+	bones = np.where (unused, bones[:, 0:1], bones)
+	return bones, weights, counts, dropped
+
+#Splits triangles into runs whose vertices use at most size bones between
+#them. tris is a list of vertex triples and bones gives the bones each
+#vertex uses. Returns a list of (palette, triangles), the palette sorted.
+#Triangles go to the first palette they fit, so neighbours tend to stay
+#together when the mesh is in a sensible order
+def split (tris, bones, size):
+	palettes = []
+	for t in tris:
+		need = set ()
+		for v in t:
+			need.update (bones[v])
+		if len (need) > size:
+			raise ValueError ('a triangle uses {0} bones, more than a palette of {1}'.format (len (need), size))
+		for p in palettes:
+			if len (p[0] | need) <= size:
+				p[0].update (need)
+				p[1].append (t)
+				break
+		else:
+			palettes.append ((need, [t]))
+	return [(sorted (p), t) for p, t in palettes]
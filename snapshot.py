@@ -0,0 +1,116 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#Evaluated meshes copied out into plain arrays. Evaluating modifiers is the
+#most expensive thing Blender does for us, so each object is evaluated once
+#per export against a single depsgraph, bulk copied with foreach_get, and
+#the Blender mesh freed again straight away
+import time
+import numpy as np
+
+class Snapshot:
+	def __init__ (self, mesh, groups = False):
+		nverts = len (mesh.vertices)
+		nloops = len (mesh.loops)
+		npolys = len (mesh.polygons)
+
+		self.co = np.empty (3*nverts, dtype=np.float32)
+		mesh.vertices.foreach_get ('co', self.co)
+		self.co.shape = (nverts, 3)
+		self.normals = np.empty (3*nverts, dtype=np.float32)
+		mesh.vertices.foreach_get ('normal', self.normals)
+		self.normals.shape = (nverts, 3)
+
+		self.loops = np.empty (nloops, dtype=np.int32)
+		mesh.loops.foreach_get ('vertex_index', self.loops)
+
+		self.loop_start = np.empty (npolys, dtype=np.int32)
+		mesh.polygons.foreach_get ('loop_start', self.loop_start)
+		self.loop_total = np.empty (npolys, dtype=np.int32)
+		mesh.polygons.foreach_get ('loop_total', self.loop_total)
+		self.material_index = np.empty (npolys, dtype=np.int32)
+		mesh.polygons.foreach_get ('material_index', self.material_index)
+
+		#UVs per loop; meshes without a UV map get zeros
+		self.uvs = np.zeros (2*nloops, dtype=np.float32)
+		if mesh.uv_layers.active is not None:
+			mesh.uv_layers.active.data.foreach_get ('uv', self.uvs)
+		self.uvs.shape = (nloops, 2)
+
+		self.materials = [m.name if m is not None else '' for m in mesh.materials]
+
+		#Vertex groups have no bulk accessor, so they are only copied for
+		#the meshes that need them: (group, weight) lists per vertex
+		self.groups = None
+		if groups:
+			self.groups = [[(g.group, g.weight) for g in v.groups] for v in mesh.vertices]
+
+	def __len__ (self):
+		return len (self.loop_start)
+
+	def nbytes (self):
+		arrays = (self.co, self.normals, self.loops, self.loop_start, self.loop_total,
+			self.material_index, self.uvs)
+		return sum (a.nbytes for a in arrays)
+
+	#Corner indices of every polygon, as a (npolys, 3) array. Only valid
+	#once the mesh is known to be triangulated
+	def triangles (self):
+		return self.loop_start[:, None] + np.arange (3, dtype=np.int32)[None, :]
+
+#Holds the snapshot of every object for the length of an export
+class Cache:
+	def __init__ (self, context):
+		self.depsgraph = context.evaluated_depsgraph_get ()
+		self.meshes = {}
+		self.evaluations = 0
+		self.seconds = 0.0
+		self.bytes = 0
+
+	#Returns the snapshot of an object, or None if it did not produce a mesh.
+	#Skinned meshes ask for the original: the evaluated one has gone through
+	#the Armature modifier, which bakes the current pose into the bind pose
+	def get (self, o, groups = False, original = False):
+		key = (o.name, original)
+		if key in self.meshes:
+			return self.meshes[key]
+
+		start = time.perf_counter ()
+		source = o if original else o.evaluated_get (self.depsgraph)
+		mesh = source.to_mesh ()
+		snap = None
+		if mesh:
+			snap = Snapshot (mesh, groups)
+			self.bytes += snap.nbytes ()
+		source.to_mesh_clear ()
+		self.seconds += time.perf_counter () - start
+		self.evaluations += 1
+
+		self.meshes[key] = snap
+		return snap
+
+	#Lets go of an object's snapshots once nothing more will ask for them
+	def release (self, o):
+		for original in (False, True):
+			snap = self.meshes.pop ((o.name, original), None)
+			if snap is not None:
+				self.bytes -= snap.nbytes ()
+
+	def report (self):
+		return 'Evaluated {0} mesh(es) in {1:.3f}s, {2} KiB kept'.format (
+			self.evaluations, self.seconds, self.bytes//1024)
@@ -0,0 +1,71 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+#Sections that grow with the level, written as they are made. They are
+#kept in memory up to a threshold and then roll over to an anonymous
+#temporary file, so the geometry of a level never has to fit in memory
+#at once and can be copied straight into the output
+import shutil
+import tempfile
+
+#Bytes a section keeps in memory before it goes to disk
+SPILL_BYTES = 16<<20
+#Bytes copied at a time when writing a section out
+COPY_BYTES = 1<<20
+
+class Section:
+	def __init__ (self, threshold = SPILL_BYTES):
+		self.file = tempfile.SpooledTemporaryFile (threshold)
+		#Counts are only known at the end, so they go on in front
+		self.head = bytes ()
+		self.size = 0
+
+	def __len__ (self):
+		return len (self.head) + self.size
+
+	def write (self, data):
+		self.file.write (data)
+		self.size += len (data)
+
+	def prepend (self, data):
+		self.head = data + self.head
+
+	#Copies the section into the file f and lets the spill go
+	def copy (self, f):
+		f.write (self.head)
+		self.file.seek (0)
+		shutil.copyfileobj (self.file, f, COPY_BYTES)
+		self.file.close ()
+
+	#Reads the whole section back and lets the spill go
+	def read (self):
+		self.file.seek (0)
+		data = self.head + self.file.read ()
+		self.file.close ()
+		return data
+
+#Sections are either spilled or plain bytes
+def read (section):
+	return section if isinstance (section, bytes) else section.read ()
+
+def copy (section, f):
+	if isinstance (section, bytes):
+		f.write (section)
+	else:
+		section.copy (f)
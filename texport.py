@@ -21,8 +21,43 @@ import os
 import bpy
 from mathutils import *
 from . import graph
+from . import weld
+from . import quant
+from . import lod
+from . import entity
+from . import instrument
+from . import container
+from . import snapshot
+from . import inplace
+from . import partition
+from . import hull
+from . import navmesh
+from . import spill
 
+import gc
 import math
+import numpy as np
+
+#File versions. The flagged version carries a bitfield after the version
+#describing which optional layouts the file uses
+VERSION = 0x20200526
+VERSION_FLAGS = 0x20261019
+
+#Geometry records hold welded vertex buffers with 16 or 32 bit indices
+LEVEL_WELDED = 1<<0
+#Vertices are quantised to 16 bits relative to the mesh bounds
+LEVEL_QUANTIZED = 1<<1
+#A LOD section follows the entities
+LEVEL_LODS = 1<<2
+#Entities are a binary table whose strings are shared with material names
+LEVEL_BINARY_ENTITIES = 1<<3
+#Laid out for loading in place, see inplace.py
+LEVEL_ALIGNED = 1<<4
+#A section of convex hulls follows, standing in for the collision meshes
+#of the records that have them
+LEVEL_HULLS = 1<<5
+#A navigation mesh section follows, see navmesh.py
+LEVEL_NAVMESH = 1<<6
 
 class Edge:
 	def __init__ (self, vertex):
@@ -71,6 +106,11 @@ class Export:
 	def __init__ (self, config, context):
 		self.cfg = config
 		self.ctx = context
+		self.prof = instrument.Profiler (config.profile)
+		#Everything written, for packing into an archive afterwards
+		self.written = []
+		#Set to a dict to keep the collision graph of every mesh
+		self.graphs = None
 	
 	def feedback (self, message):
 		wm = self.ctx.window_manager
@@ -80,11 +120,393 @@ class Export:
 		
 		wm.popup_menu (draw, title="Traum Tools", icon='INFO')
 	
-	def trace (self, text):
+	def trace (self, text, *args):
+		#Only pay for formatting when someone is listening
 		if self.cfg.verbose is True:
-			print (text)
+			print (text.format (*args) if args else text)
+	
+	def pack_name (self, key):
+		from struct import pack
+		if self.strings is not None:
+			return pack ('<I', self.strings.intern (key))
+		return pack ('<I', len (key)) + key.encode ('utf-8')
+	
+	def encode (self, name, verts, centre, extents):
+		data, perr, uverr = quant.pack_level_verts (verts, centre, extents)
+		self.qreport.add (name, pos = perr, uv = uverr)
+		return data
 
-	def main (self):
+	def write_lods (self, name, buckets, ratios, radius, encode):
+		from struct import pack
+		import bisect
+		
+		#Join the buckets into a single index space. Material borders then
+		#become mesh borders and are preserved just like UV seams
+		pos = []
+		tris = []
+		ranges = []
+		for key, w in buckets:
+			base = len (pos)
+			ranges.append (base)
+			pos += [v[0:3] for v in w.verts]
+			tris += [base + i for i in w.indices]
+		
+		chain = lod.build_chain (pos, tris, ratios, radius = radius)
+		self.trace (lod.report (name, len (tris)//3, chain))
+		
+		data = pack ('<I', len (chain))
+		for l in chain:
+			data += pack ('<3fI', l.ratio, l.error, l.screen, len (buckets))
+			
+			#Hand each triangle back to the bucket it came from
+			subs = [weld.Welder () for b in buckets]
+			for t in l.tris:
+				b = bisect.bisect_right (ranges, t[0]) - 1
+				w = buckets[b][1]
+				for i in t:
+					v = w.verts[i - ranges[b]]
+					subs[b].add (v[0:3], v[3:5])
+			
+			for (key, w), sub in zip (buckets, subs):
+				data += self.pack_name (key)
+				data += sub.pack (encode)
+		return data
+
+	#Entity dictionary of an object, or None if it has no properties
+	def properties (self, o, id):
+		if not o.get ('_RNA_UI'):
+			return None
+		self.trace ("Properties:")
+		keys = o.keys ()
+		
+		#Copy all the keys into the entity dictionary
+		edict = {}
+		for k in keys:
+			if '_RNA_UI' == k:
+				continue
+			if 'nowrite' == k:
+				continue
+			#Only consumed when hulls are written, otherwise it is the
+			#entity's own
+			if 'collision' == k and self.cfg.hulls:
+				continue
+			edict[k] = o[k]
+			
+		#Add some special keys as well
+		edict['name'] = o.name
+		edict['origin'] = '{0} {1} {2}'.format (o.location[0], o.location[1], o.location[2])
+		#Only used for entities with geometry
+		if not 'nowrite' in keys:
+			edict['mesh'] = id
+		for k, v in edict.items ():
+			self.trace ("\t{0}: {1}", k, v)
+		return edict
+	
+	def entity_text (self, edict):
+		ents = bytes ('entity {0}\n'.format (edict['type']).encode ('utf-8'))
+		for k, v in edict.items ():
+			if 'type' == k:
+				continue
+			ents += bytes ('{0}: {1}\n'.format (k, v).encode ('utf-8'))
+		return ents
+	
+	#World graph record placing mesh id where the object is
+	def world_record (self, o, id):
+		from struct import pack
+		
+		#Blender lets users specify different orders of euler angles. 
+		#To make this sane, just convert the world matrix of the object 
+		#into our own order and convert them into degrees and write
+		#them in yaw-pitch-roll format. NB: Traum is X forward, Z up.
+		def rad2deg (x):
+			import math
+			return -180.0*x/math.pi
+			
+		angles = o.matrix_world.to_euler ('ZYX')
+		yaw = rad2deg (angles[2])
+		pitch = rad2deg (angles[1])
+		roll = rad2deg (angles[0])
+		wg = pack ('<I', id)
+		wg += pack ('<3f', o.location[0], o.location[1], o.location[2])
+		wg += pack ('<3f', yaw, pitch, roll)
+		wg += pack ('<3f', o.scale[0], o.scale[1], o.scale[2]);
+		return wg
+	
+	def check_triangles (self, o, mesh):
+		bad = np.nonzero (mesh.loop_total != 3)[0]
+		if len (bad):
+			#Degenerate
+			if mesh.loop_total[bad[0]] < 3:
+				raise RuntimeError ('{0} has degenerate face!'.format (o.name))
+			#More than 3
+			raise RuntimeError ('{0} must have 3 vertices!'.format (o.name))
+	
+	#Polygons of each part a mesh is written in, or [None] for the whole
+	#mesh. Only meshes too big for 16 bit collision indices are cut up
+	def parts (self, o, mesh):
+		if not partition.oversized (len (mesh.co), 3*len (mesh)):
+			return [None]
+		parts = partition.clusters (mesh.co, mesh.loops[mesh.triangles ()],
+			self.cfg.vertex_budget, partition.TRIANGLE_LIMIT)
+		self.trace ('{0}: {1} vertices, split into {2} parts of up to {3}', o.name,
+			len (mesh.co), len (parts), self.cfg.vertex_budget)
+		return parts
+	
+	#Render part of a geometry record: every material bucket of an
+	#evaluated mesh, or of some of its polygons. Returns it, the LOD chunk
+	#and the triangles
+	def render_record (self, o, mesh, polygons = None):
+		from struct import pack
+		
+		#Ensure the geometry has been triangulated
+		self.check_triangles (o, mesh)
+		if polygons is None:
+			polygons = range (len (mesh))
+		else:
+			polygons = polygons.tolist ()
+		
+		#Ensure mesh has at least one material
+		mat2poly = {}
+		if len (mesh.materials) < 1:
+			self.trace ('{0} has no materials! (using default)', o.name)
+			mat2poly["default"] = list (polygons)
+		else:
+			#Sort polygons by material to minimise state changes
+			#Blender appends the id of each user of a unique material to
+			#its name. This is the only way I know how to get rid around it
+			self.prof.begin ('sort')
+			keys = [m.split ('.')[0] for m in mesh.materials]
+			indices = mesh.material_index.tolist ()
+			for p in polygons:
+				key = keys[indices[p]]
+				if key not in mat2poly:
+					mat2poly[key] = []
+				mat2poly[key].append (p)
+			self.prof.end ()
+
+		#Calculate bounding volume, of the part if this is one
+		if isinstance (polygons, range):
+			box = o.bound_box
+		else:
+			co = mesh.co[mesh.loops[mesh.triangles ()[polygons]]].reshape (-1, 3)
+			box = [co.min (axis=0).tolist (), co.max (axis=0).tolist ()]
+		mins = [ math.inf, math.inf, math.inf]
+		maxs = [-math.inf,-math.inf,-math.inf]
+		for i in range (len (box)):
+			v = [box[i][0], box[i][1], box[i][2]]
+			for j in range (3):
+				if v[j] < mins[j]: mins[j] = v[j];
+				if v[j] > maxs[j]: maxs[j] = v[j];
+		
+		#Compute extents of AABB
+		extents = [0, 0, 0]
+		for i in range (3):
+			extents[i] = (maxs[i] - mins[i])/2.0
+		
+		#Compute sphere
+		centre = [0, 0, 0]
+		d = [0, 0, 0]
+		for i in range (3):
+			centre[i] = extents[i] + mins[i]
+			d[i] = maxs[i] - centre[i]
+		radius = math.sqrt (d[0]*d[0] + d[1]*d[1] + d[2]*d[2])
+
+
+		#Digest the polygons
+		verts = pack ('<I3f3f1f',\
+			len (mat2poly.items ()),\
+			extents[0], extents[1], extents[2],\
+			centre[0], centre[1], centre[2],\
+			radius)
+
+		#Triangles in bucket order, for the collision mesh
+		tris = []
+		
+		#Welded buckets are kept around to simplify into LODs
+		buckets = []
+		
+		#Quantised vertices are encoded in one batch
+		encode = None
+		if self.cfg.quantize:
+			encode = lambda vs: self.encode (o.name, vs, centre, extents)
+		
+		#Process the polygons
+		self.prof.begin ('buckets', polygons = len (mesh))
+		for key, polygons in mat2poly.items ():
+			verts += self.pack_name (key)
+			
+			#Welded buckets write their counts after the fact
+			welder = None
+			if self.cfg.weld or self.cfg.lods:
+				welder = weld.Welder ()
+				buckets.append ((key, welder))
+			if not self.cfg.weld:
+				verts += pack ('<I', 3*len (polygons))
+		
+			#Gather the corners of every triangle in one go
+			loops = mesh.triangles ()[polygons].ravel ()
+			ndx = mesh.loops[loops]
+			data = np.empty ((len (loops), 5), dtype=np.float32)
+			data[:, 0:3] = mesh.co[ndx]
+			data[:, 3] = mesh.uvs[loops, 0]
+			data[:, 4] = 1.0 - mesh.uvs[loops, 1]
+			
+			if welder is not None:
+				for c in data.tolist ():
+					welder.add (c[0:3], c[3:5])
+			
+			tris += ndx.reshape (-1, 3).tolist ()
+			
+			#Emit the vertex and index buffers for this bucket
+			if self.cfg.weld:
+				verts += welder.pack (encode)
+				self.welded.add (welder)
+			elif encode is not None:
+				verts += encode (data)
+			else:
+				verts += data.astype ('<f4').tobytes ()
+		self.prof.end ()
+		
+		#Simplify the render geometry into a LOD chain
+		lods = bytes ()
+		if self.cfg.lods:
+			self.prof.begin ('lods')
+			lods = self.write_lods (o.name, buckets, self.ratios, radius, encode)
+			self.prof.end ()
+		return verts, lods, tris
+	
+	#Collision record of the vertices co whose triangles are in the given
+	#graph
+	def collision_record (self, co, cmesh):
+		from struct import pack
+		
+		#Indices and face starts are 16 bits
+		if partition.oversized (len (co), 3*len (cmesh.faces)):
+			raise RuntimeError ('{0} vertices and {1} triangles do not fit 16 bit collision indices'.format (
+				len (co), len (cmesh.faces)))
+		
+		#Process the collision mesh
+		self.prof.begin ('cmesh')
+		cpolys = cmesh.build ()
+		self.prof.end ()
+		
+		#Pack up vertices
+		self.prof.begin ('collision')
+		cgv = co.astype ('<f4').tobytes ()
+		nverts = len (co)
+		
+		#Gather indices into a single list and pack up the faces as
+		#<2H start, count>
+		indices = [i for p in cpolys for i in p.loop]
+		faces = np.zeros ((len (cpolys), 2), dtype='<u2')
+		faces[:, 1] = [len (p.loop) for p in cpolys]
+		faces[1:, 0] = np.cumsum (faces[:-1, 1])
+		cgf = faces.tobytes ()
+		ncpolys = len (cpolys);
+		
+		#Pack up the indices
+		cgi = np.array (indices, dtype='<u2').tobytes ()
+		nindices = len (indices)
+		
+		#Put the data all together
+		cg = pack ('<3I', nverts, nindices, ncpolys)
+		cg += cgv + cgi + cgf
+		self.prof.end ()
+		return cg
+	
+	#Convex hulls an object collides as, going by its 'collision'
+	#property, or None to collide with its triangles
+	def convex (self, o, co, tris):
+		mode = o.get ('collision', 'mesh') if self.cfg.hulls else 'mesh'
+		if mode not in ('hull', 'decompose'):
+			if 'mesh' != mode:
+				self.trace ('{0}: unknown collision {1}, using the triangles', o.name, mode)
+			return None
+		
+		self.prof.begin ('hulls', object = o.name)
+		try:
+			if 'hull' == mode:
+				hulls = [hull.hull (co, tris)]
+			else:
+				hulls = hull.decompose (co, tris)
+		except ValueError as e:
+			self.trace ('{0}: {1}, using the triangles', o.name, e)
+			hulls = None
+		self.prof.end ()
+		
+		if hulls is not None:
+			self.trace ('{0}: {1} triangles as {2} hull(s), {3} planes, {4:.4f} error', o.name,
+				len (tris), len (hulls), sum (len (h.planes) for h in hulls), max (h.error for h in hulls))
+		return hulls
+	
+	#Hull section entry of a geometry record: <I nhulls>, then per hull
+	#<2I nverts, nplanes>, the vertices and the planes
+	def hull_record (self, hulls):
+		from struct import pack
+		data = pack ('<I', len (hulls))
+		for h in hulls:
+			data += pack ('<2I', len (h.verts), len (h.planes))
+			data += h.verts.astype ('<f4').tobytes () + h.planes.astype ('<f4').tobytes ()
+		return data
+	
+	#Geometry records of an evaluated mesh, made a part at a time so only
+	#one part's buffers and graphs are alive at once. Yields the render
+	#record, LOD chunk and collision record of each, the hulls standing in
+	#for its triangles and the graph the navmesh is built from
+	def geometry (self, o, mesh):
+		from struct import pack
+		self.check_triangles (o, mesh)
+		for part in self.parts (o, mesh):
+			verts, chunk, tris = self.render_record (o, mesh, part)
+			
+			#Parts number their own vertices
+			co = mesh.co
+			if part is not None:
+				used, tris = np.unique (np.asarray (tris).ravel (), return_inverse=True)
+				co = co[used]
+				tris = tris.reshape (-1, 3).tolist ()
+			
+			#Create a collision mesh from the same triangles,
+			#unless hulls stand in for it
+			convex = self.convex (o, co, tris)
+			cmesh = None
+			if convex is None:
+				cmesh = graph.Cmesh ()
+				cmesh.log = self.trace
+				for t in tris:
+					cmesh.add_polygon (t)
+				cg = self.collision_record (co, cmesh)
+				if self.graphs is not None and part is None:
+					self.graphs[o.data] = cmesh
+			else:
+				cg = pack ('<3I', 0, 0, 0)
+			
+			#Hulls leave no graph behind, the navmesh needs one
+			if self.cfg.navmesh and cmesh is None:
+				cmesh = graph.Cmesh ()
+				for t in tris:
+					cmesh.add_polygon (t)
+				cmesh.build ()
+			yield verts, chunk, cg, convex, (cmesh, co)
+	
+	#Stops the export once it uses more memory than the ceiling allows.
+	#Freed memory is not always handed back at once, so collect first
+	def ceiling (self, name):
+		limit = self.cfg.memory_limit<<20
+		if not limit:
+			return
+		used = instrument.rss () or instrument.peak_rss ()
+		if used is None or used <= limit:
+			return
+		gc.collect ()
+		used = instrument.rss () or instrument.peak_rss ()
+		if used > limit:
+			raise RuntimeError ('{0} took the export to {1} MiB, over the {2} MiB ceiling'.format (
+				name, used>>20, self.cfg.memory_limit))
+	
+	#Builds the whole level. Returns the header and the sections with their
+	#tags; the sections that grow with the level are spilled, see spill.py
+	def stream (self):
 		from struct import pack, calcsize
 		scene = self.ctx.scene
 		wm = self.ctx.window_manager
@@ -92,13 +514,41 @@ class Export:
 		nwg = 0
 		pc = 0
 		
+		#A ceiling nothing can measure would silently never trip
+		if self.cfg.memory_limit and instrument.rss () is None and instrument.peak_rss () is None:
+			print ('Warning: memory use cannot be measured on this platform, the {0} MiB ceiling is not enforced'.format (
+				self.cfg.memory_limit))
+		
 		writ = {}
-		bin = bytes ()
-		geo = bytes ()
+		self.welded = weld.Stats ()
+		self.qreport = quant.Report ()
+		geo = spill.Section ()
 		wg = bytes ()
 		ents = bytes ()
+		lods = spill.Section ()
+		hulls = spill.Section ()
 		
-		pref = os.path.splitext (self.cfg.filepath)[0]
+		#Binary entities intern every string, material names included
+		self.strings = None
+		if self.cfg.binary_entities:
+			self.strings = entity.Strings ()
+			table = entity.Table (self.strings)
+		
+		if self.cfg.lods:
+			self.ratios = lod.parse_ratios (self.cfg.lod_ratios)
+		
+		#The navmesh is built from the collision graph of every record
+		#wherever it is placed
+		nav = None
+		if self.cfg.navmesh:
+			nav = navmesh.Builder (self.cfg.nav_slope)
+			navgraphs = []
+		
+		self.meshes = snapshot.Cache (self.ctx)
+		#Where every object and mesh landed, so they can be patched later:
+		#object name -> (world graph record, mesh id), mesh -> geometry record
+		self.objects = {}
+		self.records = {}
 		
 		wm.progress_begin (0, len (scene.objects))
 		for o in scene.objects:
@@ -112,228 +562,198 @@ class Export:
 				continue
 			self.trace (o.name)
 			
-			#Figure out mesh ID
-			if o.data in writ: id = writ[o.data]
-			else: id = nmesh
+			#Figure out mesh ID, and how many records the mesh went out in
+			if o.data in writ: id, count = writ[o.data]
+			else: id, count = nmesh, 1
 			
 			#Handle custom properties
-			if o.get ('_RNA_UI'):
-				self.trace ("Properties:")
-				keys = o.keys ()
-				
-				#Copy all the keys into the entity dictionary
-				edict = {}
-				for k in keys:
-					if '_RNA_UI' == k:
-						continue
-					if 'nowrite' == k:
-						continue
-					edict[k] = o[k]
-					
-				#Add some special keys as well
-				edict['name'] = o.name
-				edict['origin'] = '{0} {1} {2}'.format (o.location[0], o.location[1], o.location[2])
-				#Only used for entities with geometry
-				if not 'nowrite' in keys:
-					edict['mesh'] = id
-				
+			edict = self.properties (o, id)
+			if edict is not None:
 				#Only objects with type properties to the entities list
-				if "type" in edict:
-					ents += bytes ('entity {0}\n'.format (edict['type']).encode ('utf-8'))
+				if "type" in edict and self.cfg.binary_entities:
+					props = {}
 					for k, v in edict.items ():
-						self.trace ("\t{0}: {1}".format (k, v));
 						if 'type' == k:
 							continue
-						ents += bytes ('{0}: {1}\n'.format (k, v).encode ('utf-8'))
+						props[k] = v
+					
+					#No need to spell the origin out as text here
+					props['origin'] = (o.location[0], o.location[1], o.location[2])
+					table.add (str (edict['type']), props)
+				elif "type" in edict:
+					ents += self.entity_text (edict)
 				
 				#Do not write the geomtry
 				#The properties will still be written though
-				if 'nowrite' in keys:
+				if 'nowrite' in o.keys ():
 					continue
 		
-			#Add object to world graph
-			#TODO: structure this into a tree
-			
-			#Blender lets users specify different orders of euler angles. 
-			#To make this sane, just convert the world matrix of the object 
-			#into our own order and convert them into degrees and write
-			#them in yaw-pitch-roll format. NB: Traum is X forward, Z up.
-			def rad2deg (x):
-				import math
-				return -180.0*x/math.pi
-				
-			angles = o.matrix_world.to_euler ('ZYX')
-			yaw = rad2deg (angles[2])
-			pitch = rad2deg (angles[1])
-			roll = rad2deg (angles[0])
-			wg += pack ('<I', id)
-			wg += pack ('<3f', o.location[0], o.location[1], o.location[2])
-			wg += pack ('<3f', yaw, pitch, roll)
-			wg += pack ('<3f', o.scale[0], o.scale[1], o.scale[2]);
-			nwg += 1
-	
-			#Ensure this geometry is unique
-			if o.data in writ:
-				continue
-			
-			#Create a temporary mesh
-			mesh = o.to_mesh ()
-			if not mesh:
-				self.trace ("{0} did not produce a mesh".format (o.name))
-				continue
-			
-			#Ensure mesh has at least one material
-			mat2poly = {}
-			if len (mesh.materials) < 1:
-				self.trace ('{0} has no materials! (using default)'.format (o.name))
-				mat2poly["default"] = []
-				use_default = True
-			else:
-				use_default = False
-
-			#Sort polygons by material to minimise state changes
-			for p in mesh.polygons:
-				#Object has no materials, so drop everything into the default
-				if True == use_default:
-					mat2poly["default"].append (p)
-					continue
-				#Assign polygon to its material bucket
-				#Blender appends the id of each user of a unique material to
-				#its name. This is the only way I know how to get rid around it
-				parts = mesh.materials[p.material_index].name.split ('.')
-				key = parts[0]
-				if key not in mat2poly:
-					mat2poly[key] = []
-				mat2poly[key].append (p)
-				
-
-			#Calculate bounding volume
-			mins = [ math.inf, math.inf, math.inf]
-			maxs = [-math.inf,-math.inf,-math.inf]
-			for i in range (len (o.bound_box)):
-				v = [o.bound_box[i][0], o.bound_box[i][1], o.bound_box[i][2]]
-				for j in range (3):
-					if v[j] < mins[j]: mins[j] = v[j];
-					if v[j] > maxs[j]: maxs[j] = v[j];
-			
-			#Compute extents of AABB
-			extents = [0, 0, 0]
-			for i in range (3):
-				extents[i] = (maxs[i] - mins[i])/2.0
-			
-			#Compute sphere
-			centre = [0, 0, 0]
-			d = [0, 0, 0]
-			for i in range (3):
-				centre[i] = extents[i] + mins[i]
-				d[i] = maxs[i] - centre[i]
-			radius = math.sqrt (d[0]*d[0] + d[1]*d[1] + d[2]*d[2])
-	
-	
-			#Digest the polygons
-			verts = pack ('<I3f3f1f',\
-				len (mat2poly.items ()),\
-				extents[0], extents[1], extents[2],\
-				centre[0], centre[1], centre[2],\
-				radius)
-
-			#Create a collision mesh to fill in below
-			from . import graph
-			cmesh = graph.Cmesh ()
-			
-			#Process the polygons
-			for key, polygons in mat2poly.items ():
-				verts += pack ('<I', len (key))
-				verts += key.encode ('utf-8')
-				verts += pack ('<I', 3*len (polygons))
-			
-				#Pack vertices
-				for p in polygons:
-					#Ensure the geometry has been triangulated
-					if p.loop_total != 3:
-						#Degenerate
-						if p.loop_total < 3:
-							raise RuntimeError ('{0} has degenerate face!'.format (o.name))
-						#More than 3
-						raise RuntimeError ('{0} must have 3 vertices!'.format (o.name))
+			#Write the geometry the first time the mesh is seen
+			if o.data not in writ:
+				#Evaluate the mesh into plain arrays
+				self.prof.begin ('evaluate', object = o.name)
+				mesh = self.meshes.get (o)
+				self.prof.end ()
+				if mesh is None:
+					self.trace ("{0} did not produce a mesh", o.name)
+				else:
+					self.prof.begin ('mesh', object = o.name)
+					count = 0
+					for verts, chunk, cg, convex, navgraph in self.geometry (o, mesh):
+						lods.write (chunk)
+						if self.cfg.hulls:
+							hulls.write (self.hull_record (convex or []))
+						if nav is not None:
+							navgraphs.append (navgraph)
 					
-					#Package everything together
-					points = []
-					for i in range (p.loop_start, p.loop_start + p.loop_total):
-						#Gather the data
-						ndx = mesh.loops[i].vertex_index
-						v = mesh.vertices[ndx].co
-						uv = mesh.uv_layers.active.data[i].uv
-						#Package it all up
-						verts += pack ('<3f2f', v[0], v[1], v[2], uv[0], 1.0 - uv[1])
-						#Collocate points
-						points.append (ndx)
+						#Append all the data to the image
+						geo.write (pack ('<I', len (verts)) + verts)
+						geo.write (pack ('<I', len (cg)) + cg)
+						nmesh += 1
+						count += 1
 					
-					#Add to collision graph
-					cmesh.add_polygon (points)
-			
-			#Process the collision mesh
-			cpolys = cmesh.build ()
-			
-			#Pack up vertices
-			cgv = bytes ()
-			for v in mesh.vertices:
-				cgv += pack ('<3f', v.co[0], v.co[1], v.co[2])
-			nverts = len (mesh.vertices)
-			
-			#Gather indices into a single list and pack up the faces
-			indices = []
-			cgf = bytes ()
-			for p in cpolys:
-				start = len (indices)
-				indices += p.loop
-				
-				cgf += pack ('<2H', start, len (p.loop))
-			ncpolys = len (cpolys);
-			
-			#Pack up the indices
-			cgi = bytes ()
-			for i in indices:
-				cgi += pack ('<H', i)
-			nindices = len (indices)
-			
-			#Put the data all together
-			cg = pack ('<3I', nverts, nindices, ncpolys)
-			cg += cgv + cgi + cgf
-		
-			#Append all the data to the image
-			geo += pack ('<I', len (verts)) + verts
-			geo += pack ('<I', len (cg)) + cg
-			nmesh += 1
-			
-			#Stash index on the data so shared geometry gets written only once
-			writ[o.data] = nmesh
+					#Stash index on the data so shared geometry gets written only once
+					writ[o.data] = (id, count)
+					self.records[o.data] = (id, count)
+					
+					self.prof.end ()
+				self.meshes.release (o)
 			
-			#Done with the mesh data
-			o.to_mesh_clear ()
+			#Add object to world graph, once for every part of its mesh
+			#TODO: structure this into a tree
+			self.objects[o.name] = (nwg, id, count)
+			for k in range (count):
+				wg += self.world_record (o, id + k)
+				#Objects that produced no mesh have no graph either
+				if nav is not None and id + k < len (navgraphs):
+					nav.add (*navgraphs[id + k], o.matrix_world)
+				nwg += 1
 			
+			self.ceiling (o.name)
 			wm.progress_update (nmesh)
 			
 		wm.progress_end ()
+		self.trace (self.meshes.report ())
+		self.prof.count ('evaluations', meshes = self.meshes.evaluations, seconds = self.meshes.seconds)
 		
 		#Add headers for each section
-		geo = pack ('<I', nmesh) + geo
+		self.prof.begin ('sections')
+		geo.prepend (pack ('<I', nmesh))
 		wg = pack ('<I', nwg) + wg
-		ents = pack ('<I', len (ents)) + ents
+		if self.cfg.binary_entities:
+			ents = table.pack ()
+		else:
+			ents = pack ('<I', len (ents)) + ents
+		#Newer layouts are flagged in the header so the engine knows what
+		#to expect from the geometry records
+		flags = 0
+		if self.cfg.weld:
+			flags |= LEVEL_WELDED
+			self.trace (self.welded.report ())
+		if self.cfg.quantize:
+			flags |= LEVEL_QUANTIZED
+			self.trace (self.qreport.report ())
+		if self.cfg.binary_entities:
+			flags |= LEVEL_BINARY_ENTITIES
+		
+		
+		#Optional sections follow the entities in the order of their flags
+		sections = [geo, wg, ents]
+		tags = ['GEOM', 'WRLD', 'ENTS']
+		if self.cfg.lods:
+			flags |= LEVEL_LODS
+			lods.prepend (pack ('<2I', lod.LOD_VERSION, nmesh))
+			sections.append (lods)
+			tags.append ('LODS')
+		if self.cfg.hulls:
+			flags |= LEVEL_HULLS
+			hulls.prepend (pack ('<2I', hull.HULL_VERSION, nmesh))
+			sections.append (hulls)
+			tags.append ('HULL')
+		if nav is not None:
+			flags |= LEVEL_NAVMESH
+			self.prof.begin ('navmesh')
+			sections.append (nav.pack ())
+			self.prof.end ()
+			tags.append ('NAVM')
+			self.trace (nav.report ())
+		
 		#Add the header
-		ofs_verts = calcsize ('<5I')
-		ofs_wg = ofs_verts + len (geo)
-		ofs_ents = ofs_wg + len (wg)
 		MAGICK = 'SW3R'.encode ('utf-8')
-		VERSION = 0x20200526
-		header = MAGICK
-		header += pack ('<4I', VERSION, ofs_verts, ofs_wg, ofs_ents)
-		bin = header + geo + wg + ents
+		if 0 == flags:
+			version = pack ('<I', VERSION)
+		else:
+			version = pack ('<2I', VERSION_FLAGS, flags)
+		ofs = len (MAGICK) + len (version) + calcsize ('<I')*len (sections)
+		header = MAGICK + version
+		for sec in sections:
+			header += pack ('<I', ofs)
+			ofs += len (sec)
+		self.flags = flags
+		self.prof.end ()
+		return header, tags, sections
+	
+	#Builds the whole level in memory, for when it is sent rather than
+	#written
+	def level (self):
+		header, tags, sections = self.stream ()
+		return header, tags, [spill.read (s) for s in sections]
+	
+	#Lays the sections out again for loading in place. Returns the new
+	#header and everything after it as a single section
+	def relayout (self, header, sections):
+		from struct import calcsize
+		self.prof.begin ('relayout')
+		alignment = inplace.PAGE_SIZE if 'PAGE' == self.cfg.layout else inplace.ALIGNMENT
+		names = self.strings.list if self.strings is not None else None
+		data = inplace.relayout (self.flags, sections, alignment, names)
+		packed = len (header) + sum (len (s) for s in sections)
+		self.trace ('Aligned to {0} bytes: {1} -> {2} bytes ({3:+.1f}%)', alignment,
+			packed, len (data), 100*len (data)/max (packed, 1) - 100)
+		self.prof.end ()
+		size = calcsize (inplace.HEADER)
+		return data[0:size], ['ALGN'], [data[size:]]
+	
+	def main (self):
+		pref = os.path.splitext (self.cfg.filepath)[0]
+		self.prof.begin ('export', path = self.cfg.filepath)
+		header, tags, sections = self.stream ()
+		
+		#Packed levels go straight from the spills to disk, the others
+		#need every section in memory to be laid out or compressed
+		codec = container.CODECS[self.cfg.compression]
+		if 'PACKED' != self.cfg.layout or container.STORE != codec:
+			sections = [spill.read (s) for s in sections]
+		if 'PACKED' != self.cfg.layout:
+			header, tags, sections = self.relayout (header, sections)
+		
+		#Optionally wrap the level up in compressed chunks
+		if container.STORE != codec:
+			self.prof.begin ('compress', bytes = len (header) + sum (len (s) for s in sections))
+			bin, stats = container.pack_container (header[0:4], [('HEAD', header)] + list (zip (tags, sections)), codec,
+				measure = self.cfg.profile)
+			self.trace (container.report (stats))
+			self.prof.end ()
+			header, sections = bin, []
 		
 		#Dump everything to disk
+		self.prof.begin ('write', bytes = len (header) + sum (len (s) for s in sections))
 		level_path = bpy.path.ensure_ext (pref, '.level')
 		with open (level_path, 'wb') as f:
-			f.write (bin)
+			f.write (header)
+			for s in sections:
+				spill.copy (s, f)
+		self.written.append (level_path)
+		self.prof.end ()
+		
+		peak = instrument.peak_rss ()
+		if peak is not None:
+			self.trace ('Peak memory: {0} MiB', peak>>20)
+			self.prof.count ('memory', peak_rss_mib = peak>>20)
+		
+		#Keep the profile next to the level
+		self.prof.end ()
+		self.prof.write (pref + '.trace.json')
 		
 		self.feedback ("Done!!!")
 		return 0
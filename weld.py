@@ -0,0 +1,85 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation, either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#  All rights reserved.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+from struct import pack
+import numpy as np
+
+#Size of a single <3f2f vertex in bytes
+VERTEX_SIZE = 20
+
+#Welds corners that share both position and texture coordinate into a single
+#vertex. One welder is used per material bucket, so indices are local to it
+class Welder:
+	def __init__ (self):
+		self.tbl = {}
+		self.verts = []
+		self.indices = []
+
+	def add (self, pos, uv):
+		key = (pos[0], pos[1], pos[2], uv[0], uv[1])
+		ndx = self.tbl.get (key)
+		if ndx is None:
+			ndx = len (self.verts)
+			self.tbl[key] = ndx
+			self.verts.append (key)
+		self.indices.append (ndx)
+		return ndx
+
+	def index_size (self):
+		#Anything that fits is written with 16 bit indices
+		if len (self.verts) <= 0x10000:
+			return 2
+		return 4
+
+	#An encoder may be given to write the vertices in another format
+	def pack (self, encode = None):
+		isize = self.index_size ()
+		head = pack ('<3I', len (self.verts), len (self.indices), isize)
+		if encode is not None:
+			verts = encode (self.verts)
+		else:
+			verts = np.array (self.verts, dtype='<f4').tobytes ()
+		indices = np.array (self.indices, dtype='<u2' if 2 == isize else '<u4').tobytes ()
+		return head + verts + indices
+
+#Keeps a running tally of how much welding saved over a whole level
+class Stats:
+	def __init__ (self):
+		self.raw_verts = 0
+		self.verts = 0
+		self.raw_bytes = 0
+		self.bytes = 0
+
+	def add (self, welder):
+		n = len (welder.indices)
+		self.raw_verts += n
+		self.verts += len (welder.verts)
+		self.raw_bytes += VERTEX_SIZE*n
+		self.bytes += VERTEX_SIZE*len (welder.verts) + welder.index_size ()*n
+
+	def report (self):
+		if 0 == self.raw_verts:
+			return 'Welded: no vertices'
+		lines = []
+		lines.append ('Welded: {0} -> {1} vertices ({2:.1f}% fewer)'.format (
+			self.raw_verts, self.verts,
+			100 - 100*self.verts/self.raw_verts))
+		lines.append ('\tVertex memory: {0} -> {1} bytes ({2:.1f}% smaller)'.format (
+			self.raw_bytes, self.bytes,
+			100 - 100*self.bytes/self.raw_bytes))
+		return '\n'.join (lines)